@@ -1,15 +1,15 @@
 from flask import Flask
 from flask_bootstrap import Bootstrap
-from flask_sqlalchemy import SQLAlchemy
 from config import config
 from flask_login import LoginManager
 from flask_mail import Mail
 from flask_moment import Moment
 from flask_wtf.csrf import CSRFProtect
+from .routing import RoutingSQLAlchemy
 
 # Class instances from imports
 bootstrap = Bootstrap()
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 login_manager = LoginManager()
 mail = Mail()
 moment = Moment()
@@ -22,6 +22,11 @@ def create_app(config_name='default'):
     app = Flask(__name__)
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
+
+    # Registered first so the profile covers the other request hooks too
+    from .profiler import profiler
+    profiler.init_app(app)
+
     login_manager.init_app(app)
     mail.init_app(app)
     csrf.init_app(app)
@@ -31,6 +36,31 @@ def create_app(config_name='default'):
 
     db.init_app(app)
 
+    from .encoding import json_encoding
+    json_encoding.init_app(app)
+
+    # Registered before the other request hooks apart from the profiler's, so it runs after them
+    from .compression import compression
+    compression.init_app(app)
+
+    from .assets import static_manifest
+    static_manifest.init_app(app)
+
+    from .cache import fragment_cache
+    fragment_cache.init_app(app)
+
+    from .last_seen import last_seen_buffer
+    last_seen_buffer.init_app(app)
+
+    from .metrics import metrics
+    metrics.init_app(app)
+
+    from .query_stats import query_stats
+    query_stats.init_app(app)
+
+    from .email import mail_dispatcher
+    mail_dispatcher.init_app(app)
+
     # Registering blueprints
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
@@ -38,9 +68,20 @@ def create_app(config_name='default'):
     from .auth import auth as auth_blueprint
     app.register_blueprint(auth_blueprint)
 
+    from .avatars import avatars as avatars_blueprint
+    from .avatars.identicon import avatar_cache
+    avatar_cache.init_app(app)
+    app.register_blueprint(avatars_blueprint)
+
     from .api import api as api_blueprint
+    # API clients authenticate every request with HTTP Basic auth (a password or a token), never
+    # the session cookie, so a forged cross-site request has no credentials to ride on
+    csrf.exempt(api_blueprint)
     app.register_blueprint(api_blueprint)
 
+    from .api.credentials import credential_cache
+    credential_cache.init_app(app)
+
     # Added security
     if app.config['HTTPS_REDIRECT']:
         from flask_talisman import Talisman
@@ -49,9 +90,8 @@ def create_app(config_name='default'):
                     "'self'",
                     'cdnjs.cloudflare.com',
                 ],
-                # allow images from anywhere,
-                #   including unicornify.pictures
-                'img-src': '*'
+                # avatars are rendered by the app itself, see app/avatars/
+                'img-src': "'self'"
             }
         )
 
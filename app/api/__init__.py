@@ -3,4 +3,4 @@ from app.models import Permission
 
 api = Blueprint('api', __name__, url_prefix='/api/v1')
 
-from . import authentication, compositions, errors, users
\ No newline at end of file
+from . import authentication, compositions, errors, export, users
\ No newline at end of file
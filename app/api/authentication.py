@@ -1,6 +1,9 @@
 from flask_httpauth import HTTPBasicAuth
 from flask import jsonify, g
-from app.models import User
+from app.models import Permission
+from ..profiler import profiler
+from .credentials import credential_cache
+from .decorators import permission_required
 from .errors import unauthorized, forbidden
 from . import api
 
@@ -16,16 +19,14 @@ def verify_password(email_or_token, password):
     """
     if email_or_token == '':
         return False
+    # Verified credentials are cached, see credentials.py
     if password == '':
-        g.current_user = User.verify_auth_token(email_or_token)
+        g.current_user = credential_cache.verify_token(email_or_token)
         g.token_used = True
         return g.current_user is not None
-    user = User.query.filter_by(email=email_or_token).first()
-    if not user:
-        return False
-    g.current_user = user
+    g.current_user = credential_cache.verify_password(email_or_token, password)
     g.token_used = False
-    return user.verify_password(password)
+    return g.current_user is not None
 
 @api.before_request
 @auth.login_required
@@ -35,6 +36,8 @@ def before_request():
     if not g.current_user.is_anonymous and \
         not g.current_user.confirmed:
         return forbidden('Unconfirmed account')
+    # Only now is it known whether the user may profile the request
+    profiler.start()
 
 @auth.error_handler
 def auth_error():
@@ -57,3 +60,11 @@ def get_token():
         return unauthorized('Invalid credentials.')
     return jsonify({'token': g.current_user.generate_auth_token(expiration_sec=3600), 'expiration': 3600})
 
+
+
+@api.route('/credential-cache/')
+@permission_required(Permission.ADMIN)
+def get_credential_cache_stats():
+    """Returns hit and miss counts of this process's credential cache, for administrators
+    """
+    return jsonify(credential_cache.stats())
@@ -1,9 +1,15 @@
-from flask import jsonify, request, url_for, g, current_app
+import json
+from flask import request, url_for, g, current_app
 from . import api
 from .decorators import permission_required
 from .. import db
-from ..models import Composition, Permission
-from .errors import forbidden
+from ..exceptions import ValidationError
+from ..models import Composition, Permission, Timeline
+from .errors import forbidden, bad_request
+from .. import feeds
+from ..encoding import json_encoding
+from .conditional import make_etag, page_etag, not_modified, set_validators
+from .fields import requested_fields, fields_key
 
 @api.route('/compositions/', methods=["POST"])
 @permission_required(Permission.PUBLISH)
@@ -15,12 +21,96 @@ def new_composition():
     """
     # Create composition through the API
     composition = Composition.from_json(request.json)
-    composition.artist = g.current_user
+    composition.artist_id = g.current_user.id
     db.session.add(composition)
     db.session.commit()
+    # Add to followers' timelines, committed along with the slug
+    Timeline.fan_out(composition)
     composition.generate_slug()
-    return jsonify(composition.to_json()), 201, \
-        {'Location': url_for('api.get_composition', id=composition.id)}
+    return json_encoding.response(composition.to_json(), 201,
+                                  {'Location': url_for('api.get_composition', id=composition.id)})
+
+def _bulk_items():
+    """Yields each composition in a bulk import body, which is either a JSON array or
+    newline delimited JSON (Content-Type: application/x-ndjson) read one line at a time.
+    Lines that aren't valid JSON are yielded as None.
+    """
+    if request.mimetype == 'application/x-ndjson':
+        for line in request.stream:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+    else:
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            raise ValidationError('Expected a JSON array or newline delimited JSON.')
+        yield from items
+
+def _import_batch(batch):
+    """Inserts a batch of compositions with their slugs and timeline entries, without committing.
+
+    Args:
+        batch (list): (index, composition) pairs from the request body
+
+    Returns:
+        list: The result for each composition in the batch
+    """
+    compositions = [composition for _, composition in batch]
+    db.session.add_all(compositions)
+    # Assigns IDs, which the slugs are made from
+    db.session.flush()
+    for composition in compositions:
+        composition.slug = Composition.make_slug(composition.id, composition.title)
+    Timeline.fan_out(*compositions)
+    db.session.flush()
+    return [{'index': index,
+             'status': 201,
+             'url': url_for('api.get_composition', id=composition.id),
+             'slug': composition.slug}
+            for index, composition in batch]
+
+@api.route('/compositions/bulk', methods=["POST"])
+@permission_required(Permission.PUBLISH)
+def new_compositions():
+    """Posts many compositions at once, validating each one like new_composition(). Valid
+    compositions are inserted in batches and committed together in one transaction.
+
+    Returns:
+        .json: counts of created and failed compositions, and the status of each one in request order
+    """
+    batch_size = current_app.config['RAGTIME_BULK_BATCH_SIZE']
+    max_items = current_app.config['RAGTIME_BULK_MAX_ITEMS']
+    results = []
+    batch = []
+    for index, item in enumerate(_bulk_items()):
+        if index >= max_items:
+            db.session.rollback()
+            return bad_request(f'At most {max_items} compositions can be imported at once.')
+        try:
+            if not isinstance(item, dict):
+                raise ValidationError('Composition must be a JSON object.')
+            composition = Composition.from_json(item)
+        except ValidationError as e:
+            results.append({'index': index, 'status': 400, 'message': e.args[0]})
+            continue
+        composition.artist_id = g.current_user.id
+        batch.append((index, composition))
+        if len(batch) == batch_size:
+            results.extend(_import_batch(batch))
+            batch = []
+    if batch:
+        results.extend(_import_batch(batch))
+    db.session.commit()
+    results.sort(key=lambda result: result['index'])
+    created = sum(1 for result in results if result['status'] == 201)
+    return json_encoding.response({
+        'created': created,
+        'failed': len(results) - created,
+        'compositions': results
+    })
 
 @api.route('/compositions/<int:id>', methods=["GET"])
 def get_composition(id):
@@ -32,8 +122,15 @@ def get_composition(id):
     Returns:
         .json: json data for the composition
     """
+    fields = requested_fields(Composition.json_fields)
+    # Look up only the version first, so clients that are up to date cost a single narrow query
+    updated_at, = db.session.query(Composition.updated_at).filter_by(id=id).first_or_404()
+    etag = make_etag('composition', id, updated_at, fields_key(fields))
+    cached = not_modified(etag, updated_at)
+    if cached is not None:
+        return cached
     composition = Composition.query.get_or_404(id)
-    return jsonify(composition.to_json())
+    return set_validators(json_encoding.response(composition.to_json(fields)), etag, updated_at)
 
 @api.route('/compositions/<int:id>', methods=['PUT'])
 @permission_required(Permission.PUBLISH)
@@ -49,7 +146,7 @@ def edit_composition(id):
     # Finds the composition with the ID
     composition = Composition.query.get_or_404(id)
     # Only the user can edit their own composition, or must be an administrator
-    if g.current_user != composition.artist and \
+    if g.current_user.id != composition.artist_id and \
             not g.current_user.can(Permission.ADMIN):
         return forbidden('Insufficient permissions')
     import json
@@ -60,29 +157,45 @@ def edit_composition(id):
     composition.description = put_json.get('description', composition.description)
     db.session.add(composition)
     db.session.commit()
-    return jsonify(composition.to_json())
+    return json_encoding.response(composition.to_json())
 
 @api.route('/compositions/')
 def get_compositions():
     """Returns all compositions in API
     """
-    # Paginate the compositions
-    page = request.args.get('page', 1, type=int)
-    pagination = Composition.query.paginate(
-        page,
-        per_page=current_app.config['RAGTIME_COMPS_PER_PAGE'],
-        error_out=False)
+    fields = requested_fields(Composition.json_fields)
+    # Paginate the compositions, newest first
+    pagination = feeds.all_compositions(request.args.get('cursor'),
+                                        count=request.args.get('count', 0, type=int),
+                                        with_artists=False)
+    etag = page_etag(pagination, fields_key(fields))
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
     # Converts to list
     compositions = pagination.items
-    prev = None
-    if pagination.has_prev:
-        prev = url_for('api.get_compositions', page=page-1)
-    next = None
-    if pagination.has_next:
-        next = url_for('api.get_compositions', page=page+1)
-    return jsonify({
-        'compositions': [composition.to_json() for composition in compositions],
-        'prev': prev,
-        'next': next,
-        'count': pagination.total
-    })
\ No newline at end of file
+    return set_validators(json_encoding.list_response(
+        'compositions', compositions, lambda composition: composition.to_json(fields),
+        prev=pagination.prev_url('api.get_compositions', fields=request.args.get('fields')),
+        next=pagination.next_url('api.get_compositions', fields=request.args.get('fields')),
+        count=pagination.total), etag)
+
+@api.route('/compositions/search')
+def search_compositions():
+    """Returns the compositions matching the search terms in ?q=, best matches first
+    """
+    terms = request.args.get('q', '')
+    fields = requested_fields(Composition.json_fields)
+    pagination = feeds.search_compositions(terms, request.args.get('cursor'),
+                                           count=request.args.get('count', 0, type=int),
+                                           with_artists=False)
+    etag = page_etag(pagination, terms, fields_key(fields))
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    compositions = pagination.items
+    return set_validators(json_encoding.list_response(
+        'compositions', compositions, lambda composition: composition.to_json(fields),
+        prev=pagination.prev_url('api.search_compositions', q=terms, fields=request.args.get('fields')),
+        next=pagination.next_url('api.search_compositions', q=terms, fields=request.args.get('fields')),
+        count=pagination.total), etag)
@@ -0,0 +1,65 @@
+import hashlib
+from datetime import timezone
+from flask import request, current_app
+
+# Conditional GET support: API views work out an ETag (and Last-Modified where there is one) before
+# serializing anything, and answer with an empty 304 when the client already has that version.
+
+
+def make_etag(*parts):
+    """Returns a strong ETag for the given version information
+
+    Args:
+        parts: Anything that changes whenever the response body would, e.g. ids and updated_at values
+    """
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def page_etag(pagination, *parts):
+    """Returns an ETag for a page of compositions from the ids and updated_at values of its items
+
+    Args:
+        pagination (class): A page from app.feeds
+        parts: Anything else that goes into the response body, e.g. query arguments
+    """
+    versions = [(c.id, c.updated_at) for c in pagination.items]
+    return make_etag(versions, pagination.next_cursor, pagination.prev_cursor, pagination.total, *parts)
+
+
+def _as_utc(last_modified):
+    # Database timestamps are naive UTC, and HTTP dates have no microseconds
+    return last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+
+
+def not_modified(etag, last_modified=None):
+    """Returns an empty 304 response if the client's cached copy is current, otherwise None.
+    If-None-Match wins over If-Modified-Since when a client sends both, and matches weak ETags
+    too, like those of compressed responses.
+
+    Args:
+        etag (string): ETag of the current version
+        last_modified (datetime, optional): When the resource last changed. Defaults to None.
+    """
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified is not None:
+        fresh = _as_utc(last_modified) <= request.if_modified_since
+    else:
+        fresh = False
+    if not fresh:
+        return None
+    return set_validators(current_app.response_class(status=304), etag, last_modified)
+
+
+def set_validators(response, etag, last_modified=None):
+    """Adds the ETag and Last-Modified headers to a response and returns it
+
+    Args:
+        response (Response): The response to send
+        etag (string): ETag of the current version
+        last_modified (datetime, optional): When the resource last changed. Defaults to None.
+    """
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = _as_utc(last_modified)
+    return response
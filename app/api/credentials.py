@@ -0,0 +1,201 @@
+import hashlib
+import hmac
+import time
+from collections import OrderedDict
+from threading import Lock
+from flask import current_app
+from .. import db
+from ..models import Role, User
+
+
+class CachedUser:
+    """Stands in for the authenticated User when their credentials were found in the cache.
+    Permission checks and the confirmed flag are answered from the cache; anything else
+    loads the real user from the database the first time it is needed.
+    """
+    is_anonymous = False
+    is_authenticated = True
+
+    def __init__(self, id, permissions, confirmed):
+        self.id = id
+        self.permissions = permissions
+        self.confirmed = confirmed
+        self._user = None
+
+    def can(self, perm):
+        return self.permissions & perm == perm
+
+    def _get_current_object(self):
+        if self._user is None:
+            self._user = User.query.get(self.id)
+        return self._user
+
+    def __getattr__(self, name):
+        return getattr(self._get_current_object(), name)
+
+
+class CredentialCache:
+    """Bounded LRU cache of verified API credentials, so repeat requests from the same client skip
+    the signature check or password hash and load only a few columns of the user.
+
+    Entries hold the user's id, permission bits and confirmed flag, and live for at most
+    RAGTIME_CREDENTIAL_CACHE_TTL seconds (never past a token's own expiry). They are dropped as soon
+    as this process sees the user's password, email, role or confirmation change. Other processes
+    don't see those changes, so every hit is checked against the user's current password hash, email,
+    confirmation and role permissions, read with one primary key lookup.
+    """
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # user id -> keys, for invalidation
+        self._keys = {}
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.maxsize = app.config['RAGTIME_CREDENTIAL_CACHE_SIZE']
+        self.ttl = app.config['RAGTIME_CREDENTIAL_CACHE_TTL']
+        self.clear()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[3] <= time.time():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        if _stamp(entry[0]) != entry[4]:
+            # Changed by another process since it was cached
+            with self._lock:
+                if key in self._entries:
+                    self._drop(key)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return CachedUser(*entry[:3])
+
+    def _set(self, key, user, expires_at=None):
+        if self.maxsize <= 0:
+            return
+        expires = time.time() + self.ttl
+        if expires_at is not None:
+            expires = min(expires, expires_at)
+        permissions = user.role.permissions if user.role is not None else None
+        stamp = (user.password_hash, user.email, user.confirmed, permissions)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (user.id, permissions or 0, user.confirmed, expires, stamp)
+            self._keys.setdefault(user.id, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        # Called with the lock held
+        user_id = self._entries.pop(key)[0]
+        keys = self._keys.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys[user_id]
+
+    def verify_token(self, token):
+        """Returns the user for a valid auth token, or None
+
+        Args:
+            token (string): Token from User.generate_auth_token()
+        """
+        key = 'token:' + token
+        user = self._get(key)
+        if user is None:
+            user, expires_at = User.verify_auth_token(token, with_expiry=True)
+            if user is not None:
+                self._set(key, user, expires_at)
+        return user
+
+    def verify_password(self, email, password):
+        """Returns the user if the email and password match, or None
+
+        Args:
+            email (string): The user's email address
+            password (string): The user's password
+        """
+        # Keyed on a keyed hash so plain passwords are never kept in memory
+        digest = hmac.new(current_app.config['SECRET_KEY'].encode('utf-8'),
+                          f'{email}\0{password}'.encode('utf-8'),
+                          hashlib.sha256).hexdigest()
+        key = 'password:' + digest
+        user = self._get(key)
+        if user is None:
+            user = User.query.filter_by(email=email).first()
+            if user is None or not user.verify_password(password):
+                return None
+            self._set(key, user)
+        return user
+
+    def invalidate_user(self, user_id):
+        """Drops every cached credential of a user
+
+        Args:
+            user_id (int): The ID of the user
+        """
+        with self._lock:
+            for key in self._keys.pop(user_id, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+
+    def stats(self):
+        """Returns hit and miss counts since the process started, and the current size
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups else None,
+                    'size': len(self._entries)}
+
+    @staticmethod
+    def on_changed_user(mapper, connection, target):
+        """Drops a user's cached credentials when anything they depend on changes
+        """
+        state = db.inspect(target)
+        for attr in ('password_hash', 'email', 'role', 'role_id', 'confirmed'):
+            if getattr(state.attrs, attr).history.has_changes():
+                credential_cache.invalidate_user(target.id)
+                return
+
+    @staticmethod
+    def on_deleted_user(mapper, connection, target):
+        """Drops a deleted user's cached credentials
+        """
+        credential_cache.invalidate_user(target.id)
+
+    @staticmethod
+    def on_changed_role(mapper, connection, target):
+        """Drops every cached credential when a role's permissions change
+        """
+        credential_cache.clear()
+
+
+def _stamp(user_id):
+    # What a cached entry depends on, as it is in the database now, or None for a deleted user
+    row = db.session.query(User.password_hash, User.email, User.confirmed, Role.permissions) \
+        .outerjoin(Role, Role.id == User.role_id).filter(User.id == user_id).first()
+    return None if row is None else tuple(row)
+
+
+credential_cache = CredentialCache()
+
+db.event.listen(User, 'after_update', CredentialCache.on_changed_user)
+db.event.listen(User, 'after_delete', CredentialCache.on_deleted_user)
+db.event.listen(Role, 'after_update', CredentialCache.on_changed_role)
@@ -0,0 +1,92 @@
+from datetime import datetime, timezone
+from flask import Response, current_app, request, stream_with_context
+from . import api
+from .. import db
+from ..encoding import json_encoding
+from ..models import Composition, User
+from .errors import bad_request
+from .fields import requested_fields
+
+# Bulk exports for sync jobs: every row, one JSON object per line, oldest change first. Rows are
+# read straight from the table in batches through a server-side cursor where the database has
+# them, so memory use doesn't grow with the size of the export.
+
+
+def _since():
+    """Returns the ?since= argument as a naive UTC datetime, or None if there isn't one
+
+    Raises:
+        ValueError: If the argument isn't an ISO 8601 timestamp
+    """
+    since = request.args.get('since')
+    if not since:
+        return None
+    since = datetime.fromisoformat(since)
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return since
+
+
+def _export(table, columns, available):
+    """Streams the rows of a table changed since ?since= as newline delimited JSON, with the
+    fields asked for in ?fields=
+
+    Args:
+        table (Table): The table to export
+        columns (list): The columns to read
+        available (dict): The fields that can be sent for a row, see COMPOSITION_FIELDS
+
+    Returns:
+        Response: The streamed export
+    """
+    fields = requested_fields(available)
+    fields = [(name, value) for name, value in available.items() if fields is None or name in fields]
+    try:
+        since = _since()
+    except ValueError:
+        return bad_request('since must be an ISO 8601 timestamp.')
+    select = db.select(columns).order_by(table.c.updated_at, table.c.id)
+    if since is not None:
+        select = select.where(table.c.updated_at >= since)
+    batch_size = current_app.config['RAGTIME_EXPORT_BATCH_SIZE']
+    dumps = json_encoding.dumps
+
+    def generate():
+        result = db.session.execute(select.execution_options(stream_results=True))
+        try:
+            while True:
+                rows = result.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield ''.join(dumps({name: value(row) for name, value in fields}) + '\n' for row in rows)
+        finally:
+            result.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+# Exports add the id and version of each row to the API's usual fields
+COMPOSITION_FIELDS = {'id': lambda row: row.id, **Composition.json_fields, 'updated_at': lambda row: row.updated_at}
+USER_FIELDS = {'id': lambda row: row.id, **User.json_fields, 'updated_at': lambda row: row.updated_at}
+
+
+@api.route('/export/compositions')
+def export_compositions():
+    """Streams every composition, or those changed since ?since=, as newline delimited JSON
+    """
+    compositions = Composition.__table__
+    return _export(compositions, [compositions.c.id, compositions.c.release_type, compositions.c.title,
+                                  compositions.c.description, compositions.c.description_html,
+                                  compositions.c.timestamp, compositions.c.updated_at,
+                                  compositions.c.artist_id],
+                   COMPOSITION_FIELDS)
+
+
+@api.route('/export/users')
+def export_users():
+    """Streams every user, or those changed since ?since=, as newline delimited JSON
+    """
+    users = User.__table__
+    return _export(users, [users.c.id, users.c.username, users.c.last_seen, users.c.updated_at,
+                           users.c.compositions_count],
+                   USER_FIELDS)
@@ -0,0 +1,33 @@
+from flask import request
+from ..exceptions import ValidationError
+
+# Sparse fieldsets: API GET requests can ask for only some fields of each object with
+# ?fields=title,url. Fields that aren't asked for are never worked out.
+
+
+def requested_fields(available):
+    """Returns the fields named in ?fields=, or None if the client wants all of them
+
+    Args:
+        available (dict): The fields that can be asked for, e.g. Composition.json_fields
+
+    Raises:
+        ValidationError: If a field that doesn't exist is asked for
+    """
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    fields = frozenset(field.strip() for field in fields.split(',') if field.strip())
+    unknown = fields - available.keys()
+    if unknown:
+        raise ValidationError(f'Unknown fields: {", ".join(sorted(unknown))}.')
+    return fields
+
+
+def fields_key(fields):
+    """Returns a stable value for a set of fields, to go into ETags
+
+    Args:
+        fields (frozenset): Fields from requested_fields()
+    """
+    return None if fields is None else sorted(fields)
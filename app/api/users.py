@@ -1,6 +1,10 @@
-from flask import jsonify, url_for, current_app, request
+from flask import request
 from . import api
-from ..models import Composition, User
+from ..models import User, Composition
+from .. import db, feeds
+from ..encoding import json_encoding
+from .conditional import make_etag, page_etag, not_modified, set_validators
+from .fields import requested_fields, fields_key
 
 @api.route('/users/<int:id>')
 def get_user(id):
@@ -12,9 +16,16 @@ def get_user(id):
     Returns:
         .json: data of the user
     """
+    fields = requested_fields(User.json_fields)
+    # Look up only the version first, so clients that are up to date cost a single narrow query
+    updated_at, = db.session.query(User.updated_at).filter_by(id=id).first_or_404()
+    etag = make_etag('user', id, updated_at, fields_key(fields))
+    cached = not_modified(etag, updated_at)
+    if cached is not None:
+        return cached
     # Get the user from the ID provided
     user = User.query.get_or_404(id)
-    return jsonify(user.to_json())
+    return set_validators(json_encoding.response(user.to_json(fields)), etag, updated_at)
 
 @api.route('/users/<int:id>/compositions/', methods=["GET"])
 def get_user_compositions(id):
@@ -26,30 +37,24 @@ def get_user_compositions(id):
     Returns:
         .json: json data of each composition
     """
+    fields = requested_fields(Composition.json_fields)
     # Get the user from the ID provided
     user = User.query.get_or_404(id)
-    page = request.args.get('page', 1, type=int)
-    # Get the user's compositions
-    query = user.compositions
-    # Paginate all compositions
-    pagination = query.order_by(Composition.timestamp.desc()).paginate(
-        page,
-        per_page=current_app.config['RAGTIME_COMPS_PER_PAGE'],
-        error_out=False)
+    # Paginate the user's compositions, newest first
+    pagination = feeds.user_compositions(user, request.args.get('cursor'),
+                                         count=request.args.get('count', 0, type=int),
+                                         with_artists=False)
+    etag = page_etag(pagination, fields_key(fields))
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
     # Convert to list
     compositions = pagination.items
-    prev = None
-    if pagination.has_prev:
-        prev = url_for('api.get_user_compositions', id=id, page=page-1)
-    next = None
-    if pagination.has_next:
-        next = url_for('api.get_user_compositions', id=id, page=page+1)
-    return jsonify({
-        'compositions': [composition.to_json() for composition in compositions],
-        'prev': prev,
-        'next': next,
-        'count': pagination.total
-    })
+    return set_validators(json_encoding.list_response(
+        'compositions', compositions, lambda composition: composition.to_json(fields),
+        prev=pagination.prev_url('api.get_user_compositions', id=id, fields=request.args.get('fields')),
+        next=pagination.next_url('api.get_user_compositions', id=id, fields=request.args.get('fields')),
+        count=pagination.total), etag)
 
 @api.route('/users/<int:id>/followed/', methods=["GET"])
 def get_user_followed(id):
@@ -61,27 +66,21 @@ def get_user_followed(id):
     Returns:
         .json: json data of each composition
     """
+    fields = requested_fields(Composition.json_fields)
     # Get the user from the ID provided
     user = User.query.get_or_404(id)
-    page = request.args.get('page', 1, type=int)
-    # Get all followed
-    query = user.followed_compositions
-    # Paginate all compositions
-    pagination = query.order_by(Composition.timestamp.desc()).paginate(
-        page,
-        per_page=current_app.config['RAGTIME_COMPS_PER_PAGE'],
-        error_out=False)
+    # Paginate the compositions of everyone the user follows, newest first
+    pagination = feeds.followed_compositions(user, request.args.get('cursor'),
+                                             count=request.args.get('count', 0, type=int),
+                                             with_artists=False)
+    etag = page_etag(pagination, fields_key(fields))
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
     # Convert to list
     compositions = pagination.items
-    prev = None
-    if pagination.has_prev:
-        prev = url_for('api.get_user_compositions', id=id, page=page-1)
-    next = None
-    if pagination.has_next:
-        next = url_for('api.get_user_compositions', id=id, page=page+1)
-    return jsonify({
-        'compositions': [composition.to_json() for composition in compositions],
-        'prev': prev,
-        'next': next,
-        'count': pagination.total
-    })
\ No newline at end of file
+    return set_validators(json_encoding.list_response(
+        'compositions', compositions, lambda composition: composition.to_json(fields),
+        prev=pagination.prev_url('api.get_user_followed', id=id, fields=request.args.get('fields')),
+        next=pagination.next_url('api.get_user_followed', id=id, fields=request.args.get('fields')),
+        count=pagination.total), etag)
\ No newline at end of file
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from flask import request
+
+# Fingerprinted copies and the manifest live here, inside the static folder
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+
+
+class StaticManifest:
+    """Fingerprinted static files that browsers can cache forever.
+
+    `flask deploy` copies every static file to dist/, with a hash of its contents in its name,
+    and writes a manifest of the copies. url_for('static', filename=...) then links to the copy,
+    which is sent with a one year, immutable Cache-Control header: a changed file gets a new
+    name, so browsers never have to check whether theirs is current. Without a manifest, static
+    files are linked and cached as usual.
+    """
+    def __init__(self):
+        self.files = {}
+        self.fingerprinted = set()
+        self.max_age = 31536000
+
+    def init_app(self, app):
+        self.max_age = app.config['RAGTIME_STATIC_MAX_AGE']
+        self.load(app.static_folder)
+        app.url_defaults(self.url_defaults)
+        app.after_request(self.cache_headers)
+
+    def load(self, folder):
+        """Reads the manifest written by build(), if there is one
+
+        Args:
+            folder (string): The static folder
+        """
+        try:
+            with open(os.path.join(folder, DIST, MANIFEST)) as f:
+                self.files = json.load(f)
+        except (OSError, ValueError):
+            self.files = {}
+        self.fingerprinted = set(self.files.values())
+
+    def build(self, folder):
+        """Copies every static file to dist/ under a name with a hash of its contents and
+        writes the manifest. Run before compressing the static files, so the copies are
+        compressed too.
+
+        Args:
+            folder (string): The static folder
+
+        Returns:
+            dict: The manifest, file name -> fingerprinted file name, both relative to folder
+        """
+        files = {}
+        dist = os.path.join(folder, DIST)
+        for directory, subdirectories, names in os.walk(folder):
+            if os.path.abspath(directory) == os.path.abspath(folder) and DIST in subdirectories:
+                subdirectories.remove(DIST)
+            for name in names:
+                # Compressed copies are made from the files, see app/compression.py
+                if name.endswith(('.gz', '.br')):
+                    continue
+                path = os.path.join(directory, name)
+                with open(path, 'rb') as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()[:12]
+                filename = os.path.relpath(path, folder).replace(os.sep, '/')
+                stem, extension = os.path.splitext(filename)
+                files[filename] = f'{DIST}/{stem}.{digest}{extension}'
+                target = os.path.join(folder, files[filename])
+                if not os.path.exists(target):
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    shutil.copy2(path, target)
+        os.makedirs(dist, exist_ok=True)
+        tmp = os.path.join(dist, f'{MANIFEST}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(files, f, indent=2, sort_keys=True)
+        os.replace(tmp, os.path.join(dist, MANIFEST))
+        self.files = files
+        self.fingerprinted = set(files.values())
+        return files
+
+    def url_defaults(self, endpoint, values):
+        if endpoint == 'static' and values.get('filename') in self.files:
+            values['filename'] = self.files[values['filename']]
+
+    def cache_headers(self, response):
+        if request.endpoint == 'static' and response.status_code in (200, 304) and \
+                request.view_args.get('filename') in self.fingerprinted:
+            response.cache_control.public = True
+            response.cache_control.max_age = self.max_age
+            response.cache_control.immutable = True
+            response.expires = int(time.time() + self.max_age)
+        return response
+
+
+static_manifest = StaticManifest()
@@ -8,6 +8,7 @@ from .forms import LoginForm, RegistrationForm, ChangeEmail, ChangePassword
 from app.models import User
 from app.email import send_email
 from .. import db
+from ..routing import use_primary
 
 @auth.route('/login', methods=["GET", "POST"])
 def login():
@@ -77,6 +78,7 @@ def register():
     return render_template('auth/register.html', form=form)
 
 @auth.route('/confirm/<token>')
+@use_primary
 @login_required
 def confirm(token):
     """Function to confirm the user's email address.
@@ -0,0 +1,5 @@
+from flask import Blueprint
+
+avatars = Blueprint('avatars', __name__, url_prefix='/avatars')
+
+from . import views
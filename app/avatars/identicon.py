@@ -0,0 +1,124 @@
+import colorsys
+import os
+import struct
+import zlib
+
+# Avatars are only rendered at these sizes, other sizes are served the next size up
+SIZES = (32, 64, 128, 256)
+
+# Changes whenever the images would, so cached copies are told apart
+VERSION = 1
+
+# The pattern is GRID cells square, with half a cell of margin on every side
+GRID = 5
+
+
+def bucket(size):
+    """Returns the size an avatar of the requested size is rendered at
+
+    Args:
+        size (int): Width and height asked for, in pixels
+    """
+    for candidate in SIZES:
+        if size <= candidate:
+            return candidate
+    return SIZES[-1]
+
+
+def _chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def png(rows, palette):
+    """Returns a paletted PNG image
+
+    Args:
+        rows (list): A bytes object of palette indexes for each row of pixels
+        palette (list): (red, green, blue) colors
+    """
+    header = struct.pack('>IIBBBBB', len(rows[0]), len(rows), 8, 3, 0, 0, 0)
+    # Each row starts with its filter type, 0 for none
+    pixels = zlib.compress(b''.join(b'\x00' + row for row in rows), 9)
+    return b''.join([b'\x89PNG\r\n\x1a\n',
+                     _chunk(b'IHDR', header),
+                     _chunk(b'PLTE', bytes(channel for color in palette for channel in color)),
+                     _chunk(b'IDAT', pixels),
+                     _chunk(b'IEND', b'')])
+
+
+def render(avatar_hash, size):
+    """Renders a symmetric identicon for a hash: the same hash always gives the same image.
+
+    Args:
+        avatar_hash (string): A user's avatar_hash, 32 hex digits
+        size (int): Width and height, in pixels
+
+    Returns:
+        bytes: The image as a PNG
+    """
+    digest = bytes.fromhex(avatar_hash)
+    # The first 15 bits pick the cells of the left half and the middle column, which are mirrored
+    bits = int.from_bytes(digest[:2], 'big')
+    columns = (GRID + 1) // 2
+    filled = [[bool(bits >> (row * columns + column) & 1) for column in range(columns)] for row in range(GRID)]
+    filled = [cells + cells[-2::-1] for cells in filled]
+    hue = int.from_bytes(digest[-2:], 'big') / 0xffff
+    color = tuple(round(channel * 255) for channel in colorsys.hls_to_rgb(hue, 0.55, 0.6))
+
+    cell = size / (GRID + 1)
+    margin = cell / 2
+    # Which cell each pixel along a row or column falls in, or None in the margin
+    cells = [int((pixel + 0.5 - margin) // cell) if margin <= pixel + 0.5 < size - margin else None
+             for pixel in range(size)]
+    rows = []
+    for y in range(size):
+        row = cells[y]
+        if row is None or row >= GRID:
+            rows.append(bytes(size))
+            continue
+        rows.append(bytes(1 if x is not None and x < GRID and filled[row][x] else 0 for x in cells))
+    return png(rows, [(240, 240, 240), color])
+
+
+class AvatarCache:
+    """Rendered avatars kept on disk in RAGTIME_AVATAR_DIR, in a folder for each size
+    """
+    def __init__(self):
+        self.directory = None
+
+    def init_app(self, app):
+        self.directory = app.config['RAGTIME_AVATAR_DIR']
+
+    def _path(self, avatar_hash, size):
+        return os.path.join(self.directory, f'v{VERSION}', str(size), f'{avatar_hash}.png')
+
+    def cached(self, avatar_hash, size):
+        """Returns the path of an avatar if it is on disk, or None
+
+        Args:
+            avatar_hash (string): A user's avatar_hash, 32 hex digits
+            size (int): One of SIZES
+        """
+        path = self._path(avatar_hash, size)
+        return path if os.path.exists(path) else None
+
+    def path(self, avatar_hash, size):
+        """Returns the path of an avatar, rendering it first if it isn't on disk yet. Only for hashes
+        that belong to a user, so the cache can't grow past four files per user.
+
+        Args:
+            avatar_hash (string): A user's avatar_hash, 32 hex digits
+            size (int): One of SIZES
+        """
+        path = self._path(avatar_hash, size)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Another worker may be writing the same avatar, readers only ever see whole files
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(render(avatar_hash, size))
+            os.replace(tmp, path)
+        return path
+
+
+avatar_cache = AvatarCache()
@@ -0,0 +1,37 @@
+import re
+from io import BytesIO
+from flask import abort, current_app, request, send_file
+from . import avatars
+from .identicon import VERSION, avatar_cache, bucket, render
+# Imported as a module, as app.models imports this package
+from .. import db, models
+
+# avatar_hash is an MD5 hex digest, see User.email_hash()
+_HASH = re.compile(r'^[0-9a-f]{32}$')
+
+@avatars.route('/<avatar_hash>.png')
+def avatar(avatar_hash):
+    """Serves a user's avatar, rendered from their avatar_hash and cached on disk
+
+    Args:
+        avatar_hash (string): The user's avatar_hash. The size in pixels is given by ?s=
+
+    Returns:
+        image/png: The avatar, at the nearest rendered size at least as big as the one asked for
+    """
+    if not _HASH.match(avatar_hash):
+        abort(404)
+    size = bucket(request.args.get('s', 128, type=int))
+    image = avatar_cache.cached(avatar_hash, size)
+    if image is None:
+        # Only users' avatars are kept on disk, so requests for made up hashes can't fill it
+        if db.session.query(models.User.id).filter_by(avatar_hash=avatar_hash).first() is not None:
+            image = avatar_cache.path(avatar_hash, size)
+        else:
+            image = BytesIO(render(avatar_hash, size))
+    response = send_file(image, mimetype='image/png', add_etags=False,
+                         cache_timeout=current_app.config['RAGTIME_AVATAR_MAX_AGE'])
+    # The image only depends on the hash, the size and the renderer
+    response.set_etag(f'{avatar_hash}-{size}-v{VERSION}')
+    response.cache_control.public = True
+    return response.make_conditional(request)
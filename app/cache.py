@@ -0,0 +1,115 @@
+from collections import OrderedDict
+from threading import Lock
+from flask import current_app
+from markupsafe import Markup
+
+
+class FragmentCache:
+    """In-process LRU cache of rendered composition list items.
+
+    Keys include the composition's updated_at and the artist fields shown in the fragment, so a
+    stale fragment is never served even by a worker that didn't see the change. The SQLAlchemy
+    events in app.models also drop fragments as soon as their rows change, to free the space.
+    """
+    def __init__(self, maxsize=5000):
+        self.maxsize = maxsize
+        self._fragments = OrderedDict()
+        # composition id -> keys, artist id -> composition ids and composition id -> artist id, for
+        # invalidation
+        self._keys = {}
+        self._compositions = {}
+        self._artists = {}
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.maxsize = app.config['RAGTIME_FRAGMENT_CACHE_SIZE']
+        self.clear()
+        app.add_template_global(render_composition)
+
+    def get(self, key):
+        with self._lock:
+            html = self._fragments.get(key)
+            if html is not None:
+                self._fragments.move_to_end(key)
+            return html
+
+    def set(self, key, artist_id, html):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._fragments[key] = html
+            self._keys.setdefault(key[0], set()).add(key)
+            self._compositions.setdefault(artist_id, set()).add(key[0])
+            self._artists[key[0]] = artist_id
+            while len(self._fragments) > self.maxsize:
+                old, _ = self._fragments.popitem(last=False)
+                keys = self._keys.get(old[0])
+                if keys is not None:
+                    keys.discard(old)
+                    if not keys:
+                        self._forget(old[0])
+
+    def _forget(self, composition_id):
+        # Called with the lock held, once a composition has no fragments left
+        self._keys.pop(composition_id, None)
+        artist_id = self._artists.pop(composition_id, None)
+        composition_ids = self._compositions.get(artist_id)
+        if composition_ids is not None:
+            composition_ids.discard(composition_id)
+            if not composition_ids:
+                del self._compositions[artist_id]
+
+    def invalidate_composition(self, composition_id):
+        """Drops every cached fragment of a composition
+
+        Args:
+            composition_id (int): The ID of the composition
+        """
+        with self._lock:
+            for key in self._keys.get(composition_id, ()):
+                self._fragments.pop(key, None)
+            self._forget(composition_id)
+
+    def invalidate_artist(self, artist_id):
+        """Drops every cached fragment of an artist's compositions
+
+        Args:
+            artist_id (int): The ID of the artist
+        """
+        with self._lock:
+            composition_ids = self._compositions.pop(artist_id, ())
+        for composition_id in composition_ids:
+            self.invalidate_composition(composition_id)
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+            self._keys.clear()
+            self._compositions.clear()
+            self._artists.clear()
+
+
+fragment_cache = FragmentCache()
+
+
+def render_composition(composition, is_artist, is_administrator):
+    """Returns the <li> for a composition in a list, rendered from _composition.html or the cache.
+    Anonymous visitors see the same fragment as any other user who isn't the artist or an administrator.
+
+    Args:
+        composition (class): A composition in the database, with its artist loaded
+        is_artist (bool): The viewer created the composition
+        is_administrator (bool): The viewer is an administrator
+    """
+    artist = composition.artist
+    variant = 'artist' if is_artist else 'administrator' if is_administrator else 'viewer'
+    key = (composition.id, composition.updated_at, artist.username, artist.avatar_hash, variant)
+    html = fragment_cache.get(key)
+    if html is None:
+        template = current_app.jinja_env.get_template('_composition.html')
+        html = Markup(template.render(composition=composition,
+                                      artist=artist,
+                                      is_artist=is_artist,
+                                      is_administrator=is_administrator))
+        fragment_cache.set(key, artist.id, html)
+    return html
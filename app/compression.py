@@ -0,0 +1,155 @@
+import gzip
+import mimetypes
+import os
+import zlib
+from flask import current_app, g, request, send_from_directory
+from flask.helpers import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Types worth compressing. Images and fonts are compressed already.
+COMPRESSIBLE = {'text/html', 'text/css', 'text/plain', 'text/xml', 'text/javascript', 'application/javascript',
+                'application/json', 'application/x-ndjson', 'application/xml', 'image/svg+xml'}
+
+# Precompressed copies of static files, by Content-Encoding
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def _encodings():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def _gzip_stream(chunks, level):
+    # Flushing after every chunk sends each one as soon as it is ready, as the uncompressed stream would
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def _brotli_stream(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in chunks:
+        yield compressor.process(chunk) + compressor.flush()
+    yield compressor.finish()
+
+
+class Compression:
+    """Compresses responses with gzip, or brotli when it is installed, if the client accepts it.
+
+    Responses smaller than RAGTIME_COMPRESS_MIN_SIZE are sent as they are, and so are pages with a
+    CSRF token in them: compressing a secret next to text an attacker can put in the page (a search
+    term, a username) lets them guess it from the compressed size (BREACH). Streamed responses are
+    compressed a chunk at a time as they are sent. Static files aren't compressed per request:
+    `flask deploy` writes .gz and .br copies next to them with precompress(), and the static view
+    sends the best copy the client accepts.
+    """
+    def __init__(self):
+        self.min_size = 500
+        self.gzip_level = 6
+        self.brotli_quality = 5
+
+    def init_app(self, app):
+        self.min_size = app.config['RAGTIME_COMPRESS_MIN_SIZE']
+        self.gzip_level = app.config['RAGTIME_GZIP_LEVEL']
+        self.brotli_quality = app.config['RAGTIME_BROTLI_QUALITY']
+        app.after_request(self.compress)
+        app.view_functions['static'] = self.static
+
+    def compress(self, response):
+        if response.mimetype not in COMPRESSIBLE or response.direct_passthrough or \
+                'Content-Encoding' in response.headers or not 200 <= response.status_code < 300 or \
+                response.status_code == 204:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(_encodings())
+        if encoding is None:
+            return response
+        # Set by Flask-WTF when the request rendered a form
+        token = g.get(current_app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token'))
+        if response.is_streamed:
+            if token and response.mimetype == 'text/html':
+                return response
+            chunks = response.iter_encoded()
+            if encoding == 'br':
+                response.response = _brotli_stream(chunks, self.brotli_quality)
+            else:
+                response.response = _gzip_stream(chunks, self.gzip_level)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size or token and token.encode('utf-8') in data:
+                return response
+            if encoding == 'br':
+                response.set_data(brotli.compress(data, quality=self.brotli_quality))
+            else:
+                response.set_data(gzip.compress(data, self.gzip_level, mtime=0))
+        response.headers['Content-Encoding'] = encoding
+        # The compressed body is a different representation, so its ETag can only be weak
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def static(self, filename):
+        """Serves a static file, or its precompressed copy if the client accepts one
+        """
+        folder = current_app.static_folder
+        mimetype = mimetypes.guess_type(filename)[0]
+        if mimetype in COMPRESSIBLE:
+            accepted = request.accept_encodings
+            original = safe_join(folder, filename)
+            for encoding in _encodings():
+                path = original + SUFFIXES[encoding]
+                # Copies older than the file are left over from an earlier deploy
+                if accepted[encoding] and os.path.isfile(path) and os.path.isfile(original) and \
+                        os.path.getmtime(path) >= os.path.getmtime(original):
+                    response = send_from_directory(folder, filename + SUFFIXES[encoding], mimetype=mimetype,
+                                                   cache_timeout=current_app.get_send_file_max_age(filename))
+                    response.headers['Content-Encoding'] = encoding
+                    response.vary.add('Accept-Encoding')
+                    return response
+        response = current_app.send_static_file(filename)
+        if mimetype in COMPRESSIBLE:
+            response.vary.add('Accept-Encoding')
+        return response
+
+    def precompress(self, folder):
+        """Writes a gzip copy, and a brotli one when brotli is installed, of every compressible
+        file in a folder. Copies newer than their file are kept, and copies that wouldn't be
+        smaller aren't written.
+
+        Args:
+            folder (string): The folder, e.g. the app's static folder
+
+        Returns:
+            list: The paths of the copies written
+        """
+        written = []
+        for directory, _, names in os.walk(folder):
+            for name in names:
+                path = os.path.join(directory, name)
+                if name.endswith(tuple(SUFFIXES.values())) or mimetypes.guess_type(name)[0] not in COMPRESSIBLE:
+                    continue
+                with open(path, 'rb') as f:
+                    data = f.read()
+                for encoding in _encodings():
+                    target = path + SUFFIXES[encoding]
+                    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                        continue
+                    if encoding == 'br':
+                        compressed = brotli.compress(data, quality=11)
+                    else:
+                        compressed = gzip.compress(data, 9, mtime=0)
+                    if len(compressed) >= len(data):
+                        continue
+                    with open(target, 'wb') as f:
+                        f.write(compressed)
+                    written.append(target)
+        return written
+
+
+compression = Compression()
@@ -0,0 +1,103 @@
+import hashlib
+import os
+from multiprocessing import Pool
+import bleach
+from . import db
+
+# Composition descriptions are stored as typed and as sanitized HTML. The HTML is only rendered
+# when the text actually changes: description_hash records what the stored HTML was rendered
+# from, including the sanitizer version, so bump SANITIZER_VERSION whenever the rules below change
+# and run `flask render-descriptions` to bring every row up to date.
+
+ALLOWED_TAGS = ['a']
+SANITIZER_VERSION = 1
+
+
+def description_hash(text):
+    """Returns the hash of a description as rendered by the current sanitizer
+
+    Args:
+        text (string): The description as typed
+    """
+    if text is None:
+        return None
+    return hashlib.sha1(f'{SANITIZER_VERSION}\0{text}'.encode('utf-8')).hexdigest()
+
+
+def render(text):
+    """Returns the sanitized HTML for a description, with links made clickable
+
+    Args:
+        text (string): The description as typed
+    """
+    if text is None:
+        return None
+    return bleach.linkify(bleach.clean(text, tags=ALLOWED_TAGS, strip=True))
+
+
+def _render_rows(rows):
+    # Runs in the worker processes, so it only ever sees plain tuples
+    updates = []
+    for id, text, current in rows:
+        digest = description_hash(text)
+        if digest != current:
+            updates.append({'composition_id': id, 'html': render(text), 'digest': digest})
+    return updates
+
+
+def render_all(processes=None, chunk_size=1000):
+    """Re-renders every description whose HTML is out of date, across a pool of processes.
+
+    Rows are read in id order a chunk at a time, rendered by the pool, and written back with one
+    batched UPDATE per chunk, so memory use stays flat however many compositions there are and
+    an interrupted run picks up where it left off.
+
+    Args:
+        processes (int, optional): Worker processes. Defaults to the number of CPUs, 1 renders in
+        this process.
+        chunk_size (int, optional): Compositions read, rendered and written at a time. Defaults to 1000.
+
+    Returns:
+        int: The number of descriptions rendered
+    """
+    from .models import Composition
+    compositions = Composition.__table__
+    processes = processes or os.cpu_count() or 1
+    update = compositions.update() \
+        .where(compositions.c.id == db.bindparam('composition_id')) \
+        .values(description_html=db.bindparam('html'), description_hash=db.bindparam('digest'))
+
+    def chunks(after):
+        # Read enough chunks to keep every process busy
+        batch = []
+        for i in range(processes):
+            rows = db.session.execute(
+                db.select([compositions.c.id, compositions.c.description, compositions.c.description_hash])
+                .where(compositions.c.id > after)
+                .order_by(compositions.c.id)
+                .limit(chunk_size)).fetchall()
+            if not rows:
+                break
+            batch.append([tuple(row) for row in rows])
+            after = rows[-1][0]
+        return batch, after
+
+    pool = Pool(processes) if processes > 1 else None
+    rendered = 0
+    last_id = 0
+    try:
+        while True:
+            batch, last_id = chunks(last_id)
+            if not batch:
+                break
+            results = pool.map(_render_rows, batch) if pool else map(_render_rows, batch)
+            for updates in results:
+                if updates:
+                    db.session.execute(update, updates)
+                    rendered += len(updates)
+            db.session.commit()
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return rendered
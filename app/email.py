@@ -1,20 +1,309 @@
+import heapq
+import json
+import os
+import time
+import uuid
+import atexit
+from queue import Queue, Empty, Full
+from threading import Lock, Thread
 from flask import current_app, render_template
 from flask_mail import Message
 from . import mail
-from threading import Thread
 
-def send_async_email(app, msg):
-    """Sends asynchronous email notifications via Python.
 
-    Args:
-        app (class - Flask app): The application you are using
-        msg (string): The email you are sending
+class MailDispatcher:
+    """Bounded pool of mail workers with a durable outbox.
+
+    Every message is written to the RAGTIME_MAIL_OUTBOX directory before it is queued, and only
+    removed once the SMTP server has accepted it, so queued mail survives a restart. A process claims
+    a message by moving it into its own processing/<pid>/ directory, and keeps it there until it has
+    been sent, given up on or handed back, so no two processes ever send the same message. A fixed
+    number of worker threads take messages off a bounded queue and send up to RAGTIME_MAIL_BATCH_SIZE
+    of them over each SMTP connection. Failed messages are retried with backoff by the same workers,
+    and moved to the outbox's failed/ directory after RAGTIME_MAIL_RETRIES attempts. When the queue
+    is full, messages wait unclaimed in the outbox until a worker has time to pick them up.
+
+    The workers start with the app, and each gunicorn worker process starts its own after the fork
+    (see gunicorn.conf.py), so mail left over from before a restart goes out straight away.
     """
-    with app.app_context():
-        mail.send(msg)
+    def __init__(self):
+        self.app = None
+        self.queue = None
+        self._lock = Lock()
+        self._pid = None
+        self._threads = []
+        # (time due, path) of messages waiting for a retry
+        self._retries = []
+        self._recovered_at = 0
+
+    def init_app(self, app):
+        if self.app is None:
+            atexit.register(self.stop)
+        else:
+            self.stop()
+        self.app = app
+        self.outbox = app.config['RAGTIME_MAIL_OUTBOX']
+        self.workers = app.config['RAGTIME_MAIL_WORKERS']
+        self.batch_size = app.config['RAGTIME_MAIL_BATCH_SIZE']
+        self.retries = app.config['RAGTIME_MAIL_RETRIES']
+        self.queue = Queue(maxsize=app.config['RAGTIME_MAIL_QUEUE_SIZE'])
+        self._pid = None
+        self._threads = []
+        self._retries = []
+        os.makedirs(os.path.join(self.outbox, 'failed'), exist_ok=True)
+        os.makedirs(os.path.join(self.outbox, 'processing'), exist_ok=True)
+        self.start()
+
+    def _claimed(self, pid=None):
+        # Messages a process is handling
+        return os.path.join(self.outbox, 'processing', str(pid or os.getpid()))
+
+    def submit(self, msg):
+        """Saves a message to the outbox, already claimed by this process, and queues it for sending
+
+        Args:
+            msg (class - Message): The email to send
+        """
+        path = self._save(msg, attempts=0, directory=self._claimed())
+        if self.workers <= 0:
+            # No workers, e.g. in tests: send before returning
+            self._send_batch([path])
+            return
+        self.start()
+        self._enqueue(path)
+
+    def _enqueue(self, path):
+        try:
+            self.queue.put_nowait(path)
+            return True
+        except Full:
+            # Waits in the outbox until a worker has time for it
+            self._release(path)
+            return False
+
+    def _claim(self, name, directory):
+        # Renaming is atomic, so exactly one process gets each message
+        path = os.path.join(self._claimed(), name)
+        try:
+            os.rename(os.path.join(directory, name), path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def _release(self, path):
+        try:
+            os.rename(path, os.path.join(self.outbox, os.path.basename(path)))
+        except FileNotFoundError:
+            pass
+
+    def start(self):
+        """Starts this process's workers, which first queue the mail left in the outbox. Threads
+        don't survive a fork, so each worker process calls this again after forking.
+        """
+        if self.workers <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._retries = []
+            self._threads = [Thread(target=self._work, name=f'mail-worker-{i}', daemon=True)
+                             for i in range(self.workers)]
+            for thread in self._threads:
+                thread.start()
+        # Mail left over from before a restart
+        self._recover(adopt=True)
+
+    def _recover(self, adopt=False):
+        """Claims and queues the messages in the outbox, and hands back those claimed by processes
+        that have exited
+
+        Args:
+            adopt (bool, optional): Also queue messages already claimed under this process's pid,
+                which a process that exited left behind. Only safe before this process has claimed
+                anything, as claimed messages waiting to be retried are there too. Defaults to False.
+        """
+        self._recovered_at = time.time()
+        own = self._claimed()
+        os.makedirs(own, exist_ok=True)
+        processing = os.path.join(self.outbox, 'processing')
+        for pid in os.listdir(processing):
+            directory = os.path.join(processing, pid)
+            if directory != own and pid.isdigit() and not _alive(int(pid)):
+                for name in os.listdir(directory):
+                    if name.endswith('.json'):
+                        self._release(os.path.join(directory, name))
+        if adopt:
+            for name in sorted(os.listdir(own)):
+                if name.endswith('.json') and not self._enqueue(os.path.join(own, name)):
+                    return
+        for name in sorted(os.listdir(self.outbox)):
+            if name.endswith('.json'):
+                path = self._claim(name, self.outbox)
+                if path is not None and not self._enqueue(path):
+                    return
+
+    def _queue_retries(self):
+        """Queues the messages whose retry is due
+
+        Returns:
+            float: Seconds until the next retry is due, or None if none are waiting
+        """
+        now = time.time()
+        due = []
+        with self._lock:
+            while self._retries and self._retries[0][0] <= now:
+                due.append(heapq.heappop(self._retries)[1])
+            wait = self._retries[0][0] - now if self._retries else None
+        for path in due:
+            self._enqueue(path)
+        return wait
+
+    def _work(self):
+        while True:
+            wait = self._queue_retries()
+            try:
+                path = self.queue.get(timeout=30 if wait is None else min(wait, 30))
+            except Empty:
+                if time.time() - self._recovered_at >= 30:
+                    self._recover()
+                continue
+            if path is None:
+                return
+            batch = [path]
+            # Send whatever else is waiting over the same connection
+            while len(batch) < self.batch_size:
+                try:
+                    path = self.queue.get_nowait()
+                except Empty:
+                    break
+                if path is None:
+                    # Let the worker that should stop see it
+                    self.queue.put(None)
+                    break
+                batch.append(path)
+            try:
+                self._send_batch(batch)
+            except Exception:
+                self.app.logger.exception('Mail worker failed')
+
+    def _send_batch(self, paths):
+        """Sends claimed messages over one SMTP connection, scheduling a retry for any that fail
+        """
+        with self.app.app_context():
+            try:
+                with mail.connect() as connection:
+                    for i, path in enumerate(paths):
+                        data = self._load(path)
+                        if data is None:
+                            continue
+                        try:
+                            connection.send(self._message(data))
+                        except Exception:
+                            self._retry(path, data)
+                            # The connection may be unusable, so retry the rest on a new one
+                            for rest in paths[i + 1:]:
+                                self._retry(rest, self._load(rest), failed=False)
+                            return
+                        os.remove(path)
+            except Exception:
+                # Couldn't connect or log in
+                self.app.logger.exception('Could not connect to the mail server')
+                for path in paths:
+                    self._retry(path, self._load(path))
+
+    def _retry(self, path, data, failed=True):
+        if data is None:
+            return
+        if failed:
+            data['attempts'] += 1
+        if data['attempts'] >= self.retries:
+            os.replace(path, os.path.join(self.outbox, 'failed', os.path.basename(path)))
+            self.app.logger.error(f"Giving up on mail to {data['recipients']}")
+            return
+        self._write(path, data)
+        if self.workers <= 0:
+            # Nothing here will retry it, so leave it for whichever process recovers the outbox
+            self._release(path)
+            return
+        # Back off before trying again, without holding up the worker. The message stays claimed.
+        with self._lock:
+            heapq.heappush(self._retries, (time.time() + 2 ** data['attempts'], path))
+
+    def _save(self, msg, attempts, directory=None):
+        data = {'subject': msg.subject,
+                'recipients': msg.recipients,
+                'sender': msg.sender,
+                'body': msg.body,
+                'html': msg.html,
+                'attempts': attempts}
+        # Named so the outbox sorts oldest first
+        directory = directory or self.outbox
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{time.time():.6f}-{uuid.uuid4().hex}.json')
+        self._write(path, data)
+        return path
+
+    def _write(self, path, data):
+        # Write and rename so a crash never leaves half a message in the outbox
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def _load(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _message(self, data):
+        return Message(subject=data['subject'],
+                       recipients=data['recipients'],
+                       sender=data['sender'],
+                       body=data['body'],
+                       html=data['html'])
+
+    def stop(self):
+        """Waits briefly for queued mail to go out, then stops the workers. Anything left stays in
+        the outbox for next time.
+        """
+        if self.queue is None or self._pid != os.getpid():
+            return
+        deadline = time.time() + 5
+        while not self.queue.empty() and time.time() < deadline:
+            time.sleep(0.1)
+        for thread in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join(max(deadline - time.time(), 0.1))
+        self._threads = []
+        self._pid = None
+        self._retries = []
+        # Hand back what this process had claimed, e.g. mail waiting to be retried
+        own = self._claimed()
+        if os.path.isdir(own):
+            for name in os.listdir(own):
+                if name.endswith('.json'):
+                    self._release(os.path.join(own, name))
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+mail_dispatcher = MailDispatcher()
+
 
 def send_email(to, subject, template, **kwargs):
-    """Sends email notifications to the user/recipient
+    """Sends email notifications to the user/recipient through the mail workers
 
     Args:
         to (class): The specified user in the database
@@ -31,5 +320,4 @@ def send_email(to, subject, template, **kwargs):
 
     msg.body = render_template(template + '.txt', **kwargs)
     msg.html = render_template(template + '.html', **kwargs)
-    thread = Thread(target=send_async_email, args=[app, msg])
-    thread.start()
\ No newline at end of file
+    mail_dispatcher.submit(msg)
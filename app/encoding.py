@@ -0,0 +1,139 @@
+import importlib
+import json
+from datetime import date, datetime, timezone
+from flask import current_app, stream_with_context
+from flask.json import JSONEncoder as FlaskJSONEncoder
+
+
+def isoformat(value):
+    """Returns a datetime as an ISO 8601 string in UTC, e.g. 2021-06-01T12:30:00.250000Z.
+    Database timestamps are naive UTC.
+
+    Args:
+        value (datetime): The time to format
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat() + 'Z'
+
+
+class JSONEncoder(FlaskJSONEncoder):
+    """Flask's encoder, writing datetimes as ISO 8601 rather than HTTP dates
+    """
+    def default(self, o):
+        if isinstance(o, datetime):
+            return isoformat(o)
+        if isinstance(o, date):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _default(o):
+    # For encoders that only know the basic types
+    if isinstance(o, datetime):
+        return isoformat(o)
+    if isinstance(o, date):
+        return o.isoformat()
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+def _orjson(module, sort_keys):
+    # Datetimes go through _default like the other libraries', since orjson's own format keeps
+    # the offset of aware datetimes rather than converting them to UTC
+    options = module.OPT_PASSTHROUGH_DATETIME | module.OPT_PASSTHROUGH_SUBCLASS
+    if sort_keys:
+        options |= module.OPT_SORT_KEYS
+    return lambda obj: module.dumps(obj, default=_default, option=options).decode('utf-8')
+
+
+def _ujson(module, sort_keys):
+    return lambda obj: module.dumps(obj, default=_default, sort_keys=sort_keys, ensure_ascii=False,
+                                    escape_forward_slashes=False)
+
+
+def _stdlib(module, sort_keys):
+    return lambda obj: module.dumps(obj, cls=JSONEncoder, sort_keys=sort_keys, separators=(',', ':'))
+
+
+_LIBRARIES = {'orjson': _orjson, 'ujson': _ujson, 'json': _stdlib}
+
+
+class JSONEncoding:
+    """Encodes API responses with the fastest JSON library available.
+
+    RAGTIME_JSON_LIBRARY picks 'orjson', 'ujson' or the standard library's 'json'. When the library
+    isn't installed, or is too old to encode datetimes, the standard library is used instead. Every
+    library writes the same JSON, with datetimes in ISO 8601, which jsonify() and the templates'
+    tojson filter use too.
+    """
+    def __init__(self):
+        self.library = 'json'
+        self.chunk_size = 500
+        self._dumps = _stdlib(json, True)
+
+    def init_app(self, app):
+        app.json_encoder = JSONEncoder
+        self.chunk_size = app.config['RAGTIME_JSON_CHUNK_SIZE']
+        sort_keys = app.config['JSON_SORT_KEYS']
+        self.library, self._dumps = 'json', _stdlib(json, sort_keys)
+        library = app.config['RAGTIME_JSON_LIBRARY']
+        if library in _LIBRARIES and library != 'json':
+            try:
+                dumps = _LIBRARIES[library](importlib.import_module(library), sort_keys)
+                dumps({'check': datetime.utcnow()})
+            except (ImportError, AttributeError, TypeError):
+                app.logger.info('%s is not available, encoding JSON with the standard library', library)
+            else:
+                self.library, self._dumps = library, dumps
+
+    def dumps(self, obj):
+        """Returns obj encoded as JSON
+
+        Args:
+            obj: Anything made of dicts, lists, strings, numbers, None and datetimes
+        """
+        return self._dumps(obj)
+
+    def response(self, data, status=200, headers=None):
+        """Returns data as a JSON response, like jsonify() but faster
+
+        Args:
+            data (dict): The response body
+            status (int, optional): The status code. Defaults to 200.
+            headers (dict, optional): Extra headers. Defaults to None.
+        """
+        return current_app.response_class(self.dumps(data) + '\n', status=status, headers=headers,
+                                          mimetype=current_app.config['JSONIFY_MIMETYPE'])
+
+    def list_response(self, key, items, serialize, **data):
+        """Returns a JSON object holding a list of items and other values. Lists longer than
+        RAGTIME_JSON_CHUNK_SIZE are streamed a chunk of items at a time, so the whole body is
+        never one string in memory.
+
+        Args:
+            key (string): The name of the list, e.g. 'compositions'
+            items (list): The items to send
+            serialize (function): Turns an item into a dict, e.g. lambda c: c.to_json(fields)
+            data: The other values in the object, e.g. next and prev links
+        """
+        if len(items) <= self.chunk_size:
+            data[key] = [serialize(item) for item in items]
+            return self.response(data)
+        dumps, chunk_size = self._dumps, self.chunk_size
+
+        def generate():
+            yield f'{{{dumps(key)}:['
+            for start in range(0, len(items), chunk_size):
+                # An encoded list without its brackets is its items separated by commas
+                chunk = dumps([serialize(item) for item in items[start:start + chunk_size]])[1:-1]
+                yield f',{chunk}' if start else chunk
+            rest = dumps(data)[1:]
+            yield f'],{rest}\n' if data else ']}\n'
+
+        return current_app.response_class(stream_with_context(generate()),
+                                          mimetype=current_app.config['JSONIFY_MIMETYPE'])
+
+
+json_encoding = JSONEncoding()
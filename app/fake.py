@@ -1,51 +1,237 @@
-from sqlalchemy.exc import IntegrityError
-from fake import Faker
-from app import db
-from app.models import User, Composition
-
-from random import randint
+import hashlib
 import string
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+from random import Random
+from faker import Faker
+from werkzeug.security import generate_password_hash
+from app import db, descriptions, search
+from app.models import Composition, ReleaseType, Role, Timeline, User
+
+# Fake data for development and load testing.
+#
+# Rows are generated a chunk at a time by a pool of processes and written with one batched Core
+# insert per table per chunk, with ids assigned up front so slugs and follows can be built without
+# reading anything back. Every chunk seeds its own generators from the seed and its first id, so
+# the same seed on the same database always produces the same users, follows and compositions.
+# Timelines, stored counts and the search index are rebuilt once everything is in.
+
+# Every user id, for picking follow targets and artists in the worker processes
+_user_ids = []
+
+
+def _init_worker(user_ids):
+    global _user_ids
+    _user_ids = user_ids
+
+
+def _generators(seed, kind, first_id):
+    key = f'{seed}:{kind}:{first_id}'
+    fake = Faker()
+    fake.seed_instance(key)
+    return fake, Random(key)
+
+
+def _ago(rng, now, days=730):
+    return now - timedelta(seconds=rng.randrange(days * 24 * 60 * 60))
+
+
+def _skewed(rng, exponent):
+    # Picks a user with a power-law bias towards the start of the list: the higher the
+    # exponent, the more a few users get picked
+    return _user_ids[int(len(_user_ids) * rng.random() ** exponent)]
+
+
+def _user_rows(task):
+    seed, first_id, count, password_hash, role_id, now = task
+    fake, rng = _generators(seed, 'users', first_id)
+    users, follows = [], []
+    for id in range(first_id, first_id + count):
+        # The id keeps usernames and emails unique however many users there are
+        username = f'{fake.user_name()[:40]}{id}'
+        email = f'user{id}@{fake.free_email_domain()}'
+        joined = _ago(rng, now)
+        users.append({'id': id,
+                      'username': username,
+                      'email': email,
+                      'password_hash': password_hash,
+                      'role_id': role_id,
+                      'confirmed': True,
+                      'name': fake.name(),
+                      'location': fake.city(),
+                      'bio': fake.text(),
+                      'last_seen': joined,
+                      'updated_at': joined,
+                      'avatar_hash': hashlib.md5(email.lower().encode('utf-8')).hexdigest(),
+                      'followers_count': 0,
+                      'following_count': 0,
+                      'compositions_count': 0})
+        # Every user follows themselves, see User.__init__()
+        follows.append({'follower_id': id, 'following_id': id, 'timestamp': joined})
+    return [('users', users), ('follows', follows)]
+
+
+def _follow_rows(task):
+    seed, first_id, follower_ids, per_user, now = task
+    rng = Random(f'{seed}:follows:{first_id}')
+    # Cap how many anyone follows, so small databases don't loop looking for users to follow
+    most = min(len(_user_ids) // 2, 5000)
+    follows = []
+    for follower_id in follower_ids:
+        # Most users follow a few others and a few follow a great many (Pareto, mean per_user)...
+        wanted = min(most, int(rng.paretovariate(1.5) * per_user / 3))
+        following = set()
+        for _ in range(wanted * 20):
+            if len(following) >= wanted:
+                break
+            # ...and most follows go to a few popular users
+            following_id = _skewed(rng, 3)
+            if following_id != follower_id:
+                following.add(following_id)
+        follows.extend({'follower_id': follower_id, 'following_id': following_id, 'timestamp': _ago(rng, now)}
+                       for following_id in sorted(following))
+    return [('follows', follows)]
+
+
+def _composition_rows(task):
+    seed, first_id, count, now = task
+    fake, rng = _generators(seed, 'compositions', first_id)
+    compositions = []
+    for id in range(first_id, first_id + count):
+        title = string.capwords(fake.bs())
+        description = fake.text()
+        timestamp = _ago(rng, now)
+        compositions.append({'id': id,
+                             'release_type': rng.randint(ReleaseType.SINGLE, ReleaseType.ALBUM),
+                             'title': title,
+                             'description': description,
+                             'description_html': descriptions.render(description),
+                             'description_hash': descriptions.description_hash(description),
+                             'timestamp': timestamp,
+                             'updated_at': timestamp,
+                             'artist_id': _skewed(rng, 2),
+                             'slug': Composition.make_slug(id, title)})
+    return [('compositions', compositions)]
+
+
+def _insert(generate, tasks, processes, user_ids=()):
+    """Generates rows across a pool of processes and inserts them a chunk at a time, in order
+    """
+    pool = None
+    if processes > 1:
+        pool = Pool(processes, initializer=_init_worker, initargs=(list(user_ids),))
+        results = pool.imap(generate, tasks)
+    else:
+        _init_worker(list(user_ids))
+        results = map(generate, tasks)
+    try:
+        for chunk in results:
+            for table, rows in chunk:
+                if rows:
+                    db.session.execute(db.metadata.tables[table].insert(), rows)
+            db.session.commit()
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
 
-def users(count=20):
+
+def _next_id(model):
+    return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+
+def _sync_sequence(table):
+    # Rows were inserted with their ids, so Postgres' id sequence has to catch up
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(db.text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                                   f"(SELECT max(id) FROM {table}))"))
+        db.session.commit()
+
+
+def _chunks(first_id, count, batch_size):
+    for start in range(first_id, first_id + count, batch_size):
+        yield start, min(batch_size, first_id + count - start)
+
+
+def _add_users(count, follows, seed, processes, batch_size):
+    role = Role.query.filter_by(default=True).first()
+    if role is None:
+        Role.insert_roles()
+        role = Role.query.filter_by(default=True).first()
+    # Hashing is deliberately slow, so every fake user shares the same password
+    password_hash = generate_password_hash('password')
+    now = datetime.utcnow()
+    first_id = _next_id(User)
+    _insert(_user_rows,
+            ((seed, start, size, password_hash, role.id, now)
+             for start, size in _chunks(first_id, count, batch_size)),
+            processes)
+    _sync_sequence('users')
+    if follows:
+        user_ids = [id for id, in db.session.query(User.id).order_by(User.id)]
+        new_ids = list(range(first_id, first_id + count))
+        _insert(_follow_rows,
+                ((seed, start, new_ids[start - first_id:start - first_id + size], follows, now)
+                 for start, size in _chunks(first_id, count, batch_size)),
+                processes, user_ids)
+
+
+def _add_compositions(count, seed, processes, batch_size):
+    user_ids = [id for id, in db.session.query(User.id).order_by(User.id)]
+    if not user_ids:
+        return
+    now = datetime.utcnow()
+    _insert(_composition_rows,
+            ((seed, start, size, now) for start, size in _chunks(_next_id(Composition), count, batch_size)),
+            processes, user_ids)
+    _sync_sequence('compositions')
+
+
+def _finish():
+    # The inserts bypass the ORM, so bring everything derived from them up to date in one go
+    Timeline.rebuild()
+    User.reconcile_counters()
+    search.reindex()
+
+
+def users(count=20, follows=0, seed=0, processes=1, batch_size=1000):
     """Creates fake users to use and manipulate in development
 
     Args:
         count (int, optional): The count/number you want to create. Defaults to 20.
+        follows (int, optional): How many users each new user follows on average. Defaults to 0.
+        seed (int, optional): The same seed creates the same users. Defaults to 0.
+        processes (int, optional): Processes generating users. Defaults to 1.
+        batch_size (int, optional): Users generated and inserted at a time. Defaults to 1000.
     """
-    fake = Faker()
-    i = 0
-    while i < count:
-        u = User(email=fake.email(),
-            username=fake.user_name(),
-            password='password',
-            confirmed=True,
-            name=fake.name(),
-            location=fake.city(),
-            bio=fake.text(),
-            last_seen=fake.past_date())
-        db.session.add(u)
-        try:
-            db.session.commit()
-            i += 1
-        except IntegrityError:
-                db.session.rollback()
+    _add_users(count, follows, seed, processes, batch_size)
+    _finish()
+
 
-def compositions(count=100):
-    """Creates fake compositions to use and manipulate in development
+def compositions(count=100, seed=0, processes=1, batch_size=1000):
+    """Creates fake compositions by existing users to use and manipulate in development
 
     Args:
         count (int, optional): The count/number you want to create. Defaults to 100.
+        seed (int, optional): The same seed creates the same compositions. Defaults to 0.
+        processes (int, optional): Processes generating compositions. Defaults to 1.
+        batch_size (int, optional): Compositions generated and inserted at a time. Defaults to 1000.
     """
-    fake = Faker()
-    user_count = User.query.count()
-    for i in range(count):
-        u = User.query.offset(randint(0, user_count - 1)).first()
-        c = Composition(release_type=randint(0,2),
-                        title=string.capwords(fake.bs()),
-                        description=fake.text(),
-                        timestamp=fake.past_date(),
-                        artist=u)
-        db.session.add(c)
-    db.session.commit()
-    for c in Composition.query.all():
-        c.generate_slug()
\ No newline at end of file
+    _add_compositions(count, seed, processes, batch_size)
+    _finish()
+
+
+def seed(users=1000, follows=20, compositions=5000, seed=0, processes=1, batch_size=1000):
+    """Fills the database with fake users, follows and compositions, e.g. for load testing
+
+    Args:
+        users (int, optional): Users to create. Defaults to 1000.
+        follows (int, optional): How many users each new user follows on average. Defaults to 20.
+        compositions (int, optional): Compositions to create. Defaults to 5000.
+        seed (int, optional): The same seed creates the same data. Defaults to 0.
+        processes (int, optional): Processes generating rows. Defaults to 1.
+        batch_size (int, optional): Rows generated and inserted at a time. Defaults to 1000.
+    """
+    _add_users(users, follows, seed, processes, batch_size)
+    _add_compositions(compositions, seed, processes, batch_size)
+    _finish()
@@ -0,0 +1,84 @@
+from flask import current_app
+from . import db, search
+from .models import Composition, Timeline
+from .pagination import CursorPagination, paginate
+
+# Every composition listing -- HTML pages and the API -- loads its page through these functions,
+# so each one costs a fixed number of queries however many different artists are on the page.
+# Only the HTML pages show the artists; the API links to them by artist_id, so it skips the join.
+
+
+def _load_page(query, order_by, cursor, count, with_artists):
+    """Returns a page of compositions, with their artists loaded in the same query if asked for.
+
+    Args:
+        query (Query): Query for the compositions to list, without any ordering
+        order_by (tuple): Columns that uniquely sort the compositions, see app.pagination.paginate()
+        cursor (string): Cursor from a previous page, or None for the first page
+        count (bool): Also count every composition in the listing
+        with_artists (bool): Load each composition's artist too
+    """
+    if with_artists:
+        query = query.options(db.joinedload(Composition.artist))
+    return paginate(query, order_by, cursor,
+                    per_page=current_app.config['RAGTIME_COMPS_PER_PAGE'],
+                    count=count)
+
+
+def all_compositions(cursor=None, count=False, with_artists=True):
+    """Returns a page of every composition, newest first
+
+    Args:
+        cursor (string, optional): Cursor from a previous page. Defaults to the first page.
+        count (bool, optional): Also count every composition. Defaults to False.
+        with_artists (bool, optional): Load each composition's artist too. Defaults to True.
+    """
+    return _load_page(Composition.query,
+                      (Composition.timestamp, Composition.id),
+                      cursor, count, with_artists)
+
+
+def user_compositions(user, cursor=None, count=False, with_artists=True):
+    """Returns a page of the compositions created by a user, newest first
+
+    Args:
+        user (class): A user in the database
+        cursor (string, optional): Cursor from a previous page. Defaults to the first page.
+        count (bool, optional): Also count every composition by the user. Defaults to False.
+        with_artists (bool, optional): Load each composition's artist too. Defaults to True.
+    """
+    return _load_page(Composition.query.filter_by(artist_id=user.id),
+                      (Composition.timestamp, Composition.id),
+                      cursor, count, with_artists)
+
+
+def followed_compositions(user, cursor=None, count=False, with_artists=True):
+    """Returns a page of the user's home timeline, newest first
+
+    Args:
+        user (class): A user in the database
+        cursor (string, optional): Cursor from a previous page. Defaults to the first page.
+        count (bool, optional): Also count every composition in the timeline. Defaults to False.
+        with_artists (bool, optional): Load each composition's artist too. Defaults to True.
+    """
+    return _load_page(user.followed_compositions,
+                      (Timeline.timestamp, Timeline.composition_id),
+                      cursor, count, with_artists)
+
+
+def search_compositions(terms, cursor=None, count=False, with_artists=True):
+    """Returns a page of the compositions matching a search, best match first
+
+    Args:
+        terms (string): What the user searched for
+        cursor (string, optional): Cursor from a previous page. Defaults to the first page.
+        count (bool, optional): Also count every matching composition. Defaults to False.
+        with_artists (bool, optional): Load each composition's artist too. Defaults to True.
+    """
+    matches = search.matches(terms)
+    if matches is None:
+        return CursorPagination([], current_app.config['RAGTIME_COMPS_PER_PAGE'],
+                                total=0 if count else None)
+    return _load_page(Composition.query.join(matches, matches.c.id == Composition.id),
+                      (matches.c.score, matches.c.id),
+                      cursor, count, with_artists)
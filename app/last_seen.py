@@ -0,0 +1,89 @@
+import atexit
+import os
+from datetime import timedelta
+from threading import Event, Lock, Thread
+from . import db
+
+
+class LastSeenBuffer:
+    """Write-behind buffer for User.last_seen.
+
+    User.ping() records activity here instead of committing an UPDATE on every request. Pings are
+    coalesced to the latest one per user, and a background thread writes them every
+    RAGTIME_LAST_SEEN_FLUSH_INTERVAL seconds as one batched UPDATE. Whatever is still pending
+    is written when the process exits.
+    """
+    def __init__(self):
+        self.app = None
+        self.resolution = timedelta(seconds=60)
+        self.interval = 15
+        self._pending = {}
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        if self.app is None:
+            atexit.register(self.stop)
+        self.app = app
+        self.resolution = timedelta(seconds=app.config['RAGTIME_LAST_SEEN_RESOLUTION'])
+        self.interval = app.config['RAGTIME_LAST_SEEN_FLUSH_INTERVAL']
+
+    def record(self, user_id, when):
+        """Buffers a user's last_seen time to be written on the next flush
+
+        Args:
+            user_id (int): The ID of the user
+            when (datetime): When the user was last seen
+        """
+        with self._lock:
+            self._pending[user_id] = when
+        # An interval of 0 writes straight away
+        if self.interval <= 0:
+            self.flush()
+        else:
+            self._start()
+
+    def _start(self):
+        # Threads don't survive a fork, so each worker process starts its own flusher
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = Thread(target=self._run, name='last-seen-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception('Could not write last_seen updates')
+
+    def flush(self):
+        """Writes every pending last_seen time in one batched UPDATE
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending or self.app is None:
+            return
+        from .models import User
+        users = User.__table__
+        with self.app.app_context():
+            db.engine.execute(users.update()
+                              .where(users.c.id == db.bindparam('user_id'))
+                              .values(last_seen=db.bindparam('seen')),
+                              [{'user_id': user_id, 'seen': seen} for user_id, seen in pending.items()])
+
+    def stop(self):
+        """Stops the flusher thread and writes whatever is still pending
+        """
+        self._stop.set()
+        self.flush()
+
+
+last_seen_buffer = LastSeenBuffer()
@@ -1,10 +1,15 @@
-from flask import render_template, url_for, flash, redirect, request, current_app, make_response
+from flask import render_template, url_for, flash, redirect, request, current_app, make_response, abort, \
+    send_file
 from flask_login import login_required, current_user
 from . import main
 from .forms import EditProfileForm, AdminLevelEditProfileForm, CompositionForm
 from .. import db
-from ..models import Role, User, Permission, Composition
+from ..models import Role, User, Permission, Composition, Timeline
 from ..decorators import admin_required, permission_required
+from .. import feeds
+from ..query_stats import query_stats
+from ..profiler import profiler
+from ..routing import use_primary
 
 
 @main.route('/', methods=["GET", "POST"])
@@ -26,29 +31,39 @@ def index():
             artist=current_user._get_current_object())
         db.session.add(composition)
         db.session.commit()
+        # Add to followers' timelines, committed along with the slug
+        Timeline.fan_out(composition)
         composition.generate_slug()
         return redirect(url_for('.index'))
     # Will not allow compositions to be created if user is anonymous and the form is submitted
     elif current_user.is_anonymous and form.validate_on_submit():
         flash('You must be logged in to do that.')
     # Defines which compositions to show on home page
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     show_followed = False
     if current_user.is_authenticated:
         show_followed = bool(request.cookies.get('show_followed', ''))
+    # Paginate to show 20 per 1 page
     if show_followed:
-        query = current_user.followed_compositions
+        pagination = feeds.followed_compositions(current_user, cursor)
     else:
-        query = Composition.query
-    # Paginate the query from above to show 20 per 1 page
-    pagination = query.order_by(Composition.timestamp.desc()).paginate(
-            page,
-            per_page=current_app.config['RAGTIME_COMPS_PER_PAGE'],
-            error_out=False)
+        pagination = feeds.all_compositions(cursor)
     # Convert to list
     compositions = pagination.items
     return render_template('index.html', form=form, compositions=compositions, pagination=pagination, show_followed=show_followed)
 
+@main.route('/search')
+def search():
+    """Search results page, best matches first
+
+    Returns:
+        search.html file: Renders the compositions matching the search terms
+    """
+    terms = request.args.get('q', '')
+    pagination = feeds.search_compositions(terms, request.args.get('cursor'))
+    compositions = pagination.items
+    return render_template('search.html', terms=terms, compositions=compositions, pagination=pagination)
+
 @main.route('/all')
 @login_required
 def show_all():
@@ -79,12 +94,35 @@ def show_followed():
 @login_required
 @admin_required
 def for_admins_only():
-    """For administrators only. If you are an administrator, you can see this page
+    """For administrators only. If you are an administrator, you can see this page, which lists
+    the requests profiled on demand, see app/profiler.py
+    """
+    return render_template('admin.html', profiles=profiler.profiles())
 
-    Returns:
-        String: On the page, will return "Welcome, administrator!"
+@main.route('/admin/profiles/<name>')
+@login_required
+@admin_required
+def admin_profile(name):
+    """For administrators only. Shows the functions that took the most time in a profiled request,
+    or with ?download=1 sends the profile itself, for tools like snakeviz
     """
-    return "Welcome, administrator!"
+    path = profiler.path(name)
+    if path is None:
+        abort(404)
+    if request.args.get('download'):
+        return send_file(path, as_attachment=True, attachment_filename=name)
+    sort = request.args.get('sort', 'cumulative')
+    return render_template('admin_profile.html', name=name, sort=sort, stats=profiler.stats(name, sort))
+
+@main.route('/admin/queries')
+@login_required
+@admin_required
+def admin_queries():
+    """For administrators only. Lists the SQL statements this process has spent the most time on,
+    grouped by fingerprint, see app/query_stats.py
+    """
+    return render_template('admin_queries.html', statements=query_stats.top(),
+                           slow_ms=current_app.config['RAGTIME_SLOW_QUERY_MS'])
 
 @main.route('/moderate')
 @login_required
@@ -109,12 +147,9 @@ def user(username):
     """
     # Search for user based on the one provided in the URL, otherwise 404 error rendered
     user = User.query.filter_by(username=username).first_or_404()
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     # Pagination of the compositions for the particular user
-    pagination = Composition.query.filter_by(artist=user).order_by(Composition.timestamp.desc()).paginate(
-            page,
-            per_page=current_app.config['RAGTIME_COMPS_PER_PAGE'],
-            error_out=False)
+    pagination = feeds.user_compositions(user, cursor)
     # Convert to list
     compositions = pagination.items
     return render_template('user.html', user=user, compositions=compositions, pagination=pagination)
@@ -230,6 +265,7 @@ def edit_composition(slug):
     return render_template('edit-composition.html', form=form)
 
 @main.route('/delete/<slug>', methods=["GET", "POST"])
+@use_primary
 @login_required
 def delete_composition(slug):
     """Function will delete the composition if the user has authorization (if it's their own)
@@ -249,6 +285,7 @@ def delete_composition(slug):
     return redirect(url_for('.index', composition=composition))
 
 @main.route('/follow/<username>')
+@use_primary
 @login_required
 @permission_required(Permission.FOLLOW)
 def follow(username):
@@ -278,6 +315,7 @@ def follow(username):
     return redirect(url_for('.user', username=username))
 
 @main.route('/unfollow/<username>')
+@use_primary
 @login_required
 @permission_required(Permission.FOLLOW)
 def unfollow(username):
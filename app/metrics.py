@@ -0,0 +1,347 @@
+import glob
+import json
+import os
+import time
+import uuid
+from threading import Lock, Thread
+from flask import Response, abort, current_app, g, request
+from sqlalchemy import event
+
+# Metric name -> (type, help text)
+METRICS = {
+    'ragtime_http_requests_total': ('counter', 'Requests handled, by endpoint and status code.'),
+    'ragtime_http_request_duration_seconds': ('histogram', 'Time spent handling requests, by endpoint.'),
+    'ragtime_http_requests_in_flight': ('gauge', 'Requests being handled right now.'),
+    'ragtime_db_connect_seconds': ('histogram', 'Time spent opening new database connections.'),
+    'ragtime_db_connections_in_use': ('gauge', 'Database connections checked out of the pool, requests wait '
+                                               'for one once the pool is full.'),
+    'ragtime_credential_cache_hits_total': ('counter', 'API credentials found in the credential cache.'),
+    'ragtime_credential_cache_misses_total': ('counter', 'API credentials that had to be verified.'),
+}
+
+# Where the counters and histograms of workers that have exited are kept
+DEAD_FILE = 'dead.json'
+
+
+def _labels(**labels):
+    # The label string doubles as the key metrics are stored under
+    escaped = {k: str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+               for k, v in labels.items()}
+    return ','.join(f'{k}="{v}"' for k, v in sorted(escaped.items()))
+
+
+class Metrics:
+    """Request and database pool metrics, exposed at /metrics in the Prometheus text format.
+
+    Each process keeps its own counters, histograms and gauges. With RAGTIME_METRICS_DIR set, every
+    process also writes them to <pid>-<random token>.json in that directory from a background thread every
+    RAGTIME_METRICS_FLUSH_INTERVAL, and /metrics adds up every process's file, so the numbers are
+    right whichever gunicorn worker answers the scrape. The counters and histograms of workers that
+    have exited are folded into dead.json and their files deleted, so totals never go down and the
+    directory doesn't grow with every restarted worker; their gauges are dropped.
+    """
+    def __init__(self):
+        self.app = None
+        self.directory = None
+        self.interval = 1
+        self.buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+        self._lock = Lock()
+        self._flusher_pid = None
+        self._file_pid = None
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._dirty = False
+        self._counters = {}
+        self._gauges = {}
+        # name -> labels -> [count per bucket..., sum, count]
+        self._histograms = {}
+
+    def init_app(self, app):
+        self.app = app
+        self.directory = app.config['RAGTIME_METRICS_DIR']
+        self.interval = app.config['RAGTIME_METRICS_FLUSH_INTERVAL']
+        self.buckets = tuple(app.config['RAGTIME_METRICS_BUCKETS'])
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            self._reset()
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.teardown_request(self.end_request)
+        app.add_url_rule('/metrics', 'metrics', self.view)
+        # The pool events stay with an engine when it is disposed after a fork
+        from . import db
+        with app.app_context():
+            for bind in [None] + list(app.config.get('SQLALCHEMY_BINDS') or ()):
+                engine = db.get_engine(app, bind)
+                event.listen(engine, 'do_connect', self._connecting)
+                event.listen(engine, 'connect', self._connected)
+                event.listen(engine, 'checkout', self._checked_out)
+                event.listen(engine, 'checkin', self._checked_in)
+
+    def _check_pid(self):
+        # A forked worker starts counting from zero rather than repeating its parent's numbers
+        if self._pid != os.getpid():
+            self._reset()
+
+    def inc(self, name, labels='', amount=1):
+        with self._lock:
+            self._check_pid()
+            values = self._counters.setdefault(name, {})
+            values[labels] = values.get(labels, 0) + amount
+
+    def add_gauge(self, name, amount, labels=''):
+        with self._lock:
+            self._check_pid()
+            values = self._gauges.setdefault(name, {})
+            values[labels] = values.get(labels, 0) + amount
+
+    def observe(self, name, value, labels=''):
+        """Adds a value to a histogram
+
+        Args:
+            name (string): The histogram, see METRICS
+            value (float): The value observed, e.g. a duration in seconds
+            labels (string, optional): Labels from _labels(). Defaults to none.
+        """
+        with self._lock:
+            self._check_pid()
+            series = self._histograms.setdefault(name, {})
+            counts = series.get(labels)
+            if counts is None:
+                counts = series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    def _connecting(self, dialect, connection_record, cargs, cparams):
+        connection_record.info['metrics_connect_start'] = time.perf_counter()
+
+    def _connected(self, dbapi_connection, connection_record):
+        start = connection_record.info.pop('metrics_connect_start', None)
+        if start is not None:
+            self.observe('ragtime_db_connect_seconds', time.perf_counter() - start)
+
+    def _checked_out(self, dbapi_connection, connection_record, connection_proxy):
+        self.add_gauge('ragtime_db_connections_in_use', 1)
+
+    def _checked_in(self, dbapi_connection, connection_record):
+        self.add_gauge('ragtime_db_connections_in_use', -1)
+
+    def start_request(self):
+        g.metrics_start = time.perf_counter()
+        self.add_gauge('ragtime_http_requests_in_flight', 1)
+
+    def finish_request(self, response):
+        start = g.get('metrics_start')
+        if start is not None:
+            # Requests that matched no URL share one label, so bad URLs can't create new series
+            endpoint = request.endpoint or 'unmatched'
+            blueprint = request.blueprint or ''
+            self.observe('ragtime_http_request_duration_seconds', time.perf_counter() - start,
+                         _labels(blueprint=blueprint, endpoint=endpoint))
+            self.inc('ragtime_http_requests_total',
+                     _labels(blueprint=blueprint, endpoint=endpoint, method=request.method,
+                             status=response.status_code))
+        return response
+
+    def end_request(self, exception=None):
+        if g.pop('metrics_start', None) is not None:
+            self.add_gauge('ragtime_http_requests_in_flight', -1)
+        if self.directory:
+            self._dirty = True
+            self._start_flusher()
+
+    def _start_flusher(self):
+        # Threads don't survive a fork, so each worker process starts its own flusher
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        Thread(target=self._run, name='metrics-flusher', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if self._dirty and self.directory:
+                self._dirty = False
+                try:
+                    self.flush()
+                except OSError:
+                    self.app.logger.exception('Could not write metrics')
+
+    def snapshot(self):
+        """Returns this process's metrics as a JSON-serializable dict
+        """
+        from .api.credentials import credential_cache
+        with self._lock:
+            self._check_pid()
+            data = {'counters': {name: dict(values) for name, values in self._counters.items()},
+                    'gauges': {name: dict(values) for name, values in self._gauges.items()},
+                    'histograms': {name: {labels: list(counts) for labels, counts in series.items()}
+                                   for name, series in self._histograms.items()},
+                    'buckets': list(self.buckets)}
+        data['counters']['ragtime_credential_cache_hits_total'] = {'': credential_cache.hits}
+        data['counters']['ragtime_credential_cache_misses_total'] = {'': credential_cache.misses}
+        return data
+
+    def flush(self):
+        """Writes this process's metrics to the shared directory
+        """
+        # A token as well as the pid, so a new process that gets a dead one's pid doesn't
+        # overwrite its counters
+        if self._file_pid != os.getpid():
+            self._file_pid = os.getpid()
+            self._file = f'{os.getpid()}-{uuid.uuid4().hex}.json'
+        _write(os.path.join(self.directory, self._file), self.snapshot())
+
+    def collect(self):
+        """Returns the metrics of every process added together
+        """
+        if not self.directory:
+            return self.snapshot()
+        self.flush()
+        import fcntl
+        total = {'counters': {}, 'gauges': {}, 'histograms': {}, 'buckets': list(self.buckets)}
+        dead_path = os.path.join(self.directory, DEAD_FILE)
+        # One scrape at a time, so each exited worker is folded into dead.json exactly once
+        with open(os.path.join(self.directory, 'collect.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            dead = _read(dead_path) or {'counters': {}, 'gauges': {}, 'histograms': {},
+                                        'buckets': list(self.buckets), 'files': []}
+            # Files from a scrape that stopped between writing dead.json and deleting them
+            folded = set(dead['files'])
+            exited = []
+            for path in glob.glob(os.path.join(self.directory, '*.json')):
+                name = os.path.basename(path)
+                if name == DEAD_FILE:
+                    continue
+                if name in folded:
+                    exited.append(path)
+                    continue
+                pid = int(name.split('-')[0].split('.')[0])
+                # This process's pid on another file means a process before it had the same one
+                alive = name == self._file if pid == os.getpid() else _alive(pid)
+                data = _read(path)
+                if alive:
+                    if data is not None:
+                        _add(total, data)
+                    continue
+                if data is not None:
+                    _add(dead, data, gauges=False)
+                exited.append(path)
+            if exited:
+                dead['files'] = [os.path.basename(path) for path in exited]
+                _write(dead_path, dead)
+                for path in exited:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+        _add(total, dead, gauges=False)
+        return total
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format
+        """
+        data = self.collect()
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'histogram':
+                for labels, counts in sorted(data['histograms'].get(name, {}).items()):
+                    cumulative = 0
+                    for bound, count in zip(data['buckets'], counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_braces(_join(labels, _labels(le=bound)))} {cumulative}')
+                    lines.append(f'{name}_bucket{_braces(_join(labels, _labels(le="+Inf")))} {counts[-1]}')
+                    lines.append(f'{name}_sum{_braces(labels)} {counts[-2]}')
+                    lines.append(f'{name}_count{_braces(labels)} {counts[-1]}')
+            else:
+                values = data['counters' if kind == 'counter' else 'gauges'].get(name, {})
+                if kind == 'gauge' and not values:
+                    values = {'': 0}
+                for labels, value in sorted(values.items()):
+                    lines.append(f'{name}{_braces(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def view(self):
+        """Serves /metrics. With RAGTIME_METRICS_TOKEN set, scrapers must send it as a bearer token.
+        """
+        token = current_app.config['RAGTIME_METRICS_TOKEN']
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            abort(403)
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _join(labels, extra):
+    return f'{labels},{extra}' if labels else extra
+
+
+def _braces(labels):
+    return f'{{{labels}}}' if labels else ''
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(path, data):
+    tmp = f'{path}.{time.time()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    # Readers see either the old file or the new one, never half of one
+    os.replace(tmp, path)
+
+
+def _add(total, data, gauges=True):
+    """Adds one process's metrics, as written by Metrics.flush(), to a running total
+
+    Args:
+        total (dict): The total, changed in place
+        data (dict): The metrics to add
+        gauges (bool, optional): Whether to add the gauges too. Defaults to True.
+    """
+    kinds = ('counters', 'gauges') if gauges else ('counters',)
+    for kind in kinds:
+        for name, values in data[kind].items():
+            merged = total[kind].setdefault(name, {})
+            for labels, value in values.items():
+                merged[labels] = merged.get(labels, 0) + value
+    # Histograms written with other buckets can't be added up
+    if data.get('buckets') != total['buckets']:
+        return
+    for name, series in data['histograms'].items():
+        merged = total['histograms'].setdefault(name, {})
+        for labels, counts in series.items():
+            if labels in merged:
+                merged[labels] = [a + b for a, b in zip(merged[labels], counts)]
+            else:
+                merged[labels] = list(counts)
+
+
+def _alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+metrics = Metrics()
@@ -1,7 +1,7 @@
 import re
-from flask.helpers import url_for
 from flask_login.mixins import AnonymousUserMixin
 from sqlalchemy.orm import backref
+from sqlalchemy.orm.attributes import set_committed_value
 from . import db
 from werkzeug.security import check_password_hash, generate_password_hash
 from flask_login import UserMixin
@@ -10,8 +10,13 @@ from itsdangerous import TimedJSONWebSignatureSerializer as Serializer, exc
 from flask import current_app
 from datetime import datetime
 import hashlib
-import bleach
 from app.exceptions import ValidationError
+from .cache import fragment_cache
+from .last_seen import last_seen_buffer
+from . import search
+from .descriptions import description_hash, render
+from .urls import fast_url_for
+from .avatars.identicon import bucket
 
 # Quantifying Role Permissions
 class Permission:
@@ -117,7 +122,8 @@ class Follow(db.Model):
     __tablename__ = 'follows'
 
     follower_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
-    following_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    # Indexed for looking up a user's followers; the primary key covers who they follow
+    following_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True, index=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
 # Database table "users"
@@ -143,7 +149,13 @@ class User(UserMixin, db.Model):
     bio = db.Column(db.Text())
 
     last_seen = db.Column(db.DateTime(), default=datetime.utcnow) # Automatically updates
-    avatar_hash = db.Column(db.String(32)) # Profile image - randomized based on email
+    updated_at = db.Column(db.DateTime(), index=True, default=datetime.utcnow, onupdate=datetime.utcnow) # For HTTP caching and exports
+    avatar_hash = db.Column(db.String(32), index=True) # Profile image - randomized based on email
+
+    # Stored counts so profiles and the API don't need a COUNT query. Self follows aren't counted.
+    followers_count = db.Column(db.Integer, default=0)
+    following_count = db.Column(db.Integer, default=0)
+    compositions_count = db.Column(db.Integer, default=0)
 
     # Relationship to compositions table
     compositions = db.relationship('Composition', backref='artist', lazy='dynamic')
@@ -181,11 +193,11 @@ class User(UserMixin, db.Model):
     def password(self):
         raise AttributeError('Password is not a readable attribute')
 
-    # Shows compositions of those the user follows
+    # Shows compositions of those the user follows, read from the user's materialized timeline
     @property
     def followed_compositions(self):
-        return Composition.query.join(Follow, Follow.following_id == Composition.artist_id) \
-            .filter(Follow.follower_id == self.id)
+        return Composition.query.join(Timeline, Timeline.composition_id == Composition.id) \
+            .filter(Timeline.user_id == self.id)
 
     # Ensures password is secured with password hash
     @password.setter
@@ -270,30 +282,97 @@ class User(UserMixin, db.Model):
                 db.session.add(user)
                 db.session.commit()
 
-    def ping(self):
-        """When the user is active, their last_seen column updates to now.
+    @staticmethod
+    def add_to_counter(user_id, counter, amount, session=None):
+        """Adds to one of a user's stored counts in the database, in place so concurrent changes aren't lost.
+        The new value is loaded the next time the user is read from the database.
+
+        Args:
+            user_id (int): The ID of the user
+            counter (string): 'followers_count', 'following_count' or 'compositions_count'
+            amount (int): How much to add, negative to subtract
+            session (Session, optional): Session to run the update in. Defaults to db.session.
         """
-        self.last_seen = datetime.utcnow()
-        db.session.add(self)
+        # Users that haven't been saved yet don't have anything to count
+        if user_id is None:
+            return
+        column = User.__table__.c[counter]
+        (session or db.session).execute(User.__table__.update()
+                                        .where(User.__table__.c.id == user_id)
+                                        .values({column: column + amount}))
+
+    @staticmethod
+    def on_flush_count_compositions(session, flush_context):
+        """Keeps compositions_count in step with compositions created and deleted in a flush,
+        with one update per artist however many compositions they added.
+        """
+        changes = {}
+        for obj in session.new:
+            if isinstance(obj, Composition):
+                changes[obj.artist_id] = changes.get(obj.artist_id, 0) + 1
+        for obj in session.deleted:
+            if isinstance(obj, Composition):
+                changes[obj.artist_id] = changes.get(obj.artist_id, 0) - 1
+        for artist_id, amount in changes.items():
+            if amount:
+                User.add_to_counter(artist_id, 'compositions_count', amount, session=session)
+
+    @staticmethod
+    def reconcile_counters():
+        """Recounts every user's followers, following and compositions from the source tables.
+        """
+        users = User.__table__
+        follows = Follow.__table__
+        compositions = Composition.__table__
+        db.session.execute(users.update().values(
+            followers_count=db.select([db.func.count()])
+                .where(db.and_(follows.c.following_id == users.c.id,
+                               follows.c.follower_id != users.c.id))
+                .as_scalar(),
+            following_count=db.select([db.func.count()])
+                .where(db.and_(follows.c.follower_id == users.c.id,
+                               follows.c.following_id != users.c.id))
+                .as_scalar(),
+            compositions_count=db.select([db.func.count()])
+                .where(compositions.c.artist_id == users.c.id)
+                .as_scalar()))
         db.session.commit()
 
+    @staticmethod
+    def on_changed_user(mapper, connection, target):
+        """Drops cached fragments of a user's compositions when the artist details they show change
+        """
+        state = db.inspect(target)
+        if state.attrs.username.history.has_changes() or state.attrs.avatar_hash.history.has_changes():
+            fragment_cache.invalidate_artist(target.id)
+
+    def ping(self):
+        """When the user is active, their last_seen column updates to now. The update is written
+        in the background at most once every RAGTIME_LAST_SEEN_RESOLUTION seconds, see app/last_seen.py
+        """
+        now = datetime.utcnow()
+        if self.last_seen is not None and now - self.last_seen < last_seen_buffer.resolution:
+            return
+        last_seen_buffer.record(self.id, now)
+        # Show the new time for the rest of the request without making the user dirty
+        set_committed_value(self, 'last_seen', now)
+
     def email_hash(self):
         """Returns random string/hash based on user's email, where the user's avatar/profile image can be created.
         """
         return hashlib.md5(self.email.lower().encode('utf-8')).hexdigest()
 
-    def unicornify(self, size=128):
-        """Generates user profile image/avatar based on email/email hash.
+    def avatar(self, size=128):
+        """Returns the URL of the user's avatar, rendered by the app from their avatar hash.
 
         Args:
             size (int, optional): Size of the image. Defaults to 128px.
 
         Returns:
-            string: Image URL from Unicornify API
+            string: Image URL, see app/avatars/
         """
-        url = 'https://unicornify.pictures/avatar'
         hash = self.avatar_hash or self.email_hash()
-        return f'{url}/{hash}?s={size}'
+        return f"{fast_url_for('avatars.avatar', avatar_hash=hash)}?s={bucket(size)}"
 
     def follow(self, user):
         """Lets user follow another user.
@@ -304,6 +383,10 @@ class User(UserMixin, db.Model):
         if not self.is_following(user):
             f = Follow(follower=self, following=user)
             db.session.add(f)
+            Timeline.add_follow(self, user)
+            if user is not self:
+                User.add_to_counter(self.id, 'following_count', 1)
+                User.add_to_counter(user.id, 'followers_count', 1)
 
     def unfollow(self, user):
         """Lets user unfollow another user
@@ -314,6 +397,10 @@ class User(UserMixin, db.Model):
         f = self.following.filter_by(following_id=user.id).first()
         if f:
             db.session.delete(f)
+            Timeline.remove_follow(self, user)
+            if user is not self:
+                User.add_to_counter(self.id, 'following_count', -1)
+                User.add_to_counter(user.id, 'followers_count', -1)
 
     def is_following(self, user):
         """Checks if current user is following the user provided in calling the function
@@ -340,30 +427,48 @@ class User(UserMixin, db.Model):
         return s.dumps({'id': self.id}).decode('utf-8')
 
     @staticmethod
-    def verify_auth_token(token):
+    def verify_auth_token(token, with_expiry=False):
+        """Returns the user an auth token was generated for, or None if it is invalid or expired.
+
+        Args:
+            token (string): Token from generate_auth_token()
+            with_expiry (bool, optional): Return (user, expiry as a UNIX timestamp) instead. Defaults to False.
+        """
         s = Serializer(current_app.config['SECRET_KEY'])
         try:
-            data = s.loads(token)
+            data, header = s.loads(token, return_header=True)
         except:
-            return None
-        return User.query.get(data['id'])
-
-    def to_json(self):
+            return (None, None) if with_expiry else None
+        user = User.query.get(data['id'])
+        return (user, header.get('exp')) if with_expiry else user
+
+    # The fields of to_json(), each worked out only when asked for. The API exports use them on
+    # database rows, which have the same attribute names.
+    json_fields = {
+        'url': lambda user: fast_url_for('api.get_user', id=user.id),
+        'username': lambda user: user.username,
+        'last seen': lambda user: user.last_seen,
+        'compositions_url': lambda user: fast_url_for('api.get_user_compositions', id=user.id),
+        'followed_compositions_url': lambda user: fast_url_for('api.get_user_followed', id=user.id),
+        'composition count': lambda user: user.compositions_count,
+    }
+
+    def to_json(self, fields=None):
         """Returns json data as a dictionary for user information
+
+        Args:
+            fields (set, optional): Names from json_fields to include. Defaults to all of them.
         """
-        json_user = {
-            'url': url_for('api.get_user', id=self.id),
-            'username': self.username,
-            'last seen': self.last_seen,
-            'compositions_url': url_for('api.get_user_compositions', id=self.id),
-            'followed_compositions_url': url_for('api.get_user_followed', id=self.id),
-            'composition count': self.compositions.count(),
-        }
-        return json_user
+        return {name: value(self) for name, value in User.json_fields.items()
+                if fields is None or name in fields}
 
 # Database table "compositions"
 class Composition(db.Model):
     __tablename__ = 'compositions'
+    # Keyset pagination of an artist's compositions, see app/pagination.py
+    __table_args__ = (
+        db.Index('ix_compositions_artist_id_timestamp', 'artist_id', 'timestamp', 'id'),
+    )
     # Primary key
     id = db.Column(db.Integer, primary_key=True)
 
@@ -374,43 +479,91 @@ class Composition(db.Model):
 
     timestamp = db.Column(db.DateTime,
         index=True, default=datetime.utcnow)
+    # Changes on every edit, used to tell cached copies of the composition apart and by exports
+    updated_at = db.Column(db.DateTime, index=True, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Foreign key to see which user the composition belongs to
     artist_id = db.Column(db.Integer, db.ForeignKey('users.id'))
 
     description_html = db.Column(db.Text)
+    # What description_html was rendered from, see app/descriptions.py
+    description_hash = db.Column(db.String(40))
     slug = db.Column(db.String(128), unique=True) # Used in the URL of the composition
 
     @staticmethod
     def on_changed_description(target, value, oldvalue, initiator):
         """Updates description when it is changed, and cleans old description information
         """
-        allowed_tags = ['a']
-        html = bleach.linkify(bleach.clean(value,
-                                           tags=allowed_tags,
-                                           strip=True))
-        target.description_html = html
+        digest = description_hash(value)
+        # Setting the same text again, e.g. saving the edit form unchanged, needs no rendering
+        if digest == target.description_hash:
+            return
+        target.description_html = render(value)
+        target.description_hash = digest
+        # Written to the search index after the next flush
+        target.search_stale = True
+
+    @staticmethod
+    def on_changed_title(target, value, oldvalue, initiator):
+        """Marks the composition to be written to the search index after the next flush
+        """
+        target.search_stale = True
+
+    @staticmethod
+    def on_flush_update_search(session, flush_context):
+        """Keeps the search index in step with compositions created, edited and deleted in a flush
+        """
+        connection = session.connection()
+        changed = [obj for obj in list(session.new) + list(session.dirty)
+                   if isinstance(obj, Composition) and getattr(obj, 'search_stale', False)]
+        search.index(connection, changed)
+        for obj in changed:
+            obj.search_stale = False
+        search.remove(connection, [obj.id for obj in session.deleted if isinstance(obj, Composition)])
+
+    @staticmethod
+    def make_slug(id, title):
+        """Returns the slug for a composition, used in URL of the composition
+
+        Args:
+            id (int): The ID of the composition
+            title (string): The title of the composition
+        """
+        return f"{id}-" + re.sub(r'[^\w]+', '-', title.lower())
 
     def generate_slug(self):
         """Creates random string slug associated with the composition, used in URL of the composition
         """
-        self.slug = f"{self.id}-" + re.sub(r'[^\w]+', '-', self.title.lower())
+        self.slug = Composition.make_slug(self.id, self.title)
         db.session.add(self)
         db.session.commit()
 
-    def to_json(self):
+    @staticmethod
+    def on_changed_composition(mapper, connection, target):
+        """Drops cached fragments of a composition when it is edited or deleted
+        """
+        fragment_cache.invalidate_composition(target.id)
+
+    # The fields of to_json(), each worked out only when asked for. The API exports use them on
+    # database rows, which have the same attribute names.
+    json_fields = {
+        'url': lambda composition: fast_url_for('api.get_composition', id=composition.id),
+        'release_type': lambda composition: composition.release_type,
+        'title': lambda composition: composition.title,
+        'description': lambda composition: composition.description,
+        'description_html': lambda composition: composition.description_html,
+        'timestamp': lambda composition: composition.timestamp,
+        'artist_url': lambda composition: fast_url_for('api.get_user', id=composition.artist_id),
+    }
+
+    def to_json(self, fields=None):
         """Returns json data as a dictionary for the composition information
+
+        Args:
+            fields (set, optional): Names from json_fields to include. Defaults to all of them.
         """
-        json_composition = {
-            'url': url_for('api.get_composition', id=self.id),
-            'release_type': self.release_type,
-            'title': self.title,
-            'description': self.description,
-            'description_html': self.description_html,
-            'timestamp': self.timestamp,
-            'artist_url': url_for('api.get_user', id=self.artist.id),
-        }
-        return json_composition
+        return {name: value(self) for name, value in Composition.json_fields.items()
+                if fields is None or name in fields}
 
     @staticmethod
     def from_json(json_composition):
@@ -431,6 +584,14 @@ class Composition(db.Model):
             raise ValidationError('Composition must have a title.')
         if description is None:
             raise ValidationError('Composition must have a description.')
+        # bool is an int too, but never a release type
+        if not isinstance(release_type, int) or isinstance(release_type, bool) or \
+                release_type not in (ReleaseType.SINGLE, ReleaseType.EXTENDED_PLAY, ReleaseType.ALBUM):
+            raise ValidationError('Composition release type must be 1, 2 or 3.')
+        if not isinstance(title, str):
+            raise ValidationError('Composition title must be a string.')
+        if not isinstance(description, str):
+            raise ValidationError('Composition description must be a string.')
 
         # Creates composition in the database
         try:
@@ -444,6 +605,122 @@ db.event.listen(Composition.description,
                 'set',
                 Composition.on_changed_description)
 
+db.event.listen(Composition.title,
+                'set',
+                Composition.on_changed_title)
+
+db.event.listen(db.session,
+                'after_flush',
+                Composition.on_flush_update_search)
+
+# Search index storage is created and dropped with the compositions table, see app/search.py
+db.event.listen(Composition.__table__,
+                'after_create',
+                db.DDL(search.SQLITE_CREATE).execute_if(dialect='sqlite'))
+db.event.listen(Composition.__table__,
+                'before_drop',
+                db.DDL(search.SQLITE_DROP).execute_if(dialect='sqlite'))
+for statement in search.POSTGRES_CREATE:
+    db.event.listen(Composition.__table__,
+                    'after_create',
+                    db.DDL(statement).execute_if(dialect='postgresql'))
+
+db.event.listen(db.session,
+                'after_flush',
+                User.on_flush_count_compositions)
+
+db.event.listen(Composition, 'after_update', Composition.on_changed_composition)
+db.event.listen(Composition, 'after_delete', Composition.on_changed_composition)
+db.event.listen(User, 'after_update', User.on_changed_user)
+
+# Database table "timelines" -- each user's home timeline, written when compositions are created
+# so the followed compositions feed is a single indexed range scan instead of a join and sort
+class Timeline(db.Model):
+    __tablename__ = 'timelines'
+    __table_args__ = (
+        db.Index('ix_timelines_user_id_timestamp', 'user_id', 'timestamp', 'composition_id'),
+    )
+
+    # The user whose timeline the composition shows up in
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    composition_id = db.Column(db.Integer, db.ForeignKey('compositions.id'), primary_key=True)
+    # Copied from the composition so the timeline can be read in order without touching compositions
+    timestamp = db.Column(db.DateTime)
+
+    @staticmethod
+    def _select_entries():
+        """Returns a select of (follower, composition, timestamp) rows joining follows to compositions.
+        """
+        return db.select([Follow.follower_id, Composition.id, Composition.timestamp]) \
+            .select_from(Follow.__table__.join(Composition.__table__,
+                                               Composition.artist_id == Follow.following_id))
+
+    @staticmethod
+    def _insert(select):
+        """Inserts the rows of the given select into the timelines table.
+        """
+        db.session.execute(Timeline.__table__.insert().from_select(
+            ['user_id', 'composition_id', 'timestamp'], select))
+
+    @staticmethod
+    def fan_out(*compositions):
+        """Adds newly created compositions to the timelines of everyone following their artists.
+        Compositions must already have an ID, so call it after they have been flushed or committed.
+
+        Args:
+            compositions (class): One or more compositions in the database
+        """
+        ids = [c.id for c in compositions]
+        if ids:
+            Timeline._insert(Timeline._select_entries().where(Composition.id.in_(ids)))
+
+    @staticmethod
+    def add_follow(follower, user):
+        """Copies the compositions of a newly followed user into the follower's timeline.
+
+        Args:
+            follower (class): The user who is following
+            user (class): The user being followed
+        """
+        # New users have nothing to copy yet
+        if follower.id is None or user.id is None:
+            return
+        Timeline._insert(db.select([db.literal(follower.id), Composition.id, Composition.timestamp])
+                         .where(Composition.artist_id == user.id))
+
+    @staticmethod
+    def remove_follow(follower, user):
+        """Removes an unfollowed user's compositions from the follower's timeline.
+
+        Args:
+            follower (class): The user who unfollowed
+            user (class): The user who was unfollowed
+        """
+        compositions = db.select([Composition.id]).where(Composition.artist_id == user.id)
+        Timeline.query.filter(Timeline.user_id == follower.id,
+                              Timeline.composition_id.in_(compositions)) \
+            .delete(synchronize_session=False)
+
+    @staticmethod
+    def on_deleted_composition(mapper, connection, target):
+        """Removes a composition from every timeline before the composition itself is deleted
+        """
+        connection.execute(Timeline.__table__.delete()
+                           .where(Timeline.__table__.c.composition_id == target.id))
+
+    @staticmethod
+    def rebuild():
+        """Rebuilds every timeline from the follows table in a single set-based statement.
+        """
+        db.session.execute(Timeline.__table__.delete())
+        Timeline._insert(Timeline._select_entries())
+        db.session.commit()
+
+
+db.event.listen(Composition,
+                'before_delete',
+                Timeline.on_deleted_composition)
+
 # Anonymous user class
 class AnonymousUser(AnonymousUserMixin):
     def can(self, perm):
@@ -477,4 +754,5 @@ def load_user(user_id):
     Args:
         user_id (int): the id of the user
     """
-    return User.query.get(int(user_id))
\ No newline at end of file
+    # Role is loaded with the user since templates check permissions on most pages
+    return User.query.options(db.joinedload(User.role)).get(int(user_id))
\ No newline at end of file
@@ -0,0 +1,125 @@
+import base64
+import json
+from datetime import datetime
+from flask import abort, url_for
+from . import db
+
+
+class CursorPagination:
+    """One page of results from paginate(), with opaque cursors to the pages on either side
+    """
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        # Only counted when asked for, see paginate()
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def next_url(self, endpoint, **values):
+        """Returns the URL of the next (older) page, or None if this is the last page
+        """
+        if not self.has_next:
+            return None
+        return url_for(endpoint, cursor=self.next_cursor, **values)
+
+    def prev_url(self, endpoint, **values):
+        """Returns the URL of the previous (newer) page, or None if this is the first page
+        """
+        if not self.has_prev:
+            return None
+        return url_for(endpoint, cursor=self.prev_cursor, **values)
+
+
+def encode_cursor(values, direction):
+    """Returns an opaque, URL safe cursor for a page boundary.
+
+    Args:
+        values (list): The sort key of the row at the page boundary
+        direction (string): 'next' to read rows after the boundary, 'prev' to read rows before it
+    """
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    payload = json.dumps({'k': values, 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, order_by):
+    """Returns the (values, direction) stored in a cursor from encode_cursor().
+    Aborts with 400 if the cursor has been tampered with or is from a different listing, including
+    when a value isn't of its column's type: an int for an id, an ISO 8601 string for a timestamp.
+
+    Args:
+        cursor (string): Cursor from a 'next' or 'prev' link
+        order_by (tuple): The columns the listing is sorted by
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        values, direction = data['k'], data['d']
+        if not isinstance(values, list) or len(values) != len(order_by) or direction not in ('next', 'prev'):
+            raise ValueError(cursor)
+        decoded = []
+        for column, value in zip(order_by, values):
+            if isinstance(column.type, db.DateTime):
+                # Only takes a string, so anything else is a TypeError
+                value = datetime.fromisoformat(value)
+            # Exact types, as True is an int too, and a list or object would reach the SQL as is
+            elif type(value) is not column.type.python_type:
+                raise TypeError(cursor)
+            decoded.append(value)
+        return decoded, direction
+    except (ValueError, TypeError, KeyError):
+        abort(400)
+
+
+def paginate(query, order_by, cursor=None, per_page=20, count=False):
+    """Keyset pagination: returns one page of the query, newest first, as a CursorPagination.
+    Instead of an OFFSET the page starts from the sort key in the cursor, so every page is a
+    single index range scan no matter how deep it is.
+
+    Args:
+        query (Query): Query for the rows to list, without any ordering
+        order_by (tuple): Columns that uniquely sort the rows, e.g. (timestamp, id). Each one is sorted descending.
+        cursor (string, optional): Cursor from a previous page's next_cursor or prev_cursor. Defaults to the first page.
+        per_page (int, optional): Number of items per page. Defaults to 20.
+        count (bool, optional): Also run a COUNT(*) of every row for the total. Defaults to False.
+    """
+    key = db.tuple_(*order_by)
+    total = query.order_by(None).count() if count else None
+    # Select the sort key alongside each row so cursors can be built from the page boundaries
+    keyed = query.add_columns(*order_by)
+    direction = 'next'
+    if cursor is None:
+        keyed = keyed.order_by(*[c.desc() for c in order_by])
+    else:
+        values, direction = decode_cursor(cursor, order_by)
+        if direction == 'next':
+            keyed = keyed.filter(key < tuple(values)).order_by(*[c.desc() for c in order_by])
+        else:
+            # Walk backwards from the boundary, then flip the rows back to newest first
+            keyed = keyed.filter(key > tuple(values)).order_by(*[c.asc() for c in order_by])
+    rows = keyed.limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'prev':
+        rows.reverse()
+        # Coming back from an older page, so there is always a next page
+        has_next, has_prev = True, more
+    else:
+        has_next, has_prev = more, cursor is not None
+    n = len(order_by)
+    next_cursor = prev_cursor = None
+    # Rows are (item, *sort key) tuples
+    if rows and has_next:
+        next_cursor = encode_cursor(list(rows[-1][-n:]), 'next')
+    if rows and has_prev:
+        prev_cursor = encode_cursor(list(rows[0][-n:]), 'prev')
+    return CursorPagination([row[0] for row in rows], per_page, next_cursor, prev_cursor, total)
@@ -0,0 +1,128 @@
+import cProfile
+import os
+import pstats
+import re
+import time
+from datetime import datetime
+from flask import g, request
+from flask_login import current_user
+from .models import Permission
+
+# Profile files are named <timestamp>-<method>-<endpoint>-<milliseconds>ms.prof
+_NAME = re.compile(r'^(\d{8}T\d{6}\.\d{6})-([A-Z]+)-([\w.]+)-(\d+)ms\.prof$')
+
+
+def _is_admin():
+    # API requests authenticate with HTTP Basic auth rather than the session, see api/authentication.py
+    user = g.get('current_user') if request.blueprint == 'api' else current_user
+    return user is not None and user.can(Permission.ADMIN)
+
+
+class RequestProfiler:
+    """Profiles single requests on demand.
+
+    An administrator who sends an X-Profile header, or adds ?_profile=1 to a URL, gets that
+    request run under cProfile. API requests are only profiled once they are authenticated, from
+    the API's before_request. The profile is saved to RAGTIME_PROFILE_DIR, named in the
+    X-Profile-Id response header, and can be browsed from /admin. Only the newest
+    RAGTIME_PROFILE_KEEP profiles are kept.
+    """
+    def __init__(self):
+        self.directory = None
+        self.keep = 50
+
+    def init_app(self, app):
+        self.directory = app.config['RAGTIME_PROFILE_DIR']
+        self.keep = app.config['RAGTIME_PROFILE_KEEP']
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+    def start_request(self):
+        # API users aren't known until the API's own before_request has authenticated them
+        if request.blueprint != 'api':
+            self.start()
+
+    def start(self):
+        """Starts profiling the request if an administrator asked for it
+        """
+        if not (request.headers.get('X-Profile') or request.args.get('_profile') == '1'):
+            return
+        if not _is_admin():
+            return
+        g.profile = cProfile.Profile()
+        g.profile_start = time.perf_counter()
+        g.profile.enable()
+
+    def finish_request(self, response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+        profile.disable()
+        if _is_admin():
+            elapsed = (time.perf_counter() - g.pop('profile_start')) * 1000
+            name = '{}-{}-{}-{}ms.prof'.format(datetime.utcnow().strftime('%Y%m%dT%H%M%S.%f'),
+                                               request.method, request.endpoint or 'unmatched',
+                                               int(elapsed))
+            os.makedirs(self.directory, exist_ok=True)
+            profile.dump_stats(os.path.join(self.directory, name))
+            self.prune()
+            response.headers['X-Profile-Id'] = name
+        return response
+
+    def prune(self):
+        for info in self.profiles()[self.keep:]:
+            try:
+                os.remove(os.path.join(self.directory, info['name']))
+            except OSError:
+                pass
+
+    def profiles(self):
+        """Returns the saved profiles, newest first
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for name in os.listdir(self.directory):
+            match = _NAME.match(name)
+            if match:
+                profiles.append({'name': name,
+                                 'timestamp': datetime.strptime(match.group(1), '%Y%m%dT%H%M%S.%f'),
+                                 'method': match.group(2),
+                                 'endpoint': match.group(3),
+                                 'ms': int(match.group(4))})
+        return sorted(profiles, key=lambda p: p['timestamp'], reverse=True)
+
+    def path(self, name):
+        """Returns the path of a saved profile, or None if there is no such profile
+
+        Args:
+            name (string): The profile's file name, as in the X-Profile-Id header
+        """
+        if not _NAME.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.exists(path) else None
+
+    def stats(self, name, sort='cumulative', limit=60):
+        """Returns the functions in a saved profile that took the most time, with the profile's totals
+
+        Args:
+            name (string): The profile's file name
+            sort (string, optional): 'cumulative', 'tottime' or 'ncalls'. Defaults to 'cumulative'.
+            limit (int, optional): How many functions to return. Defaults to 60.
+        """
+        stats = pstats.Stats(self.path(name))
+        rows = []
+        for (filename, line, function), (primitive, calls, tottime, cumtime, callers) in stats.stats.items():
+            rows.append({'function': function,
+                         'location': f'{filename}:{line}' if line else filename,
+                         'ncalls': calls if calls == primitive else f'{calls}/{primitive}',
+                         'calls': calls,
+                         'tottime': tottime,
+                         'cumtime': cumtime})
+        key = {'tottime': 'tottime', 'ncalls': 'calls'}.get(sort, 'cumtime')
+        rows.sort(key=lambda row: row[key], reverse=True)
+        return {'total_calls': stats.total_calls, 'total_tt': stats.total_tt, 'rows': rows[:limit]}
+
+
+profiler = RequestProfiler()
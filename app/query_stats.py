@@ -0,0 +1,183 @@
+import hashlib
+import heapq
+import json
+import logging
+import re
+import time
+from datetime import datetime
+from threading import Lock
+from flask import g, has_request_context, request
+from sqlalchemy.engine import Engine
+from . import db
+
+# Normalizes SQL so statements that differ only in their values share a fingerprint
+_NORMALIZE = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%\(\w+\)s|:\w+|\$\d+'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)'), '(?, ...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def normalize(statement):
+    """Returns a statement with its literal values and parameters replaced by placeholders
+
+    Args:
+        statement (string): SQL as sent to the database
+    """
+    for pattern, replacement in _NORMALIZE:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+def fingerprint(statement):
+    """Returns a short, stable ID for a normalized statement
+
+    Args:
+        statement (string): SQL as returned by normalize()
+    """
+    return hashlib.sha1(statement.encode('utf-8')).hexdigest()[:12]
+
+
+class RequestQueries:
+    """The statements run while handling one request
+    """
+    def __init__(self, keep):
+        self.count = 0
+        self.total_ms = 0.0
+        self.keep = keep
+        # (duration, statement) of the slowest statements, smallest first
+        self.slowest = []
+
+    def add(self, statement, duration_ms):
+        self.count += 1
+        self.total_ms += duration_ms
+        if len(self.slowest) < self.keep:
+            heapq.heappush(self.slowest, (duration_ms, statement))
+        elif duration_ms > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (duration_ms, statement))
+
+
+class QueryStats:
+    """Times every SQL statement the app runs.
+
+    Each request gets a count, the total time spent in the database and its slowest statements,
+    which are sent back as X-DB-* response headers when RAGTIME_QUERY_HEADERS is on. Statements
+    slower than RAGTIME_SLOW_QUERY_MS are written to the slow query log as one JSON object per line.
+    Totals per statement fingerprint are kept for the whole process and shown on /admin/queries.
+    """
+    def __init__(self):
+        self.app = None
+        self.slow_ms = 100
+        self.keep = 5
+        self.max_fingerprints = 1000
+        self.logger = logging.getLogger('ragtime.slow_queries')
+        # fingerprint -> [statement, count, total ms, max ms]
+        self._totals = {}
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.slow_ms = app.config['RAGTIME_SLOW_QUERY_MS']
+        self.keep = app.config['RAGTIME_QUERY_SLOWEST']
+        self.max_fingerprints = app.config['RAGTIME_QUERY_FINGERPRINTS']
+        # A child of the app's logger, so without a file of its own it goes wherever the app logs
+        self.logger = logging.getLogger(f'{app.logger.name}.slow_queries')
+        self.logger.setLevel(logging.INFO)
+        path = app.config['RAGTIME_SLOW_QUERY_LOG']
+        if path and not any(getattr(h, 'baseFilename', None) == path for h in self.logger.handlers):
+            handler = logging.FileHandler(path)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.logger.addHandler(handler)
+        self.logger.propagate = not path
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+    def start_request(self):
+        g.queries = RequestQueries(self.keep)
+
+    def finish_request(self, response):
+        queries = g.pop('queries', None)
+        if queries is not None and self.app.config['RAGTIME_QUERY_HEADERS']:
+            response.headers['X-DB-Query-Count'] = str(queries.count)
+            response.headers['X-DB-Time-Ms'] = f'{queries.total_ms:.2f}'
+            response.headers['X-DB-Slowest'] = ', '.join(
+                f'{fingerprint(statement)};dur={duration:.2f}'
+                for duration, statement in sorted(queries.slowest, reverse=True))
+        return response
+
+    def record(self, statement, duration_ms):
+        """Adds a statement that has just run to the request's and the process's totals
+
+        Args:
+            statement (string): SQL as sent to the database
+            duration_ms (float): How long it took, in milliseconds
+        """
+        normalized = normalize(statement)
+        key = fingerprint(normalized)
+        in_request = has_request_context()
+        if in_request and 'queries' in g:
+            g.queries.add(normalized, duration_ms)
+        with self._lock:
+            totals = self._totals.get(key)
+            if totals is None:
+                # Past the limit, new fingerprints aren't tracked so memory stays bounded
+                if len(self._totals) >= self.max_fingerprints:
+                    totals = None
+                else:
+                    totals = self._totals[key] = [normalized, 0, 0.0, 0.0]
+            if totals is not None:
+                totals[1] += 1
+                totals[2] += duration_ms
+                totals[3] = max(totals[3], duration_ms)
+        if duration_ms >= self.slow_ms:
+            self.logger.info(json.dumps({
+                'timestamp': datetime.utcnow().isoformat() + 'Z',
+                'fingerprint': key,
+                'statement': normalized,
+                'duration_ms': round(duration_ms, 2),
+                'endpoint': request.endpoint if in_request else None,
+                'method': request.method if in_request else None,
+                'path': request.path if in_request else None,
+            }))
+
+    def top(self, limit=50):
+        """Returns the statements that took the most time in total in this process, slowest first
+
+        Args:
+            limit (int, optional): How many to return. Defaults to 50.
+        """
+        with self._lock:
+            totals = [{'fingerprint': key, 'statement': statement, 'count': count,
+                       'total_ms': total, 'mean_ms': total / count, 'max_ms': most}
+                      for key, (statement, count, total, most) in self._totals.items()]
+        return sorted(totals, key=lambda t: t['total_ms'], reverse=True)[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+
+    @staticmethod
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @staticmethod
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info['query_start'].pop()
+        query_stats.record(statement, (time.perf_counter() - start) * 1000)
+
+    @staticmethod
+    def handle_error(exception_context):
+        # A failed statement never reaches after_cursor_execute
+        conn = exception_context.connection
+        if conn is not None and conn.info.get('query_start'):
+            conn.info['query_start'].pop()
+
+
+query_stats = QueryStats()
+
+# Listening on the Engine class covers every engine the app creates
+db.event.listen(Engine, 'before_cursor_execute', QueryStats.before_cursor_execute)
+db.event.listen(Engine, 'after_cursor_execute', QueryStats.after_cursor_execute)
+db.event.listen(Engine, 'handle_error', QueryStats.handle_error)
@@ -0,0 +1,116 @@
+import random
+import time
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+from sqlalchemy.sql.expression import CompoundSelect, Select, TextClause
+
+# Requests that only read, and so can be answered from a replica
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def _is_read(clause):
+    # Anything that isn't plainly a SELECT, or that locks rows, goes to the primary
+    if isinstance(clause, (Select, CompoundSelect)):
+        return getattr(clause, '_for_update_arg', None) is None
+    if isinstance(clause, TextClause):
+        return clause.text.lstrip()[:6].upper() == 'SELECT'
+    return False
+
+
+def use_primary(view):
+    """Marks a view that writes even when it is requested with GET, so all of its reads go to the
+    primary too, e.g. checking whether a user already follows someone before following them
+    """
+    view.use_primary = True
+    return view
+
+
+def _primary_until():
+    # Until when the client's reads go to the primary, from its cookie or the header it sent back
+    try:
+        header = float(request.headers.get('X-DB-Primary-Until', 0))
+    except ValueError:
+        header = 0
+    # Never longer than a write would have made it
+    header = min(header, time.time() + current_app.config['RAGTIME_PRIMARY_STICKY_SECONDS'])
+    return max(session.get('db_primary_until', 0), header)
+
+
+class RoutingSession(SignallingSession):
+    """Session that sends the reads of read-only requests to a replica.
+
+    Flushes and any other statement that writes go to the primary, and once a request has
+    written, the rest of its reads go to the primary as well so it sees its own changes.
+    Outside of requests (the shell, CLI commands, background threads) everything uses the primary.
+    """
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if mapper is not None and mapper.persist_selectable.info.get('bind_key') is not None:
+            return super().get_bind(mapper, clause)
+        if not has_request_context():
+            return super().get_bind(mapper, clause)
+        if self._flushing or not _is_read(clause):
+            g.db_wrote = True
+            g.db_replica = None
+            return super().get_bind(mapper, clause)
+        replica = g.get('db_replica')
+        if replica is not None:
+            return self.db.get_engine(self.app, bind=replica)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with read replicas.
+
+    SQLALCHEMY_REPLICA_URIS lists the replicas, which are registered as the binds replica_0,
+    replica_1, and so on. Each GET, HEAD or OPTIONS request reads from one of them at random,
+    unless the same browser or user wrote something in the last RAGTIME_PRIMARY_STICKY_SECONDS, so
+    users always see their own changes even while the replicas catch up, whichever process serves
+    them. The client carries the time back itself: browsers in their session cookie, and API clients,
+    which may not keep cookies, by sending back the X-DB-Primary-Until header of the response that
+    wrote. The header can only send a client's own reads to the primary, for a limited time.
+    """
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def init_app(self, app):
+        replicas = app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+        if replicas:
+            binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+            binds.update((f'replica_{i}', uri) for i, uri in enumerate(replicas))
+            app.config['SQLALCHEMY_BINDS'] = binds
+        super().init_app(app)
+        app.before_request(self._route_request)
+        app.after_request(self._remember_write)
+
+    def dispose_engines(self, app):
+        """Closes the connections of every engine, the primary's and each bind's, replicas included.
+        Connections can't be shared with a forked process.
+
+        Args:
+            app (class - Flask): The app the engines belong to
+        """
+        with app.app_context():
+            for bind in [None] + list(app.config.get('SQLALCHEMY_BINDS') or ()):
+                self.get_engine(app, bind).dispose()
+
+    def _route_request(self):
+        g.db_wrote = False
+        g.db_replica = None
+        replicas = current_app.config['SQLALCHEMY_REPLICA_URIS']
+        view = current_app.view_functions.get(request.endpoint)
+        if replicas and request.method in READ_METHODS and not getattr(view, 'use_primary', False) and \
+                _primary_until() <= time.time():
+            g.db_replica = f'replica_{random.randrange(len(replicas))}'
+
+    def _remember_write(self, response):
+        if g.get('db_wrote'):
+            until = time.time() + current_app.config['RAGTIME_PRIMARY_STICKY_SECONDS']
+            session['db_primary_until'] = until
+            response.headers['X-DB-Primary-Until'] = f'{until:.3f}'
+        return response
@@ -0,0 +1,100 @@
+import re
+from . import db
+
+# Full-text search over composition titles and descriptions.
+#
+# SQLite (development and testing) keeps an FTS5 table, compositions_fts, whose rowid is the
+# composition id. Postgres (production) keeps a weighted tsvector column on compositions with a
+# GIN index. Both are created alongside the compositions table (see models.py and the
+# composition search migration) and kept up to date after every flush that creates, edits or
+# deletes compositions.
+
+SQLITE_CREATE = 'CREATE VIRTUAL TABLE IF NOT EXISTS compositions_fts USING fts5(title, description)'
+SQLITE_DROP = 'DROP TABLE IF EXISTS compositions_fts'
+POSTGRES_CREATE = ('ALTER TABLE compositions ADD COLUMN IF NOT EXISTS search_vector tsvector',
+                   'CREATE INDEX IF NOT EXISTS ix_compositions_search_vector '
+                   'ON compositions USING gin(search_vector)')
+POSTGRES_VECTOR = ("setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+                   "setweight(to_tsvector('english', coalesce(description, '')), 'B')")
+
+
+def _dialect(bind):
+    return bind.dialect.name
+
+
+def index(connection, compositions):
+    """Adds or refreshes compositions in the search index.
+
+    Args:
+        connection (Connection): Database connection to write the index with
+        compositions (list): Compositions that have been flushed to the database
+    """
+    if not compositions:
+        return
+    if _dialect(connection) == 'postgresql':
+        connection.execute(db.text(f'UPDATE compositions SET search_vector = {POSTGRES_VECTOR} '
+                                   'WHERE id = :id'),
+                           [{'id': c.id} for c in compositions])
+    elif _dialect(connection) == 'sqlite':
+        remove(connection, [c.id for c in compositions])
+        connection.execute(db.text('INSERT INTO compositions_fts (rowid, title, description) '
+                                   'VALUES (:id, :title, :description)'),
+                           [{'id': c.id, 'title': c.title, 'description': c.description}
+                            for c in compositions])
+
+
+def remove(connection, ids):
+    """Removes compositions from the search index. On Postgres the index lives in the row itself.
+
+    Args:
+        connection (Connection): Database connection to write the index with
+        ids (list): IDs of the compositions to remove
+    """
+    if ids and _dialect(connection) == 'sqlite':
+        connection.execute(db.text('DELETE FROM compositions_fts WHERE rowid = :id'),
+                           [{'id': i} for i in ids])
+
+
+def reindex():
+    """Rebuilds the whole search index from the compositions table.
+    """
+    if _dialect(db.engine) == 'postgresql':
+        db.session.execute(db.text(f'UPDATE compositions SET search_vector = {POSTGRES_VECTOR}'))
+    elif _dialect(db.engine) == 'sqlite':
+        db.session.execute(db.text('DELETE FROM compositions_fts'))
+        db.session.execute(db.text('INSERT INTO compositions_fts (rowid, title, description) '
+                                   'SELECT id, title, description FROM compositions'))
+    db.session.commit()
+
+
+def _fts5_query(terms):
+    # Quote every word so punctuation in the search box can't be read as FTS5 syntax, and
+    # let the last word match as a prefix for search-as-you-type
+    words = re.findall(r'\w+', terms)
+    if not words:
+        return None
+    return ' '.join(f'"{w}"' for w in words) + '*'
+
+
+def matches(terms):
+    """Returns a subquery of (id, score) for compositions matching the search terms, best
+    matches having the highest score, or None if there is nothing to search for.
+
+    Args:
+        terms (string): What the user typed in the search box
+    """
+    if _dialect(db.engine) == 'postgresql':
+        if not terms.strip():
+            return None
+        sql = db.text("SELECT id, ts_rank(search_vector, plainto_tsquery('english', :terms)) AS score "
+                      "FROM compositions WHERE search_vector @@ plainto_tsquery('english', :terms)") \
+            .bindparams(terms=terms)
+    else:
+        terms = _fts5_query(terms)
+        if terms is None:
+            return None
+        # bm25() is better the lower it is, and titles count for more than descriptions
+        sql = db.text('SELECT rowid AS id, -bm25(compositions_fts, 10.0, 1.0) AS score '
+                      'FROM compositions_fts WHERE compositions_fts MATCH :terms') \
+            .bindparams(terms=terms)
+    return sql.columns(id=db.Integer, score=db.Float).alias('matches')
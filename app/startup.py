@@ -0,0 +1,140 @@
+"""Warm-up for preloaded servers, and startup time measurement.
+
+`flask startup-time` runs measure() in a fresh interpreter under `python -X importtime`, so
+it can report how long each package took to import as well as each step of create_app().
+"""
+import json
+import re
+import subprocess
+import sys
+from time import perf_counter
+
+# A line of `python -X importtime` output: self and cumulative microseconds, then the module
+# name indented by how deeply it was imported
+_IMPORTTIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+
+def warm_up(app):
+    """Does the work every process would otherwise repeat on its first requests, so a server that
+    preloads the app does it once before forking its workers. Closes every database connection
+    afterwards, as connections must not be shared with forked processes.
+
+    Args:
+        app (class - Flask): The app to warm up
+
+    Returns:
+        dict: Seconds taken by each step
+    """
+    from flask import url_for
+    from . import db
+    from .models import Role
+    timings = {}
+
+    start = perf_counter()
+    for name in app.jinja_env.list_templates(extensions=['html', 'txt']):
+        app.jinja_env.get_template(name)
+    timings['templates'] = perf_counter() - start
+
+    start = perf_counter()
+    with app.app_context():
+        db.configure_mappers()
+        Role.query.all()
+        db.session.remove()
+    db.dispose_engines(app)
+    timings['roles'] = perf_counter() - start
+
+    start = perf_counter()
+    with app.test_request_context():
+        url_for('main.index')
+    timings['url_map'] = perf_counter() - start
+    return timings
+
+
+def _timed(function, name, timings):
+    def timed(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timings.append([name(*args) if callable(name) else name, perf_counter() - start])
+    return timed
+
+
+def measure(config_name='default'):
+    """Creates and warms up the app, timing every step. Only meaningful in a fresh process.
+
+    Args:
+        config_name (string, optional): The config to create the app with. Defaults to 'default'.
+
+    Returns:
+        dict: [name, seconds] pairs for 'create_app' and 'warm_up'
+    """
+    timings = {'create_app': [], 'warm_up': []}
+    from flask import Flask
+    import app as package
+    from .encoding import json_encoding
+    from .compression import compression
+    from .assets import static_manifest
+    from .cache import fragment_cache
+    from .last_seen import last_seen_buffer
+    from .profiler import profiler
+    from .metrics import metrics
+    from .query_stats import query_stats
+    from .email import mail_dispatcher
+    from .api.credentials import credential_cache
+    extensions = {'login_manager': package.login_manager, 'mail': package.mail, 'csrf': package.csrf,
+                  'bootstrap': package.bootstrap, 'moment': package.moment, 'db': package.db,
+                  'json_encoding': json_encoding, 'compression': compression,
+                  'static_manifest': static_manifest, 'fragment_cache': fragment_cache,
+                  'last_seen_buffer': last_seen_buffer, 'profiler': profiler, 'metrics': metrics,
+                  'query_stats': query_stats, 'mail_dispatcher': mail_dispatcher, 'credential_cache': credential_cache}
+    steps = timings['create_app']
+    for name, extension in extensions.items():
+        extension.init_app = _timed(extension.init_app, name, steps)
+    Flask.register_blueprint = _timed(Flask.register_blueprint,
+                                      lambda app, blueprint, **options: f'blueprint {blueprint.name}', steps)
+
+    start = perf_counter()
+    app = package.create_app(config_name)
+    total = perf_counter() - start
+    steps.append(['other', total - sum(seconds for name, seconds in steps)])
+    steps.append(['total', total])
+
+    timings['warm_up'] = [[name, seconds] for name, seconds in warm_up(app).items()]
+    return timings
+
+
+def parse_importtime(output, limit=20):
+    """Returns the packages that took longest to import, from `python -X importtime` output
+
+    Args:
+        output (string): What the interpreter wrote to stderr
+        limit (int, optional): How many packages to return. Defaults to 20.
+
+    Returns:
+        list: [package, seconds] pairs, slowest first. A package's time includes what it imported.
+    """
+    packages = {}
+    for line in output.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match and '.' not in match.group(4):
+            packages[match.group(4)] = int(match.group(2)) / 1e6
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+def measure_fresh(config_name='default', cwd=None):
+    """Runs measure() in a new interpreter, so nothing has been imported yet
+
+    Args:
+        config_name (string, optional): The config to create the app with. Defaults to 'default'.
+        cwd (string, optional): Directory the app package is in. Defaults to the current one.
+
+    Returns:
+        dict: [name, seconds] pairs for 'imports', 'create_app' and 'warm_up'
+    """
+    code = 'import json, sys; from app.startup import measure; print(json.dumps(measure(sys.argv[1])))'
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code, config_name],
+                            cwd=cwd, capture_output=True, text=True, check=True)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['imports'] = parse_importtime(result.stderr)
+    return timings
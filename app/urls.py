@@ -0,0 +1,43 @@
+import re
+from flask import current_app, has_request_context, request, url_for
+
+# A variable in a URL rule, e.g. <int:id>
+_VARIABLE = re.compile(r'<(?:[^:<>]+:)?([^<>]+)>')
+
+
+def url_template(app, endpoint):
+    """Returns a str.format() template for an endpoint's URL, built once per app from its URL rule.
+    Only for endpoints with a single rule whose variables need no escaping, like integer ids.
+
+    Args:
+        app (class - Flask): The app the endpoint belongs to
+        endpoint (string): The endpoint, e.g. 'api.get_user'
+
+    Returns:
+        string: e.g. '/api/v1/users/{id}', or None if the endpoint has several rules, as which of
+        them url_for() picks depends on the values
+    """
+    templates = app.extensions.setdefault('url_templates', {})
+    try:
+        return templates[endpoint]
+    except KeyError:
+        pass
+    rules = list(app.url_map.iter_rules(endpoint))
+    template = templates[endpoint] = _VARIABLE.sub(r'{\1}', rules[0].rule) if len(rules) == 1 else None
+    return template
+
+
+def fast_url_for(endpoint, **values):
+    """Builds the same URL as url_for(endpoint, **values) from url_template(), which is many times
+    faster when serializing long lists of objects. Endpoints with several rules go through url_for().
+
+    Args:
+        endpoint (string): The endpoint, e.g. 'api.get_user'
+        values: The URL's variables, e.g. id=1
+    """
+    template = url_template(current_app, endpoint)
+    if template is None:
+        return url_for(endpoint, **values)
+    if has_request_context():
+        return request.script_root + template.format(**values)
+    return template.format(**values)
@@ -0,0 +1,205 @@
+"""Benchmarks for Ragtime's hot endpoints.
+
+Seeds a dataset of the chosen size (cached in benchmarks/data/ for later runs), drives each
+endpoint through the Flask test client and reports latency percentiles, SQL statements and peak
+memory allocated per request. Results can be saved as a baseline and later runs compared with it:
+
+    python -m benchmarks.run --size small --save
+    python -m benchmarks.run --size small
+
+The comparison fails (exit status 1) when an endpoint's p95 latency grows by more than the
+tolerance or it sends more SQL statements than in the baseline.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from base64 import b64encode
+from statistics import quantiles
+
+from app import create_app, db, fake
+from app.api.credentials import credential_cache
+from app.models import Role, User
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+DATASETS = {
+    'small': {'users': 200, 'follows': 10, 'compositions': 1000},
+    'medium': {'users': 5000, 'follows': 20, 'compositions': 25000},
+    'large': {'users': 50000, 'follows': 20, 'compositions': 250000},
+}
+BASELINE = os.path.join(here, 'baseline.json')
+
+
+def make_app(size, seed):
+    """Returns an app using the dataset of the given size, seeding it the first time
+    """
+    path = os.path.join(here, 'data', f'{size}-{seed}.sqlite')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    app = create_app('testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    with app.app_context():
+        if not os.path.exists(path) or User.query.count() == 0:
+            db.create_all()
+            Role.insert_roles()
+            fake.seed(seed=seed, processes=os.cpu_count(), **DATASETS[size])
+    return app
+
+
+def scenarios(app):
+    """Returns (name, request) pairs for the endpoints to measure
+    """
+    with app.app_context():
+        # A popular artist, and a reader who follows more people than most
+        star = User.query.order_by(User.followers_count.desc()).first()
+        readers = User.query.order_by(User.following_count.desc())
+        reader = readers.offset(readers.count() // 10).first()
+        token = reader.generate_auth_token(expiration_sec=3600)
+        star_name, reader_id = star.username, reader.id
+    token_auth = {'Authorization': 'Basic ' + b64encode(f'{token}:'.encode('utf-8')).decode('utf-8')}
+
+    def logged_in(client):
+        with client.session_transaction() as session:
+            session['_user_id'] = str(reader_id)
+            session['_fresh'] = True
+
+    def uncached(client):
+        credential_cache.clear()
+
+    return [
+        ('main.index (all)', dict(path='/')),
+        ('main.index (followed)', dict(path='/', setup=logged_in, cookie=('show_followed', '1'))),
+        ('main.user', dict(path=f'/user/{star_name}')),
+        ('main.followers', dict(path=f'/followers/{star_name}')),
+        ('api.get_compositions', dict(path='/api/v1/compositions/', headers=token_auth)),
+        ('api.get_user_followed', dict(path=f'/api/v1/users/{reader_id}/followed/', headers=token_auth)),
+        ('token auth (cached)', dict(path='/api/v1/', headers=token_auth)),
+        ('token auth (uncached)', dict(path='/api/v1/', headers=token_auth, before=uncached)),
+    ]
+
+
+def measure(app, request, iterations, warmup):
+    """Runs one request repeatedly and returns its timings, statement count and peak allocation
+    """
+    client = app.test_client()
+    if 'setup' in request:
+        request['setup'](client)
+    if 'cookie' in request:
+        client.set_cookie('localhost', *request['cookie'])
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    def get():
+        if 'before' in request:
+            request['before'](client)
+        response = client.get(request['path'], headers=request.get('headers', {}))
+        if response.status_code != 200:
+            raise RuntimeError(f"{request['path']} returned {response.status_code}")
+
+    with app.app_context():
+        engine = db.get_engine()
+    for i in range(warmup):
+        get()
+    timings = []
+    for i in range(iterations):
+        statements.clear()
+        db.event.listen(engine, 'before_cursor_execute', count)
+        start = time.perf_counter()
+        get()
+        timings.append((time.perf_counter() - start) * 1000)
+        db.event.remove(engine, 'before_cursor_execute', count)
+    queries = len(statements)
+
+    # Allocations are measured separately, tracing slows everything down
+    peaks = []
+    tracemalloc.start()
+    for i in range(min(iterations, 10)):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        get()
+        peaks.append((tracemalloc.get_traced_memory()[1] - current) / 1024)
+    tracemalloc.stop()
+
+    percentiles = quantiles(timings, n=100, method='inclusive')
+    return {'p50_ms': round(percentiles[49], 3),
+            'p95_ms': round(percentiles[94], 3),
+            'p99_ms': round(percentiles[98], 3),
+            'queries': queries,
+            'peak_kib': round(sorted(peaks)[len(peaks) // 2], 1),
+            'iterations': iterations}
+
+
+def compare(results, baseline, tolerance):
+    """Prints how results differ from the baseline and returns the regressions
+    """
+    regressions = []
+    for size, endpoints in results.items():
+        for name, current in endpoints.items():
+            before = baseline.get(size, {}).get(name)
+            if before is None:
+                continue
+            change = current['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0
+            flags = []
+            if change > tolerance:
+                flags.append(f'p95 {change:+.0%}')
+            if current['queries'] > before['queries']:
+                flags.append(f"queries {before['queries']} -> {current['queries']}")
+            print(f"{size:<7} {name:<26} p95 {before['p95_ms']:>8.2f} -> {current['p95_ms']:>8.2f} ms "
+                  f"({change:+.0%})  {'REGRESSION: ' + ', '.join(flags) if flags else 'ok'}")
+            if flags:
+                regressions.append((size, name, flags))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', action='append', choices=DATASETS,
+                        help='Dataset to run against, can be repeated. Defaults to small.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the fake data.')
+    parser.add_argument('--iterations', type=int, default=200, help='Timed requests per endpoint.')
+    parser.add_argument('--warmup', type=int, default=20, help='Untimed requests per endpoint first.')
+    parser.add_argument('--baseline', default=BASELINE, help='Baseline JSON to compare with or save to.')
+    parser.add_argument('--save', action='store_true', help='Save the results as the baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed p95 slowdown against the baseline. Defaults to 0.25 (25%%).')
+    parser.add_argument('--output', help='Also write the results to this JSON file.')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for size in args.size or ['small']:
+        app = make_app(size, args.seed)
+        results[size] = {}
+        print(f"{size:<7} {'endpoint':<26} {'p50':>8} {'p95':>8} {'p99':>8} {'queries':>8} {'peak KiB':>9}")
+        for name, request in scenarios(app):
+            result = measure(app, request, args.iterations, args.warmup)
+            results[size][name] = result
+            print(f"{size:<7} {name:<26} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+                  f"{result['p99_ms']:>8.2f} {result['queries']:>8} {result['peak_kib']:>9.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Saved baseline to {args.baseline}')
+        return 0
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""Per-item cost of serializing API pages.
+
+Serializes 1,000 compositions and users from a benchmark dataset the way the API does, with all
+fields, with a sparse fieldset and, for comparison, with URLs built by url_for() for every item:
+
+    python -m benchmarks.serialization --size small
+"""
+import argparse
+import sys
+import time
+from statistics import median
+
+from flask import url_for
+
+from app.encoding import json_encoding
+from app.models import Composition, User
+from .run import DATASETS, make_app
+
+
+def _url_for_composition(composition):
+    # How Composition.to_json() worked before the URL templates
+    return {
+        'url': url_for('api.get_composition', id=composition.id),
+        'release_type': composition.release_type,
+        'title': composition.title,
+        'description': composition.description,
+        'description_html': composition.description_html,
+        'timestamp': composition.timestamp,
+        'artist_url': url_for('api.get_user', id=composition.artist_id),
+    }
+
+
+def _url_for_user(user):
+    return {
+        'url': url_for('api.get_user', id=user.id),
+        'username': user.username,
+        'last seen': user.last_seen,
+        'compositions_url': url_for('api.get_user_compositions', id=user.id),
+        'followed_compositions_url': url_for('api.get_user_followed', id=user.id),
+        'composition count': user.compositions_count,
+    }
+
+
+def time_per_item(items, serialize, repeat):
+    """Returns the median microseconds per item to build the items' dicts, and to also encode them
+    """
+    building, encoding = [], []
+    for i in range(repeat):
+        start = time.perf_counter()
+        data = [serialize(item) for item in items]
+        built = time.perf_counter()
+        json_encoding.dumps(data)
+        building.append((built - start) / len(items) * 1e6)
+        encoding.append((time.perf_counter() - start) / len(items) * 1e6)
+    return median(building), median(encoding)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', default='small', choices=DATASETS, help='Dataset to run against.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the fake data.')
+    parser.add_argument('--items', type=int, default=1000, help='Items per page.')
+    parser.add_argument('--repeat', type=int, default=20, help='Times to serialize each page.')
+    args = parser.parse_args(argv)
+
+    app = make_app(args.size, args.seed)
+    print(f'Encoding with {json_encoding.library}')
+    with app.test_request_context('/api/v1/'):
+        compositions = Composition.query.order_by(Composition.id).limit(args.items).all()
+        users = User.query.order_by(User.id).limit(args.items).all()
+        cases = [
+            ('compositions', compositions, 'url_for', _url_for_composition),
+            ('compositions', compositions, 'all fields', lambda c: c.to_json()),
+            ('compositions', compositions, 'fields=title,url', lambda c: c.to_json({'title', 'url'})),
+            ('users', users, 'url_for', _url_for_user),
+            ('users', users, 'all fields', lambda u: u.to_json()),
+            ('users', users, 'fields=username,url', lambda u: u.to_json({'username', 'url'})),
+        ]
+        print(f"{'objects':<13} {'serialization':<22} {'items':>6} {'to_json us':>11} {'+ encode us':>12}")
+        for name, items, variant, serialize in cases:
+            building, encoding = time_per_item(items, serialize, args.repeat)
+            print(f'{name:<13} {variant:<22} {len(items):>6} {building:>11.2f} {encoding:>12.2f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
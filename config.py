@@ -11,6 +11,11 @@ class Config:
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Read replicas for GET requests (comma separated URLs), and how long a client that has just
+    # written keeps reading from the primary so it sees its own changes
+    SQLALCHEMY_REPLICA_URIS = [url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url]
+    RAGTIME_PRIMARY_STICKY_SECONDS = 10
+
     # Email configurations
     MAIL_SERVER = 'smtp.gmail.com'
     MAIL_PORT = 587
@@ -25,6 +30,67 @@ class Config:
     RAGTIME_COMPS_PER_PAGE = 20
     RAGTIME_FOLLOWERS_PER_PAGE = 20
 
+    # Rendered compositions kept in memory by each process, 0 turns the cache off
+    RAGTIME_FRAGMENT_CACHE_SIZE = 5000
+
+    # User.last_seen is written at most once per resolution, in batches every flush interval (0 writes at once)
+    RAGTIME_LAST_SEEN_RESOLUTION = 60
+    RAGTIME_LAST_SEEN_FLUSH_INTERVAL = 15
+
+    # Verified API credentials kept in memory by each process, 0 turns the cache off
+    RAGTIME_CREDENTIAL_CACHE_SIZE = 10000
+    RAGTIME_CREDENTIAL_CACHE_TTL = 300
+
+    # Bulk composition import through the API
+    RAGTIME_BULK_BATCH_SIZE = 500
+    RAGTIME_BULK_MAX_ITEMS = 10000
+
+    # Rows read from the database at a time by the streaming API exports
+    RAGTIME_EXPORT_BATCH_SIZE = 1000
+
+    # JSON library for API responses ('orjson', 'ujson' or 'json', which is used when the others
+    # aren't installed), and the list length above which responses are streamed in chunks that long
+    RAGTIME_JSON_LIBRARY = os.environ.get('RAGTIME_JSON_LIBRARY') or 'orjson'
+    RAGTIME_JSON_CHUNK_SIZE = 500
+
+    # Responses smaller than this many bytes aren't compressed
+    RAGTIME_COMPRESS_MIN_SIZE = 500
+    RAGTIME_GZIP_LEVEL = 6
+    RAGTIME_BROTLI_QUALITY = 5
+
+    # How long browsers keep fingerprinted static files, see app/assets.py
+    RAGTIME_STATIC_MAX_AGE = 31536000
+
+    # Avatars rendered by the app, kept on disk in a folder for each size, and how long browsers keep them
+    RAGTIME_AVATAR_DIR = os.environ.get('RAGTIME_AVATAR_DIR') or os.path.join(basedir, 'avatars')
+    RAGTIME_AVATAR_MAX_AGE = 604800
+
+    # Outgoing mail is saved to the outbox and sent by a fixed pool of workers (0 sends at once)
+    RAGTIME_MAIL_OUTBOX = os.environ.get('RAGTIME_MAIL_OUTBOX') or os.path.join(basedir, 'mail-outbox')
+    RAGTIME_MAIL_WORKERS = 2
+    RAGTIME_MAIL_QUEUE_SIZE = 1000
+    RAGTIME_MAIL_BATCH_SIZE = 50
+    RAGTIME_MAIL_RETRIES = 5
+
+    # SQL timing: X-DB-* response headers (not in production), the slow query log (a file, or the
+    # app's log if unset) and how many statement fingerprints /admin/queries keeps totals for
+    RAGTIME_QUERY_HEADERS = False
+    RAGTIME_QUERY_SLOWEST = 5
+    RAGTIME_SLOW_QUERY_MS = 100
+    RAGTIME_SLOW_QUERY_LOG = os.environ.get('RAGTIME_SLOW_QUERY_LOG')
+    RAGTIME_QUERY_FINGERPRINTS = 1000
+
+    # /metrics: a directory shared by every worker process so their numbers can be added up (each
+    # process only reports its own without one), and an optional bearer token scrapers must send
+    RAGTIME_METRICS_DIR = os.environ.get('RAGTIME_METRICS_DIR')
+    RAGTIME_METRICS_FLUSH_INTERVAL = 1
+    RAGTIME_METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    RAGTIME_METRICS_TOKEN = os.environ.get('RAGTIME_METRICS_TOKEN')
+
+    # Requests profiled on demand by administrators, see app/profiler.py
+    RAGTIME_PROFILE_DIR = os.environ.get('RAGTIME_PROFILE_DIR') or os.path.join(basedir, 'profiles')
+    RAGTIME_PROFILE_KEEP = 50
+
     HTTPS_REDIRECT = False
 
     @staticmethod
@@ -34,14 +100,19 @@ class Config:
 # Development Configuration
 class DevelopmentConfig(Config):
     DEBUG = True
+    RAGTIME_QUERY_HEADERS = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_DEV_URL') or \
         f'sqlite:///{os.path.join(basedir, "data-dev.sqlite")}'
 
 # Testing Configuration
 class TestingConfig(Config):
     TESTING = True
+    RAGTIME_QUERY_HEADERS = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_TEST_URL') or \
         f'sqlite:///{os.path.join(basedir, "data-test.sqlite")}'
+    RAGTIME_MAIL_OUTBOX = os.path.join(basedir, 'mail-outbox-test')
+    RAGTIME_MAIL_WORKERS = 0
+    RAGTIME_AVATAR_DIR = os.path.join(basedir, 'avatars-test')
 
 # Production Configuration
 class ProductionConfig(Config):
@@ -0,0 +1,42 @@
+# Gunicorn settings, see the Procfile: gunicorn -c gunicorn.conf.py ragtime:app
+import glob
+import os
+
+# Create and warm up the app once in the master process, then fork it into the workers, rather
+# than every worker importing and creating its own
+preload_app = True
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+
+
+def when_ready(server):
+    from ragtime import app
+    from app.email import mail_dispatcher
+    from app.startup import warm_up
+    timings = warm_up(app)
+    server.log.info('Warmed up in %.0f ms (%s)', sum(timings.values()) * 1000,
+                    ', '.join(f'{step} {seconds * 1000:.0f} ms' for step, seconds in timings.items()))
+    # The workers send the mail, each with its own pool started after the fork
+    mail_dispatcher.stop()
+    # Metrics from before a restart would otherwise be added to the new workers', see app/metrics.py
+    if app.config['RAGTIME_METRICS_DIR']:
+        for path in glob.glob(os.path.join(app.config['RAGTIME_METRICS_DIR'], '*.json')):
+            os.remove(path)
+
+
+def post_fork(server, worker):
+    # Connections can't be shared between processes, so each worker opens its own. warm_up()
+    # already closed the master's, this makes sure of it.
+    from ragtime import app
+    from app import db
+    from app.email import mail_dispatcher
+    db.dispose_engines(app)
+    mail_dispatcher.start()
+
+
+def worker_exit(server, worker):
+    # Write what the worker's background threads still hold before it goes
+    from app.last_seen import last_seen_buffer
+    from app.metrics import metrics
+    last_seen_buffer.stop()
+    if metrics.directory:
+        metrics.flush()
@@ -71,6 +71,17 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    # the search index is managed by hand (see app/search.py), so autogenerate
+    # should neither drop it nor try to recreate it
+    def include_object(object, name, type_, reflected, compare_to):
+        if type_ == 'table' and name.startswith('compositions_fts'):
+            return False
+        if type_ == 'column' and name == 'search_vector':
+            return False
+        if type_ == 'index' and name == 'ix_compositions_search_vector':
+            return False
+        return True
+
     connectable = current_app.extensions['migrate'].db.get_engine()
 
     with connectable.connect() as connection:
@@ -78,6 +89,7 @@ def run_migrations_online():
             connection=connection,
             target_metadata=target_metadata,
             process_revision_directives=process_revision_directives,
+            include_object=include_object,
             **current_app.extensions['migrate'].configure_args
         )
 
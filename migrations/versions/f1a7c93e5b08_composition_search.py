@@ -0,0 +1,40 @@
+"""composition search
+
+Revision ID: f1a7c93e5b08
+Revises: e6d04b8a3c15
+Create Date: 2026-10-18 14:05:33.718204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a7c93e5b08'
+down_revision = 'e6d04b8a3c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Full-text index, see app/search.py. SQLite uses an FTS5 table and Postgres a GIN indexed tsvector.
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute('CREATE VIRTUAL TABLE compositions_fts USING fts5(title, description)')
+        op.execute('INSERT INTO compositions_fts (rowid, title, description) '
+                   'SELECT id, title, description FROM compositions')
+    elif dialect == 'postgresql':
+        op.execute('ALTER TABLE compositions ADD COLUMN search_vector tsvector')
+        op.execute('CREATE INDEX ix_compositions_search_vector ON compositions USING gin(search_vector)')
+        op.execute("UPDATE compositions SET search_vector = "
+                   "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+                   "setweight(to_tsvector('english', coalesce(description, '')), 'B')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute('DROP TABLE compositions_fts')
+    elif dialect == 'postgresql':
+        op.execute('DROP INDEX ix_compositions_search_vector')
+        op.execute('ALTER TABLE compositions DROP COLUMN search_vector')
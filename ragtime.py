@@ -1,6 +1,7 @@
-from app import create_app, db
-from app.models import Composition, Role, User, Follow
+from app import create_app, db, descriptions, search
+from app.models import Composition, Role, User, Follow, Timeline
 import os
+import click
 from flask_migrate import Migrate, upgrade
 
 # Create app from FLASK_CONFIG environment variable config or default config
@@ -13,7 +14,8 @@ def make_shell_context():
     """Provides database tables/classes for flask shell sessions
     so they do not need to be called every time
     """
-    return dict(db=db, Role=Role, User=User, Composition=Composition, Follow=Follow)
+    return dict(db=db, Role=Role, User=User, Composition=Composition, Follow=Follow,
+                Timeline=Timeline)
 
 @app.cli.command()
 def deploy():
@@ -24,3 +26,57 @@ def deploy():
     Role.insert_roles()
 
     User.add_self_follows()
+
+    # Static files get fingerprinted copies browsers can cache forever, and everything is then
+    # precompressed rather than compressed on every request
+    from app.assets import static_manifest
+    from app.compression import compression
+    static_manifest.build(app.static_folder)
+    compression.precompress(app.static_folder)
+
+@app.cli.command('rebuild-timelines')
+def rebuild_timelines():
+    """Rebuild every user's home timeline from the follows table"""
+    Timeline.rebuild()
+
+@app.cli.command('reconcile-counters')
+def reconcile_counters():
+    """Recount every user's followers, following and compositions"""
+    User.reconcile_counters()
+
+@app.cli.command('reindex-search')
+def reindex_search():
+    """Rebuild the composition full-text search index"""
+    search.reindex()
+
+@app.cli.command('render-descriptions')
+@click.option('--processes', type=int, default=None, help='Worker processes, defaults to the number of CPUs.')
+@click.option('--chunk-size', type=int, default=1000, help='Compositions rendered at a time.')
+def render_descriptions(processes, chunk_size):
+    """Re-render composition descriptions after the sanitizer changes"""
+    rendered = descriptions.render_all(processes, chunk_size)
+    click.echo(f'Rendered {rendered} descriptions')
+
+@app.cli.command()
+@click.option('--users', type=int, default=1000, help='Users to create.')
+@click.option('--follows', type=int, default=20, help='Average number of users each new user follows.')
+@click.option('--compositions', type=int, default=5000, help='Compositions to create.')
+@click.option('--seed', 'seed_', type=int, default=0, help='The same seed creates the same data.')
+@click.option('--processes', type=int, default=os.cpu_count(), help='Processes generating rows.')
+@click.option('--batch-size', type=int, default=1000, help='Rows generated and inserted at a time.')
+def seed(users, follows, compositions, seed_, processes, batch_size):
+    """Fill the database with fake data, e.g. for load testing"""
+    from app import fake
+    fake.seed(users, follows, compositions, seed_, processes, batch_size)
+
+@app.cli.command('startup-time')
+@click.option('--config', 'config_name', default=os.getenv('FLASK_CONFIG') or 'default',
+              help='Config to create the app with.')
+def startup_time(config_name):
+    """Measure how long a new process takes to import, create and warm up the app"""
+    from app.startup import measure_fresh
+    timings = measure_fresh(config_name, cwd=os.path.dirname(os.path.abspath(__file__)))
+    for section in ('imports', 'create_app', 'warm_up'):
+        click.echo(section)
+        for name, seconds in timings[section]:
+            click.echo(f'  {name:<32} {seconds * 1000:8.1f} ms')
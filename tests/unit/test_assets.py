@@ -0,0 +1,48 @@
+import gzip
+import os
+import shutil
+from flask import current_app, url_for
+from app.assets import static_manifest
+from app.compression import compression
+
+def test_fingerprinted_static(new_app, tmp_path):
+    """Tests that static files are linked through their fingerprinted copies, which are cached
+    for a year, and that the copies are precompressed too.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+        tmp_path (Path): pytest's temporary directory
+    """
+    app = current_app._get_current_object()
+    folder = str(tmp_path / 'static')
+    shutil.copytree(app.static_folder, folder, ignore=shutil.ignore_patterns('dist', '*.gz', '*.br'))
+    original = app.static_folder
+    app.static_folder = folder
+    try:
+        files = static_manifest.build(folder)
+        fingerprinted = files['styles.css']
+        assert fingerprinted.startswith('dist/styles.') and fingerprinted.endswith('.css')
+        assert static_manifest.build(folder) == files
+        compression.precompress(folder)
+        assert os.path.exists(os.path.join(folder, fingerprinted + '.gz'))
+        static_manifest.files = {}
+        static_manifest.load(folder)
+        assert static_manifest.files == files
+
+        with app.test_request_context():
+            assert url_for('static', filename='styles.css') == f'/static/{fingerprinted}'
+        page = new_app.get('/')
+        assert f'/static/{fingerprinted}'.encode('utf-8') in page.data
+
+        response = new_app.get(f'/static/{fingerprinted}', headers={'Accept-Encoding': 'gzip'})
+        assert response.cache_control.immutable
+        assert response.cache_control.max_age == 31536000
+        with open(os.path.join(folder, 'styles.css'), 'rb') as f:
+            assert gzip.decompress(response.data) == f.read()
+        response.close()
+        response = new_app.get('/static/styles.css')
+        assert not response.cache_control.immutable
+        response.close()
+    finally:
+        app.static_folder = original
+        static_manifest.load(original)
@@ -0,0 +1,70 @@
+import os
+import struct
+import zlib
+from flask import current_app
+from app import db
+from app.avatars.identicon import avatar_cache, bucket, render
+from app.models import User
+
+def _decode(data):
+    """Returns the width, height and rows of palette indexes of a PNG written by render()
+    """
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    chunks, offset = {}, 8
+    while offset < len(data):
+        length, = struct.unpack('>I', data[offset:offset + 4])
+        kind = data[offset + 4:offset + 8]
+        body = data[offset + 8:offset + 8 + length]
+        assert struct.unpack('>I', data[offset + 8 + length:offset + 12 + length])[0] == zlib.crc32(kind + body)
+        chunks[kind] = body
+        offset += 12 + length
+    width, height = struct.unpack('>II', chunks[b'IHDR'][:8])
+    pixels = zlib.decompress(chunks[b'IDAT'])
+    rows = [pixels[y * (width + 1) + 1:(y + 1) * (width + 1)] for y in range(height)]
+    return width, height, rows
+
+def test_render_identicon():
+    """Tests that identicons are valid, symmetric PNGs that only depend on the hash
+    """
+    avatar_hash = '0bc83cb571cd1c50ba6f3e8a78ef1346'
+    image = render(avatar_hash, 64)
+    assert image == render(avatar_hash, 64)
+    assert image != render('f' * 32, 64)
+    width, height, rows = _decode(image)
+    assert (width, height) == (64, 64)
+    assert all(row == row[::-1] for row in rows)
+    assert any(1 in row for row in rows)
+    assert [bucket(size) for size in (16, 35, 64, 100, 1000)] == [32, 64, 64, 128, 256]
+
+def test_avatar_route(new_app):
+    """Tests that avatars are served from the disk cache with validators and a long lifetime, and
+    that only users' avatars are cached
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    user = User(email='joplin@example.com', username='joplin')
+    db.session.add(user)
+    db.session.commit()
+    with current_app.test_request_context():
+        url = user.avatar(size=35)
+    assert url == f'/avatars/{user.email_hash()}.png?s=64'
+    response = new_app.get(url)
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+    assert response.cache_control.max_age == current_app.config['RAGTIME_AVATAR_MAX_AGE']
+    assert _decode(response.data)[:2] == (64, 64)
+    assert os.path.exists(avatar_cache.path(user.email_hash(), 64))
+    etag = response.headers['ETag']
+    response.close()
+    response = new_app.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    response.close()
+    assert new_app.get('/avatars/not-a-hash.png').status_code == 404
+
+    stranger = 'f' * 32
+    response = new_app.get(f'/avatars/{stranger}.png?s=32')
+    assert response.status_code == 200
+    assert _decode(response.data)[:2] == (32, 32)
+    response.close()
+    assert avatar_cache.cached(stranger, 32) is None
@@ -0,0 +1,56 @@
+import json
+from base64 import b64encode
+from app import db
+from app.models import User, Role, Composition
+
+def test_bulk_import(new_app):
+    """Tests that bulk imports insert valid compositions in batches with slugs, and report a
+    status for every item, from both JSON arrays and newline delimited JSON.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    Role.insert_roles()
+    artist = User(username='lamb', email='lamb@example.com', confirmed=True, password='cat')
+    db.session.add(artist)
+    db.session.commit()
+    new_app.application.config['RAGTIME_BULK_BATCH_SIZE'] = 2
+    headers = {'Authorization': 'Basic ' + b64encode(b'lamb@example.com:cat').decode('utf-8')}
+    items = [{'release_type': 1, 'title': f'Rag {i}', 'description': 'Classic rag'} for i in range(5)]
+    items.insert(2, {'release_type': 1, 'description': 'No title'})
+
+    response = new_app.post('/api/v1/compositions/bulk', json=items, headers=headers)
+    data = response.get_json()
+    assert (data['created'], data['failed']) == (5, 1)
+    assert [r['status'] for r in data['compositions']] == [201, 201, 400, 201, 201, 201]
+    assert data['compositions'][2]['message'] == 'Composition must have a title.'
+    rag = Composition.query.filter_by(title='Rag 3').first()
+    assert rag.slug == f'{rag.id}-rag-3'
+    assert data['compositions'][4]['slug'] == rag.slug
+
+    body = '\n'.join([json.dumps(items[0]), 'not json', '', json.dumps(items[1])])
+    response = new_app.post('/api/v1/compositions/bulk', data=body, headers=headers,
+                            content_type='application/x-ndjson')
+    data = response.get_json()
+    assert [r['status'] for r in data['compositions']] == [201, 400, 201]
+
+    artist = User.query.filter_by(username='lamb').first()
+    assert artist.compositions_count == 7
+    assert artist.followed_compositions.count() == 7
+    response = new_app.post('/api/v1/compositions/bulk', json={'title': 'Not a list'}, headers=headers)
+    assert response.status_code == 400
+
+    wrong_types = [{'release_type': 1, 'title': 5, 'description': 'Classic rag'},
+                   {'release_type': 0, 'title': 'Rag', 'description': 'Classic rag'},
+                   {'release_type': '1', 'title': 'Rag', 'description': 'Classic rag'},
+                   {'release_type': 1, 'title': 'Rag', 'description': ['Classic rag']}]
+    response = new_app.post('/api/v1/compositions/bulk', json=wrong_types, headers=headers)
+    data = response.get_json()
+    assert (data['created'], data['failed']) == (0, 4)
+    assert [(r['index'], r['status']) for r in data['compositions']] == [(0, 400), (1, 400), (2, 400), (3, 400)]
+    assert data['compositions'][0]['message'] == 'Composition title must be a string.'
+    response = new_app.post('/api/v1/compositions/', json=wrong_types[0], headers=headers)
+    assert response.status_code == 400
+    # The API is exempt from CSRF, so a request without credentials is turned away by its auth instead
+    response = new_app.post('/api/v1/compositions/bulk', json=items)
+    assert response.status_code == 401
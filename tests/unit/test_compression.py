@@ -0,0 +1,86 @@
+import gzip
+import json
+import os
+import shutil
+from base64 import b64encode
+from flask import current_app
+from app import db
+from app.compression import compression
+from app.models import User, Role, Composition
+
+def test_compress_responses(new_app):
+    """Tests that responses are gzipped for clients that accept it, except small ones, that
+    streamed responses are compressed too, and that compressed responses still revalidate.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    Role.insert_roles()
+    artist = User(username='scott', email='scott@example.com', confirmed=True, password='cat')
+    db.session.add(artist)
+    db.session.add_all([Composition(release_type=1, title=f'Rag {i}', description='Classic rag ' * 20,
+                                    artist=artist) for i in range(10)])
+    db.session.commit()
+    for composition in Composition.query.all():
+        composition.generate_slug()
+    auth = {'Authorization': 'Basic ' + b64encode(b'scott@example.com:cat').decode('utf-8')}
+    gzipped = dict(auth, **{'Accept-Encoding': 'gzip, deflate'})
+
+    plain = new_app.get('/api/v1/compositions/', headers=auth)
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.headers['Vary'] == 'Accept-Encoding'
+    response = new_app.get('/api/v1/compositions/', headers=gzipped)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert len(response.data) < len(plain.data)
+    assert json.loads(gzip.decompress(response.data)) == plain.get_json()
+    assert response.headers['ETag'] == 'W/' + plain.headers['ETag']
+    cached = new_app.get('/api/v1/compositions/', headers=dict(gzipped, **{'If-None-Match': response.headers['ETag']}))
+    assert cached.status_code == 304
+
+    small = new_app.get('/api/v1/', headers=gzipped)
+    assert 'Content-Encoding' not in small.headers
+
+    current_app.config['RAGTIME_EXPORT_BATCH_SIZE'] = 3
+    response = new_app.get('/api/v1/export/compositions', headers=gzipped)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert len(gzip.decompress(response.data).splitlines()) == 10
+
+    response = new_app.get('/user/scott', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert b'csrf_token' not in gzip.decompress(response.data)
+    assert 'Content-Encoding' not in new_app.get('/user/scott', headers={'Accept-Encoding': 'gzip;q=0'}).headers
+    # Pages with a CSRF token aren't compressed, see BREACH
+    for url in ('/', '/auth/login'):
+        response = new_app.get(url, headers={'Accept-Encoding': 'gzip'})
+        assert b'csrf_token' in response.data
+        assert 'Content-Encoding' not in response.headers
+
+def test_precompressed_static(new_app, tmp_path):
+    """Tests that precompressed static files are written once and sent to clients that accept them
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+        tmp_path (Path): pytest's temporary directory
+    """
+    app = current_app._get_current_object()
+    folder = str(tmp_path / 'static')
+    shutil.copytree(app.static_folder, folder)
+    original = app.static_folder
+    app.static_folder = folder
+    try:
+        written = compression.precompress(folder)
+        assert os.path.join(folder, 'styles.css.gz') in written
+        assert compression.precompress(folder) == []
+        with open(os.path.join(folder, 'styles.css'), 'rb') as f:
+            css = f.read()
+        response = new_app.get('/static/styles.css', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.mimetype == 'text/css'
+        assert gzip.decompress(response.data) == css
+        response.close()
+        response = new_app.get('/static/styles.css')
+        assert 'Content-Encoding' not in response.headers
+        assert response.data == css
+        response.close()
+    finally:
+        app.static_folder = original
@@ -0,0 +1,43 @@
+from base64 import b64encode
+from app import db
+from app.models import User, Composition
+
+def test_conditional_get(new_app):
+    """Tests that API GETs answer 304 to clients holding the current ETag or Last-Modified date,
+    and a full response once the resource has changed.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    artist = User(username='turpin', email='turpin@example.com', confirmed=True, password='cat')
+    composition = Composition(release_type=1, title='Harlem Rag', description='', artist=artist)
+    db.session.add_all([artist, composition])
+    db.session.commit()
+    headers = {'Authorization': 'Basic ' + b64encode(b'turpin@example.com:cat').decode('utf-8')}
+
+    url = f'/api/v1/compositions/{composition.id}'
+    response = new_app.get(url, headers=headers)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    last_modified = response.headers['Last-Modified']
+    response = new_app.get(url, headers=dict(headers, **{'If-None-Match': etag}))
+    assert response.status_code == 304
+    assert response.data == b''
+    response = new_app.get(url, headers=dict(headers, **{'If-Modified-Since': last_modified}))
+    assert response.status_code == 304
+
+    listing = new_app.get('/api/v1/compositions/', headers=headers)
+    response = new_app.get('/api/v1/compositions/', headers=dict(headers, **{'If-None-Match': listing.headers['ETag']}))
+    assert response.status_code == 304
+
+    composition.description = 'Changed'
+    db.session.commit()
+    response = new_app.get(url, headers=dict(headers, **{'If-None-Match': etag}))
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    response = new_app.get('/api/v1/compositions/', headers=dict(headers, **{'If-None-Match': listing.headers['ETag']}))
+    assert response.status_code == 200
+
+    user_url = f'/api/v1/users/{artist.id}'
+    etag = new_app.get(user_url, headers=headers).headers['ETag']
+    assert new_app.get(user_url, headers=dict(headers, **{'If-None-Match': etag})).status_code == 304
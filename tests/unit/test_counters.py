@@ -0,0 +1,30 @@
+from app import db
+from app.models import User, Composition
+
+def test_stored_counters(new_app):
+    """Tests that follows and compositions keep the stored counts on users in step, leaving out
+    self follows, and that reconciling recounts them from the source tables.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    artist = User(username='lamb', email='lamb@example.com')
+    fan = User(username='scott', email='scott@example.com')
+    db.session.add_all([artist, fan])
+    db.session.commit()
+    assert (artist.followers_count, artist.following_count, artist.compositions_count) == (0, 0, 0)
+    fan.follow(artist)
+    db.session.add_all([Composition(release_type=1, title='Ragtime Nightingale', description='', artist=artist),
+                        Composition(release_type=1, title='American Beauty', description='', artist=artist)])
+    db.session.commit()
+    assert (artist.followers_count, artist.following_count, artist.compositions_count) == (1, 0, 2)
+    assert (fan.followers_count, fan.following_count, fan.compositions_count) == (0, 1, 0)
+    db.session.delete(artist.compositions.first())
+    fan.unfollow(artist)
+    db.session.commit()
+    assert (artist.followers_count, artist.compositions_count) == (0, 1)
+    assert fan.following_count == 0
+    User.query.update({'followers_count': 7, 'compositions_count': 7})
+    db.session.commit()
+    User.reconcile_counters()
+    assert (artist.followers_count, artist.following_count, artist.compositions_count) == (0, 0, 1)
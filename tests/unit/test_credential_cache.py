@@ -0,0 +1,72 @@
+from base64 import b64encode
+import time
+from app import db
+from app.api.credentials import credential_cache
+from app.models import User, Role
+
+def basic_auth(username, password):
+    return {'Authorization': 'Basic ' + b64encode(f'{username}:{password}'.encode('utf-8')).decode('utf-8')}
+
+def test_credential_cache(new_app):
+    """Tests that repeat API calls are authenticated from the cache with a single lookup, and that
+    changing the password drops the cached credentials, even when another process changed it.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    Role.insert_roles()
+    user = User(username='scott', email='scott@example.com', confirmed=True, password='cat')
+    db.session.add(user)
+    db.session.commit()
+    credential_cache.clear()
+    headers = basic_auth('scott@example.com', 'cat')
+    token = new_app.post('/api/v1/tokens/', headers=headers).get_json()['token']
+
+    statements = []
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    db.event.listen(db.engine, 'before_cursor_execute', count)
+    for credentials in (headers, basic_auth(token, '')):
+        assert new_app.get('/api/v1/', headers=credentials).status_code == 200
+        del statements[:]
+        assert new_app.get('/api/v1/', headers=credentials).status_code == 200
+        assert statements and all('password_hash' in statement for statement in statements)
+    db.event.remove(db.engine, 'before_cursor_execute', count)
+    assert credential_cache.hits >= 2
+    assert new_app.get('/api/v1/', headers=basic_auth('scott@example.com', 'dog')).status_code == 401
+
+    user = User.query.filter_by(username='scott').first()
+    user.password = 'dog'
+    db.session.commit()
+    assert new_app.get('/api/v1/', headers=headers).status_code == 401
+    new_headers = basic_auth('scott@example.com', 'dog')
+    assert new_app.get('/api/v1/', headers=new_headers).status_code == 200
+
+    # Another process changing the password, where this one's listeners don't see it
+    password_hash = User(password='cow').password_hash
+    db.session.execute(User.__table__.update().where(User.id == user.id).values(password_hash=password_hash))
+    db.session.commit()
+    assert new_app.get('/api/v1/', headers=new_headers).status_code == 401
+
+def test_credential_cache_forgets_dropped_entries(new_app):
+    """Tests that entries dropped to make room or because they expired no longer count towards
+    their user's keys.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    Role.insert_roles()
+    users = [User(id=100 + i, username=f'user{i}', email=f'user{i}@example.com', confirmed=True) for i in range(3)]
+    maxsize = credential_cache.maxsize
+    credential_cache.clear()
+    credential_cache.maxsize = 2
+    try:
+        for user in users:
+            credential_cache._set(f'token:{user.id}', user)
+        assert list(credential_cache._keys) == [101, 102]
+        credential_cache._set('token:expired', users[1], expires_at=time.time() - 1)
+        assert credential_cache._get('token:expired') is None
+        assert credential_cache._keys == {102: {'token:102'}}
+    finally:
+        credential_cache.maxsize = maxsize
+        credential_cache.clear()
@@ -0,0 +1,32 @@
+from unittest import mock
+from app import db, descriptions
+from app.models import Composition, User
+
+def test_description_renders_only_when_changed(new_app):
+    """Tests that setting an unchanged description skips the sanitizer, and that render_all()
+    re-renders rows whose HTML is out of date through a process pool.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    user = User(username='describer', email='describer@example.com')
+    compositions = [Composition(title=f'Piece {i}', description=f'See <b>http://example.com/{i}</b>',
+                                artist=user) for i in range(5)]
+    db.session.add_all(compositions)
+    db.session.commit()
+    assert compositions[0].description_html == \
+        'See <a href="http://example.com/0" rel="nofollow">http://example.com/0</a>'
+    with mock.patch('app.models.render') as render:
+        compositions[0].description = compositions[0].description
+        assert not render.called
+        compositions[0].description = 'Changed'
+        assert render.called
+    db.session.rollback()
+
+    # Rows rendered by an older sanitizer
+    db.session.execute(Composition.__table__.update().values(description_html='stale', description_hash=None))
+    db.session.commit()
+    assert descriptions.render_all(processes=2, chunk_size=2) == 5
+    db.session.expire_all()
+    assert all(c.description_html.startswith('See <a') for c in compositions)
+    assert descriptions.render_all(processes=1) == 0
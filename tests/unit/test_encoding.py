@@ -0,0 +1,49 @@
+import json
+from datetime import datetime, timedelta, timezone
+from flask import current_app, jsonify
+from app.encoding import JSONEncoding, json_encoding
+
+def test_libraries_agree(new_app, monkeypatch):
+    """Tests that every JSON library writes the same JSON, with ISO 8601 datetimes, and that a
+    library that isn't installed falls back to the standard library.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+        monkeypatch (fixture): pytest's monkeypatch, sets the library for this test only
+    """
+    app = current_app._get_current_object()
+    data = {'b': datetime(2021, 6, 1, 12, 30), 'a': [datetime(2021, 6, 1, 12, 30, 0, 250000)],
+            'aware': datetime(2021, 6, 1, 14, 30, tzinfo=timezone.utc),
+            'offset': datetime(2021, 6, 1, 14, 30, tzinfo=timezone(timedelta(hours=2))), 'text': 'Ragtime é'}
+    expected = {'a': ['2021-06-01T12:30:00.250000Z'], 'aware': '2021-06-01T14:30:00Z',
+                'b': '2021-06-01T12:30:00Z', 'offset': '2021-06-01T12:30:00Z', 'text': 'Ragtime é'}
+    for library in ('json', 'orjson', 'ujson', 'nosuchjson'):
+        monkeypatch.setitem(app.config, 'RAGTIME_JSON_LIBRARY', library)
+        encoding = JSONEncoding()
+        encoding.init_app(app)
+        if library == 'nosuchjson':
+            assert encoding.library == 'json'
+        assert json.loads(encoding.dumps(data)) == expected
+        assert list(json.loads(encoding.dumps(data))) == sorted(expected)
+    assert json.loads(jsonify(data).get_data()) == expected
+
+def test_list_response_streams(new_app, monkeypatch):
+    """Tests that long lists are streamed in chunks and decode to the same object as short ones
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+        monkeypatch (function): pytest's monkeypatch fixture
+    """
+    items = [{'id': i, 'at': datetime(2021, 6, 1)} for i in range(7)]
+    with current_app.test_request_context():
+        monkeypatch.setattr(json_encoding, 'chunk_size', 3)
+        streamed = json_encoding.list_response('items', items, dict, next=None, count=7)
+        assert streamed.is_streamed
+        chunks = list(streamed.response)
+        assert len(chunks) == 5
+        monkeypatch.setattr(json_encoding, 'chunk_size', 500)
+        whole = json_encoding.list_response('items', items, dict, next=None, count=7)
+        assert not whole.is_streamed
+        assert json.loads(''.join(chunks)) == json.loads(whole.get_data())
+        streamed = json_encoding.list_response('items', [], dict)
+        assert json.loads(streamed.get_data()) == {'items': []}
@@ -0,0 +1,43 @@
+import json
+from base64 import b64encode
+from datetime import datetime, timedelta
+from app import db
+from app.models import User, Role, Composition
+
+def test_export(new_app):
+    """Tests that exports stream every row as newline delimited JSON, oldest change first, and
+    that ?since= only sends rows changed since then.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    Role.insert_roles()
+    artist = User(username='joplin', email='joplin@example.com', confirmed=True, password='cat')
+    db.session.add(artist)
+    db.session.commit()
+    old = datetime.utcnow() - timedelta(days=2)
+    for i in range(5):
+        db.session.add(Composition(release_type=1, title=f'Rag {i}', description='Classic rag', artist=artist))
+    db.session.commit()
+    Composition.query.filter(Composition.title.in_(['Rag 0', 'Rag 1'])) \
+        .update({'updated_at': old}, synchronize_session=False)
+    db.session.commit()
+    new_app.application.config['RAGTIME_EXPORT_BATCH_SIZE'] = 2
+    headers = {'Authorization': 'Basic ' + b64encode(b'joplin@example.com:cat').decode('utf-8')}
+
+    response = new_app.get('/api/v1/export/compositions', headers=headers)
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(rows) == 5
+    assert {row['title'] for row in rows[:2]} == {'Rag 0', 'Rag 1'}
+    assert rows[0]['artist_url'] == f'/api/v1/users/{artist.id}'
+
+    since = (datetime.utcnow() - timedelta(days=1)).isoformat() + 'Z'
+    response = new_app.get(f'/api/v1/export/compositions?since={since}', headers=headers)
+    assert sorted(json.loads(line)['title'] for line in response.get_data(as_text=True).splitlines()) == \
+        ['Rag 2', 'Rag 3', 'Rag 4']
+    assert new_app.get('/api/v1/export/compositions?since=yesterday', headers=headers).status_code == 400
+
+    response = new_app.get('/api/v1/export/users', headers=headers)
+    users = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [(user['username'], user['composition count']) for user in users] == [('joplin', 5)]
@@ -0,0 +1,35 @@
+from datetime import datetime
+from app import fake
+from app.models import Composition, Follow, ReleaseType, Role, Timeline, User
+
+def test_fake_rows_are_deterministic():
+    """Tests that a chunk of fake data depends only on the seed and where the chunk starts
+    """
+    now = datetime(2026, 1, 1)
+    fake._init_worker(list(range(1, 101)))
+    assert fake._user_rows((7, 1, 10, 'hash', 1, now)) == fake._user_rows((7, 1, 10, 'hash', 1, now))
+    assert fake._user_rows((7, 1, 10, 'hash', 1, now)) != fake._user_rows((8, 1, 10, 'hash', 1, now))
+    assert fake._composition_rows((7, 1, 10, now)) == fake._composition_rows((7, 1, 10, now))
+    [(table, compositions)] = fake._composition_rows((7, 1, 50, now))
+    assert {c['release_type'] for c in compositions} <= {ReleaseType.SINGLE, ReleaseType.EXTENDED_PLAY, ReleaseType.ALBUM}
+    [(table, follows)] = fake._follow_rows((7, 1, list(range(1, 51)), 10, now))
+    assert all(f['follower_id'] != f['following_id'] for f in follows)
+    # The first tenth of users are followed more than the last half
+    assert sum(f['following_id'] <= 10 for f in follows) > sum(f['following_id'] > 50 for f in follows)
+
+def test_fake_seed(new_app):
+    """Tests that seeding with a process pool creates consistent users, follows and compositions.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    Role.insert_roles()
+    fake.seed(users=30, follows=5, compositions=60, processes=2, batch_size=7)
+    assert User.query.count() == 30
+    assert Composition.query.count() == 60
+    assert Follow.query.filter(Follow.follower_id == Follow.following_id).count() == 30
+    assert all(c.slug == Composition.make_slug(c.id, c.title) for c in Composition.query)
+    user = User.query.order_by(User.followers_count.desc()).first()
+    assert user.followers_count == user.followers.count() - 1
+    assert sum(u.compositions_count for u in User.query) == 60
+    assert Timeline.query.count() > 0
@@ -0,0 +1,53 @@
+from base64 import b64encode
+from flask import Flask, url_for, current_app
+from app import db
+from app.models import User, Role, Composition
+from app.urls import fast_url_for
+
+def test_fast_url_for(new_app):
+    """Tests that URLs built from templates match url_for()
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    with current_app.test_request_context('/', base_url='http://localhost/ragtime'):
+        for endpoint in ('api.get_user', 'api.get_composition', 'api.get_user_compositions'):
+            assert fast_url_for(endpoint, id=42) == url_for(endpoint, id=42)
+        assert fast_url_for('api.get_user', id=1) == '/ragtime/api/v1/users/1'
+    with current_app.app_context():
+        assert fast_url_for('api.get_user', id=1) == '/api/v1/users/1'
+
+    # url_for() picks between an endpoint's rules by their values
+    app = Flask(__name__)
+    app.add_url_rule('/rags/', 'rags', defaults={'page': 1})
+    app.add_url_rule('/rags/page/<int:page>', 'rags')
+    with app.test_request_context('/'):
+        for page in (1, 2):
+            assert fast_url_for('rags', page=page) == url_for('rags', page=page)
+
+def test_sparse_fieldsets(new_app):
+    """Tests that API GET requests only send the fields asked for, with an ETag for each set of fields
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    Role.insert_roles()
+    artist = User(username='lamb', email='lamb@example.com', confirmed=True, password='cat')
+    db.session.add(artist)
+    db.session.add_all([Composition(release_type=1, title=f'Rag {i}', description='Classic rag', artist=artist)
+                        for i in range(3)])
+    db.session.commit()
+    headers = {'Authorization': 'Basic ' + b64encode(b'lamb@example.com:cat').decode('utf-8')}
+
+    response = new_app.get(f'/api/v1/users/{artist.id}/compositions/?fields=title,url&count=1', headers=headers)
+    data = response.get_json()
+    assert [sorted(c) for c in data['compositions']] == [['title', 'url']] * 3
+    full = new_app.get(f'/api/v1/users/{artist.id}/compositions/?count=1', headers=headers)
+    assert response.headers['ETag'] != full.headers['ETag']
+    assert 'description' in full.get_json()['compositions'][0]
+
+    response = new_app.get(f'/api/v1/users/{artist.id}?fields=username', headers=headers)
+    assert response.get_json() == {'username': 'lamb'}
+    response = new_app.get(f'/api/v1/users/{artist.id}?fields=username,password', headers=headers)
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'Unknown fields: password.'
@@ -0,0 +1,52 @@
+from app import db
+from app.cache import fragment_cache
+from app.models import User, Composition
+
+def test_fragment_cache(new_app):
+    """Tests that rendered compositions are reused between page views and dropped when the
+    composition or its artist changes.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    artist = User(username='blake', email='blake@example.com')
+    composition = Composition(release_type=1, title='Charleston Rag', description='', artist=artist,
+                              slug='charleston-rag')
+    db.session.add_all([artist, composition])
+    db.session.commit()
+    fragment_cache.clear()
+    assert b'Charleston Rag' in new_app.get('/').data
+    assert len(fragment_cache._fragments) == 1
+    new_app.get('/')
+    assert len(fragment_cache._fragments) == 1
+
+    composition.title = 'Chevy Chase'
+    db.session.commit()
+    assert len(fragment_cache._fragments) == 0
+    assert b'Chevy Chase' in new_app.get('/').data
+
+    artist.username = 'eubie'
+    db.session.commit()
+    assert len(fragment_cache._fragments) == 0
+    assert b'eubie' in new_app.get('/').data
+
+def test_fragment_cache_forgets_evicted(new_app):
+    """Tests that compositions whose fragments were all evicted are no longer tracked for invalidation
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    maxsize = fragment_cache.maxsize
+    fragment_cache.clear()
+    fragment_cache.maxsize = 2
+    try:
+        for composition_id, artist_id in ((1, 10), (2, 10), (3, 20)):
+            fragment_cache.set((composition_id, None, 'user', 'hash', 'viewer'), artist_id, 'html')
+        assert set(fragment_cache._keys) == {2, 3}
+        assert fragment_cache._compositions == {10: {2}, 20: {3}}
+        fragment_cache.invalidate_composition(3)
+        assert fragment_cache._compositions == {10: {2}}
+        assert set(fragment_cache._keys) == {2}
+    finally:
+        fragment_cache.maxsize = maxsize
+        fragment_cache.clear()
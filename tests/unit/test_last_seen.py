@@ -0,0 +1,31 @@
+from datetime import datetime, timedelta
+from app import db
+from app.last_seen import last_seen_buffer
+from app.models import User
+
+def test_last_seen_write_behind(new_app):
+    """Tests that pings are buffered and coalesced, and written in one batch on flush.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    long_ago = datetime(2021, 11, 1)
+    users = [User(username=f'ping{i}', email=f'ping{i}@example.com', last_seen=long_ago) for i in range(3)]
+    db.session.add_all(users)
+    db.session.commit()
+    for user in users:
+        user.ping()
+        # Pings within the resolution are dropped
+        user.ping()
+    assert not db.session.dirty
+    assert len(last_seen_buffer._pending) == 3
+    statements = []
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(executemany)
+    db.event.listen(db.engine, 'before_cursor_execute', count)
+    last_seen_buffer.flush()
+    db.event.remove(db.engine, 'before_cursor_execute', count)
+    assert statements == [True]
+    db.session.expire_all()
+    for user in users:
+        assert datetime.utcnow() - user.last_seen < timedelta(minutes=1)
@@ -0,0 +1,158 @@
+import json
+import os
+import socketserver
+import threading
+import time
+from flask import current_app
+from flask_mail import Message
+from app import mail
+from app.email import mail_dispatcher
+
+class SMTPStandIn(socketserver.StreamRequestHandler):
+    """Just enough of an SMTP server to accept mail. Recipients starting with "bounce" are refused.
+    """
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 localhost')
+        while True:
+            line = self.rfile.readline().decode('ascii').strip()
+            command = line[:4].upper()
+            if not line or command == 'QUIT':
+                self.reply('221 bye')
+                return
+            if command == 'RCPT' and 'bounce' in line:
+                self.reply('550 no such user')
+            elif command == 'DATA':
+                self.reply('354 go ahead')
+                while self.rfile.readline() != b'.\r\n':
+                    pass
+                self.server.messages += 1
+                self.reply('250 ok')
+            else:
+                self.reply('250 ok')
+
+def start_smtp():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTPStandIn)
+    server.daemon_threads = True
+    server.connections = 0
+    server.messages = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def use_smtp(app, server, outbox, workers):
+    app.config.update(MAIL_SUPPRESS_SEND=False, MAIL_SERVER='127.0.0.1', MAIL_PORT=server.server_address[1],
+                      MAIL_USE_TLS=False, MAIL_USERNAME=None, MAIL_PASSWORD=None,
+                      RAGTIME_MAIL_OUTBOX=str(outbox), RAGTIME_MAIL_WORKERS=workers)
+    mail.init_app(app)
+    mail_dispatcher.init_app(app)
+
+def outbox_messages(outbox):
+    return [name for name in os.listdir(outbox) if name.endswith('.json')]
+
+def message(subject, to='user@example.com'):
+    return Message(subject, recipients=[to], sender='admin@example.com', body='Hi')
+
+def test_mail_batches_per_connection(new_app, tmp_path):
+    """Tests that queued mail goes out over a single SMTP connection and leaves the outbox empty.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+        tmp_path (Path): pytest's temporary directory, used as the outbox
+    """
+    server = start_smtp()
+    use_smtp(current_app._get_current_object(), server, tmp_path, workers=0)
+    paths = [mail_dispatcher._save(Message(f'Hello {i}', recipients=[f'user{i}@example.com'],
+                                           sender='admin@example.com', body='Hi'), attempts=0,
+                                   directory=mail_dispatcher._claimed())
+             for i in range(5)]
+    assert len(outbox_messages(mail_dispatcher._claimed())) == 5
+    mail_dispatcher._send_batch(paths)
+    assert server.messages == 5
+    assert server.connections == 1
+    assert outbox_messages(mail_dispatcher._claimed()) == []
+    server.shutdown()
+
+def test_mail_retries_and_survives_restart(new_app, tmp_path):
+    """Tests that refused mail stays in the outbox for a retry, and that workers started later
+    send whatever is waiting in the outbox.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+        tmp_path (Path): pytest's temporary directory, used as the outbox
+    """
+    server = start_smtp()
+    use_smtp(current_app._get_current_object(), server, tmp_path, workers=0)
+    mail_dispatcher.submit(Message('Hello', recipients=['bounce@example.com'],
+                                   sender='admin@example.com', body='Hi'))
+    [name] = outbox_messages(tmp_path)
+    with open(tmp_path / name) as f:
+        assert json.load(f)['attempts'] == 1
+    # Mail saved by a process that never got to send it
+    mail_dispatcher._save(Message('Welcome', recipients=['new@example.com'],
+                                  sender='admin@example.com', body='Hi'), attempts=0)
+    try:
+        # The workers start with the app
+        use_smtp(current_app._get_current_object(), server, tmp_path, workers=2)
+        deadline = time.time() + 5
+        while server.messages < 1 and time.time() < deadline:
+            time.sleep(0.05)
+        assert server.messages == 1
+    finally:
+        mail_dispatcher.stop()
+        server.shutdown()
+    assert not any(thread.name.startswith('mail-worker') for thread in threading.enumerate())
+
+def test_mail_claimed_by_one_process(new_app, tmp_path):
+    """Tests that a process only queues mail nobody else has claimed, takes over mail claimed by
+    processes that have exited, and doesn't queue mail it is waiting to retry a second time.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+        tmp_path (Path): pytest's temporary directory, used as the outbox
+    """
+    server = start_smtp()
+    use_smtp(current_app._get_current_object(), server, tmp_path, workers=0)
+    processing = tmp_path / 'processing'
+    # Claimed by a process that is still running, and by one that has exited
+    running = mail_dispatcher._save(message('Running'), 0, directory=str(processing / str(os.getppid())))
+    exited = mail_dispatcher._save(message('Exited'), 0, directory=str(processing / '999999999'))
+    unclaimed = mail_dispatcher._save(message('Unclaimed'), 0)
+    # Claimed by this process and waiting for its retry
+    waiting = mail_dispatcher._save(message('Waiting'), 1, directory=mail_dispatcher._claimed())
+
+    mail_dispatcher._recover()
+    queued = sorted(os.path.basename(path) for path in mail_dispatcher.queue.queue)
+    assert queued == sorted(os.path.basename(path) for path in (exited, unclaimed))
+    assert os.path.exists(running)
+    assert os.path.exists(waiting)
+    assert outbox_messages(tmp_path) == []
+    server.shutdown()
+
+
+def test_mail_retries_on_the_workers(new_app, tmp_path):
+    """Tests that failed mail waits for its retry on the workers' schedule, without a thread of its
+    own, and is queued again once it is due.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+        tmp_path (Path): pytest's temporary directory, used as the outbox
+    """
+    server = start_smtp()
+    use_smtp(current_app._get_current_object(), server, tmp_path, workers=0)
+    # As if there were workers, without starting them
+    mail_dispatcher.workers = 1
+    threads = threading.active_count()
+    path = mail_dispatcher._save(message('Hello'), 0, directory=mail_dispatcher._claimed())
+    mail_dispatcher._retry(path, mail_dispatcher._load(path))
+    assert threading.active_count() == threads
+    assert 0 < mail_dispatcher._queue_retries() <= 2
+    assert mail_dispatcher.queue.empty()
+    mail_dispatcher._retries[0] = (0, path)
+    assert mail_dispatcher._queue_retries() is None
+    assert list(mail_dispatcher.queue.queue) == [path]
+    assert mail_dispatcher._load(path)['attempts'] == 1
+    mail_dispatcher.workers = 0
+    server.shutdown()
@@ -0,0 +1,59 @@
+import json
+import os
+from flask import current_app
+from app.metrics import _labels, metrics
+
+def test_metrics_endpoint(new_app):
+    """Tests that requests are counted and timed per endpoint and exposed at /metrics.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    new_app.get('/')
+    new_app.get('/no-such-page')
+    response = new_app.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.data.decode('utf-8')
+    assert '# TYPE ragtime_http_request_duration_seconds histogram' in text
+    assert 'ragtime_http_requests_total{blueprint="main",endpoint="main.index",method="GET",status="200"} 1' in text
+    assert 'ragtime_http_requests_total{blueprint="",endpoint="unmatched",method="GET",status="404"} 1' in text
+    assert 'ragtime_http_request_duration_seconds_count{blueprint="main",endpoint="main.index"} 1' in text
+    assert 'ragtime_http_request_duration_seconds_bucket{blueprint="main",endpoint="main.index",le="+Inf"} 1' in text
+    # The scrape itself is in flight
+    assert 'ragtime_http_requests_in_flight 1' in text
+    assert 'ragtime_db_connect_seconds_count' in text
+    assert 'ragtime_db_connections_in_use' in text
+
+def test_metrics_add_up_across_processes(new_app, tmp_path, monkeypatch):
+    """Tests that /metrics adds up the metrics every worker process writes to the shared directory,
+    folding the counters of workers that have exited into dead.json but not their gauges.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+        tmp_path (Path): pytest's temporary directory, used as the shared metrics directory
+        monkeypatch (fixture): pytest's monkeypatch, sets the token and directory for this test only
+    """
+    monkeypatch.setitem(current_app.config, 'RAGTIME_METRICS_TOKEN', 'scraper')
+    monkeypatch.setattr(metrics, 'directory', str(tmp_path))
+    metrics._reset()
+    new_app.get('/')
+    # A worker that has since exited
+    labels = _labels(blueprint='main', endpoint='main.index', method='GET', status=200)
+    exited = {'counters': {'ragtime_http_requests_total': {labels: 4}},
+              'gauges': {'ragtime_http_requests_in_flight': {'': 3}},
+              'histograms': {}, 'buckets': list(metrics.buckets)}
+    with open(tmp_path / '999999999.json', 'w') as f:
+        json.dump(exited, f)
+    assert new_app.get('/metrics').status_code == 403
+    text = new_app.get('/metrics', headers={'Authorization': 'Bearer scraper'}).data.decode('utf-8')
+    assert f'ragtime_http_requests_total{{{labels}}} 5' in text
+    assert 'ragtime_http_requests_in_flight 1' in text
+    assert set(os.listdir(tmp_path)) == {'collect.lock', 'dead.json', metrics._file}
+    # This process got the pid of one that has exited, and mustn't overwrite its counters
+    with open(tmp_path / f'{os.getpid()}-0.json', 'w') as f:
+        json.dump(exited, f)
+    for i in range(2):
+        text = new_app.get('/metrics', headers={'Authorization': 'Bearer scraper'}).data.decode('utf-8')
+        assert f'ragtime_http_requests_total{{{labels}}} 9' in text
+    assert set(os.listdir(tmp_path)) == {'collect.lock', 'dead.json', metrics._file}
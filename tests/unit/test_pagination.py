@@ -0,0 +1,71 @@
+import base64
+import json
+from datetime import datetime, timedelta
+from app import db
+from app.models import User, Composition
+from app.pagination import paginate
+
+def test_cursor_pagination(new_app):
+    """Tests that walking forwards and backwards with cursors visits every composition once, in order,
+    including compositions that share a timestamp.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    artist = User(username='eubie', email='eubie@example.com')
+    db.session.add(artist)
+    start = datetime(2021, 11, 1)
+    for i in range(25):
+        # Pairs of compositions share a timestamp so the id has to break ties
+        db.session.add(Composition(release_type=1, title=f'Rag {i}', description='', artist=artist,
+                                   timestamp=start + timedelta(days=i // 2)))
+    db.session.commit()
+    order_by = (Composition.timestamp, Composition.id)
+    expected = Composition.query.order_by(Composition.timestamp.desc(), Composition.id.desc()).all()
+
+    pages = [paginate(Composition.query, order_by, per_page=10, count=True)]
+    assert pages[0].total == 25
+    assert not pages[0].has_prev
+    while pages[-1].has_next:
+        pages.append(paginate(Composition.query, order_by, pages[-1].next_cursor, per_page=10))
+    assert [len(p.items) for p in pages] == [10, 10, 5]
+    assert [c for p in pages for c in p.items] == expected
+    assert pages[-1].total is None
+
+    # Going back from the last page returns the same middle page
+    back = paginate(Composition.query, order_by, pages[-1].prev_cursor, per_page=10)
+    assert back.items == pages[1].items
+    assert back.has_prev and back.has_next
+    first = paginate(Composition.query, order_by, back.prev_cursor, per_page=10)
+    assert first.items == pages[0].items
+    assert not first.has_prev
+
+def test_api_cursor_links(new_app):
+    """Tests that the API's next link comes from the cursor and that the total is opt-in.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    artist = User.query.filter_by(username='eubie').first()
+    artist.confirmed = True
+    artist.password = 'cat'
+    db.session.commit()
+    from base64 import b64encode
+    headers = {'Authorization': 'Basic ' + b64encode(b'eubie@example.com:cat').decode('utf-8')}
+    response = new_app.get(f'/api/v1/users/{artist.id}/compositions/', headers=headers)
+    data = response.get_json()
+    assert len(data['compositions']) == 20
+    assert data['count'] is None
+    assert data['prev'] is None
+    response = new_app.get(data['next'] + '&count=1', headers=headers)
+    data = response.get_json()
+    assert len(data['compositions']) == 5
+    assert data['count'] == 25
+    assert data['next'] is None
+    assert new_app.get('/api/v1/compositions/?cursor=garbage', headers=headers).status_code == 400
+    # Cursors whose values aren't of their columns' types
+    for values in ([{}, 1], ['2021-11-01T00:00:00', {}], ['2021-11-01T00:00:00', '1'],
+                   ['2021-11-01T00:00:00', True], [1, 1], {'a': 1, 'b': 2}):
+        payload = json.dumps({'k': values, 'd': 'next'}).encode('utf-8')
+        cursor = base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+        assert new_app.get(f'/api/v1/compositions/?cursor={cursor}', headers=headers).status_code == 400
@@ -0,0 +1,70 @@
+import cProfile
+from base64 import b64encode
+from app import db
+from app.models import Role, User
+from app.profiler import profiler
+
+def test_admin_request_profiling(new_app, tmp_path, monkeypatch):
+    """Tests that administrators can profile a request and browse the profile from /admin,
+    and that nobody else can.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+        tmp_path (Path): pytest's temporary directory, used to store profiles
+        monkeypatch (function): pytest's monkeypatch fixture
+    """
+    monkeypatch.setattr(profiler, 'directory', str(tmp_path))
+    Role.insert_roles()
+    admin = User(username='profiler', email='profiler@example.com', confirmed=True,
+                 role=Role.query.filter_by(name='Administrator').first())
+    db.session.add(admin)
+    db.session.commit()
+
+    response = new_app.get('/?_profile=1')
+    assert 'X-Profile-Id' not in response.headers
+    assert profiler.profiles() == []
+
+    with new_app.session_transaction() as session:
+        session['_user_id'] = str(admin.id)
+        session['_fresh'] = True
+    response = new_app.get('/', headers={'X-Profile': '1'})
+    name = response.headers['X-Profile-Id']
+    [profile] = profiler.profiles()
+    assert profile['name'] == name
+    assert profile['endpoint'] == 'main.index'
+
+    response = new_app.get('/admin')
+    assert name.encode('utf-8') in response.data
+    response = new_app.get(f'/admin/profiles/{name}?sort=tottime')
+    assert response.status_code == 200
+    assert b'index' in response.data
+    assert new_app.get('/admin/profiles/..%2Fconfig.py').status_code == 404
+
+def test_api_profiling_needs_authentication(new_app, tmp_path, monkeypatch):
+    """Tests that API requests are only profiled for authenticated administrators
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+        tmp_path (Path): pytest's temporary directory, used to store profiles
+        monkeypatch (function): pytest's monkeypatch fixture
+    """
+    monkeypatch.setattr(profiler, 'directory', str(tmp_path))
+    Role.insert_roles()
+    admin = User(username='apiprofiler', email='apiprofiler@example.com', confirmed=True, password='cat',
+                 role=Role.query.filter_by(name='Administrator').first())
+    db.session.add(admin)
+    db.session.commit()
+    started = []
+    original = cProfile.Profile.enable
+    def enable(profile):
+        started.append(profile)
+        original(profile)
+    monkeypatch.setattr(cProfile.Profile, 'enable', enable)
+    assert new_app.get('/api/v1/', headers={'X-Profile': '1'}).status_code == 401
+    assert started == []
+    headers = {'X-Profile': '1',
+               'Authorization': 'Basic ' + b64encode(b'apiprofiler@example.com:cat').decode('utf-8')}
+    response = new_app.get('/api/v1/', headers=headers)
+    assert response.status_code == 200
+    assert len(started) == 1
+    assert response.headers['X-Profile-Id'].endswith('ms.prof')
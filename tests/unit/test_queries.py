@@ -0,0 +1,54 @@
+from base64 import b64encode
+from contextlib import contextmanager
+from app import db
+from app.models import User, Composition
+
+# Queries allowed to render one page of compositions, however many artists are on it
+INDEX_QUERY_BUDGET = 1
+API_QUERY_BUDGET = 2
+
+@contextmanager
+def count_queries():
+    """Counts the SQL statements sent to the database inside the with block
+    """
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    engine = db.get_engine()
+    db.event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        db.event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+def test_composition_list_query_budget(new_app):
+    """Tests that a full page of compositions by 20 different artists renders within a fixed query
+    budget, both as the HTML index page and through the API.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    for i in range(20):
+        artist = User(username=f'artist{i}', email=f'artist{i}@example.com', confirmed=True)
+        db.session.add(artist)
+        db.session.add(Composition(release_type=1, title=f'Rag {i}', description='', artist=artist,
+                                   slug=f'rag-{i}'))
+    artist.password = 'cat'
+    db.session.commit()
+    db.session.remove()
+
+    with count_queries() as statements:
+        response = new_app.get('/')
+    assert response.status_code == 200
+    assert response.data.count(b'class = "composition"') == 20
+    assert len(statements) <= INDEX_QUERY_BUDGET
+    db.session.remove()
+
+    headers = {'Authorization': 'Basic ' + b64encode(b'artist19@example.com:cat').decode('utf-8')}
+    with count_queries() as statements:
+        response = new_app.get('/api/v1/compositions/', headers=headers)
+    assert response.status_code == 200
+    assert len(response.get_json()['compositions']) == 20
+    assert len(statements) <= API_QUERY_BUDGET
+    # The API links to artists by id, so it doesn't load them
+    assert 'users' not in statements[-1]
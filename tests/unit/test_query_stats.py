@@ -0,0 +1,53 @@
+import json
+import logging
+from flask import current_app
+from app import db
+from app.models import Role, User
+from app.query_stats import fingerprint, normalize, query_stats
+
+def test_fingerprints_ignore_values():
+    """Tests that statements differing only in their values share a fingerprint
+    """
+    a = normalize("SELECT * FROM users WHERE id = 1 AND name = 'a''b' AND role_id IN (1, 2, 3)")
+    b = normalize("SELECT *  FROM users\n WHERE id = 22 AND name = 'c' AND role_id IN (4, 5)")
+    assert a == b == 'SELECT * FROM users WHERE id = ? AND name = ? AND role_id IN (?, ...)'
+    assert fingerprint(a) == fingerprint(b)
+
+def test_request_query_headers_and_slow_log(new_app, caplog):
+    """Tests that responses carry their query count and time, that slow statements are logged
+    as JSON, and that administrators can see the totals per fingerprint.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+        caplog (fixture): pytest's log capture
+    """
+    Role.insert_roles()
+    admin = User(username='querier', email='querier@example.com', confirmed=True,
+                 role=Role.query.filter_by(name='Administrator').first())
+    db.session.add(admin)
+    db.session.commit()
+    query_stats.reset()
+    slow_ms = query_stats.slow_ms
+    query_stats.slow_ms = 0
+    try:
+        # Logged at the logger's own level, whatever the root logger's is
+        response = new_app.get('/user/querier')
+    finally:
+        query_stats.slow_ms = slow_ms
+    assert response.status_code == 200
+    count = int(response.headers['X-DB-Query-Count'])
+    assert count >= 1
+    assert float(response.headers['X-DB-Time-Ms']) >= 0
+    entries = [json.loads(record.message) for record in caplog.records if record.name == query_stats.logger.name]
+    assert len(entries) == count
+    assert entries[0]['endpoint'] == 'main.user'
+    # Without RAGTIME_SLOW_QUERY_LOG, the entries go to the app's log
+    assert query_stats.logger.parent is current_app.logger
+    assert query_stats.logger.propagate
+
+    with new_app.session_transaction() as session:
+        session['_user_id'] = str(admin.id)
+        session['_fresh'] = True
+    response = new_app.get('/admin/queries')
+    assert response.status_code == 200
+    assert entries[0]['fingerprint'].encode('utf-8') in response.data
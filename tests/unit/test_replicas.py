@@ -0,0 +1,105 @@
+import time
+import pytest
+from flask import g
+from app import db, create_app
+from app.models import User
+from app.routing import _primary_until
+from config import TestingConfig
+
+@pytest.fixture
+def replica_app(tmp_path, monkeypatch):
+    """Creates an app whose primary and replica are two separate SQLite files, so the replica
+    only has what is written to it directly, like a replica that hasn't caught up yet.
+
+    Args:
+        tmp_path (Path): pytest's temporary directory
+        monkeypatch (function): pytest's monkeypatch fixture
+    """
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{tmp_path / "primary.sqlite"}')
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_REPLICA_URIS', [f'sqlite:///{tmp_path / "replica.sqlite"}'])
+    app = create_app('testing')
+    context = app.app_context()
+    context.push()
+    db.create_all()
+    db.Model.metadata.create_all(bind=db.get_engine(app, bind='replica_0'))
+    db.session.add(User(email='alice@example.com', username='alice', password='cat'))
+    db.session.commit()
+
+    yield app
+
+    db.session.remove()
+    db.drop_all()
+    context.pop()
+
+def test_reads_go_to_replica(replica_app):
+    """Tests that GET requests read from the replica and other requests from the primary
+    """
+    client = replica_app.test_client()
+    assert client.get('/user/alice').status_code == 404
+    with replica_app.test_request_context('/user/alice', method='POST'):
+        replica_app.preprocess_request()
+        assert User.query.filter_by(username='alice').first() is not None
+
+def test_read_your_writes(replica_app):
+    """Tests that a request that writes reads from the primary afterwards, and that the same
+    browser keeps reading from the primary for a while
+    """
+    with replica_app.test_request_context('/', method='GET'):
+        replica_app.preprocess_request()
+        assert User.query.filter_by(username='bob').first() is None
+        db.session.add(User(email='bob@example.com', username='bob', password='dog'))
+        db.session.commit()
+        assert User.query.filter_by(username='bob').first() is not None
+        response = replica_app.process_response(replica_app.response_class())
+        assert 'session=' in response.headers['Set-Cookie']
+    db.session.remove()
+
+    client = replica_app.test_client()
+    with client.session_transaction() as session:
+        session['db_primary_until'] = time.time() + 10
+    assert client.get('/user/alice').status_code == 200
+    with client.session_transaction() as session:
+        session['db_primary_until'] = time.time() - 1
+    assert client.get('/user/alice').status_code == 404
+
+def test_read_your_writes_without_cookie(replica_app):
+    """Tests that a client that doesn't keep cookies, like an API client, reads from the primary
+    while it sends back the header of the response that wrote, and only for a limited time
+    """
+    with replica_app.test_request_context('/', method='GET'):
+        replica_app.preprocess_request()
+        db.session.add(User(email='carol@example.com', username='carol', password='cat'))
+        db.session.commit()
+        response = replica_app.process_response(replica_app.response_class())
+    db.session.remove()
+    until = response.headers['X-DB-Primary-Until']
+    assert float(until) > time.time()
+
+    client = replica_app.test_client(use_cookies=False)
+    assert client.get('/user/carol', headers={'X-DB-Primary-Until': until}).status_code == 200
+    assert client.get('/user/carol').status_code == 404
+    assert client.get('/user/carol', headers={'X-DB-Primary-Until': 'soon'}).status_code == 404
+    # However far ahead a client asks for, it gets no more than a write would have
+    with replica_app.test_request_context('/', headers={'X-DB-Primary-Until': '1e12'}):
+        assert _primary_until() <= time.time() + replica_app.config['RAGTIME_PRIMARY_STICKY_SECONDS']
+
+def test_dispose_engines(replica_app):
+    """Tests that disposing closes the replicas' pooled connections as well as the primary's
+    """
+    engines = [db.get_engine(replica_app), db.get_engine(replica_app, bind='replica_0')]
+    pools = [engine.pool for engine in engines]
+    db.dispose_engines(replica_app)
+    assert all(engine.pool is not pool for engine, pool in zip(engines, pools))
+
+def test_views_that_write_on_get_use_primary(replica_app):
+    """Tests that GET requests to views that write read from the primary
+    """
+    with replica_app.test_request_context('/follow/alice', method='GET'):
+        replica_app.preprocess_request()
+        assert g.db_replica is None
+        assert User.query.filter_by(username='alice').first() is not None
+    db.session.remove()
+    with replica_app.test_request_context('/user/alice', method='GET'):
+        replica_app.preprocess_request()
+        assert g.db_replica == 'replica_0'
+    db.session.remove()
@@ -0,0 +1,43 @@
+from app import db
+from app.feeds import search_compositions
+from app.models import User, Composition
+
+def test_search(new_app):
+    """Tests that the search index follows compositions as they are created, edited and deleted,
+    that title matches rank first, and that results page with cursors.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    artist = User(username='joplin', email='joplin@example.com')
+    maple = Composition(release_type=1, title='Maple Leaf Rag', description='A rag named after a club',
+                        artist=artist)
+    club = Composition(release_type=1, title='Solace', description='Not a rag, a Mexican serenade',
+                       artist=artist)
+    db.session.add_all([artist, maple, club])
+    db.session.commit()
+    assert search_compositions('rag').items == [maple, club]
+    assert search_compositions('serenade').items == [club]
+    assert search_compositions('"; DROP').items == []
+    assert search_compositions('   ').items == []
+    assert search_compositions('mapl').items == [maple]
+
+    club.description = 'A Mexican serenade'
+    db.session.commit()
+    assert search_compositions('rag').items == [maple]
+    maple.title = 'Original Rags'
+    db.session.commit()
+    assert search_compositions('maple').items == []
+    db.session.delete(maple)
+    db.session.commit()
+    assert search_compositions('rags').items == []
+
+    for i in range(25):
+        db.session.add(Composition(release_type=1, title=f'Stomp {i}', description='', artist=artist))
+    db.session.commit()
+    first = search_compositions('stomp', count=True)
+    assert first.total == 25
+    second = search_compositions('stomp', first.next_cursor)
+    assert len(first.items) == 20 and len(second.items) == 5
+    assert not set(first.items) & set(second.items)
+    assert search_compositions('stomp', second.prev_cursor).items == first.items
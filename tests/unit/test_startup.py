@@ -0,0 +1,24 @@
+from flask import current_app
+from app.startup import parse_importtime, warm_up
+
+def test_warm_up(new_app):
+    """Tests that warming up compiles every template and leaves no database connections open.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    app = current_app._get_current_object()
+    timings = warm_up(app)
+    assert set(timings) == {'templates', 'roles', 'url_map'}
+    assert len(app.jinja_env.cache) >= len(app.jinja_env.list_templates(extensions=['html', 'txt']))
+
+def test_parse_importtime():
+    """Tests reading package import times from `python -X importtime` output
+    """
+    output = '\n'.join([
+        'import time: self [us] | cumulative | imported package',
+        'import time:       120 |        120 |     flask.json',
+        'import time:      3000 |       5000 |   flask',
+        'import time:       200 |       9000 | app',
+    ])
+    assert parse_importtime(output) == [('app', 0.009), ('flask', 0.005)]
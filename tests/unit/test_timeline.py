@@ -0,0 +1,58 @@
+from app import db
+from app.models import User, Composition, Timeline
+
+
+def make_composition(artist, title):
+    """Creates a composition the way the views do, fanning it out to followers' timelines
+    """
+    c = Composition(release_type=1, title=title, description='', artist=artist)
+    db.session.add(c)
+    db.session.commit()
+    Timeline.fan_out(c)
+    c.generate_slug()
+    return c
+
+def test_timeline_follow_and_unfollow(new_app):
+    """Tests that compositions are fanned out to followers and removed again on unfollow.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    artist = User(username='scott', email='scott@example.com')
+    fan = User(username='joplin', email='joplin@example.com')
+    db.session.add_all([artist, fan])
+    db.session.commit()
+    first = make_composition(artist, 'Maple Leaf Rag')
+    # Following copies existing compositions into the timeline
+    fan.follow(artist)
+    db.session.commit()
+    assert fan.followed_compositions.all() == [first]
+    # New compositions are fanned out to both the artist and the follower
+    second = make_composition(artist, 'The Entertainer')
+    ordered = fan.followed_compositions.order_by(Timeline.timestamp.desc()).all()
+    assert ordered == [second, first]
+    assert artist.followed_compositions.count() == 2
+    fan.unfollow(artist)
+    db.session.commit()
+    assert fan.followed_compositions.count() == 0
+    assert artist.followed_compositions.count() == 2
+
+def test_timeline_delete_and_rebuild(new_app):
+    """Tests that deleted compositions leave every timeline and that rebuilding matches the follows table.
+
+    Args:
+        new_app (function): creates an app to test this function with database. See: conftest.py
+    """
+    artist = User.query.filter_by(username='scott').first()
+    fan = User.query.filter_by(username='joplin').first()
+    fan.follow(artist)
+    db.session.commit()
+    assert fan.followed_compositions.count() == 2
+    db.session.delete(artist.compositions.first())
+    db.session.commit()
+    assert fan.followed_compositions.count() == 1
+    Timeline.query.delete()
+    db.session.commit()
+    Timeline.rebuild()
+    assert fan.followed_compositions.count() == 1
+    assert artist.followed_compositions.count() == 1